@@ -0,0 +1,91 @@
+"""Compare the leveling activity window with the deque scan it replaced.
+
+Each scenario replays a channel at a steady message rate, for the given number of authors, through the per-message
+work of ``Leveling._track_message``: add the message, expire the old ones, count the unique authors and find the
+authors active in the last half of the window. A bulk delete of a tenth of the window is timed separately.
+
+Run with ``python benchmarks/bench_activity_window.py``.
+"""
+
+import datetime
+import random
+import time
+from collections import deque
+
+from charbot.activity import ActivityWindow
+
+
+INTERVAL = datetime.timedelta(seconds=600)
+START = datetime.datetime(2024, 1, 1, tzinfo=datetime.UTC)
+# (authors, messages per minute)
+SCENARIOS = [(3, 2), (10, 10), (25, 40), (60, 120)]
+
+
+def make_messages(authors: int, per_minute: int, count: int) -> list[tuple[datetime.datetime, int]]:
+    step = datetime.timedelta(seconds=60 / per_minute)
+    return [(START + step * index, random.randrange(authors)) for index in range(count)]
+
+
+def run_deque(messages: list[tuple[datetime.datetime, int]]) -> float:
+    bucket: deque[tuple[datetime.datetime, int]] = deque()
+    began = time.perf_counter()
+    for created_at, author in messages:
+        bucket.append((created_at, author))
+        oldest_allowed = created_at - INTERVAL
+        while bucket and bucket[0][0] < oldest_allowed:
+            bucket.popleft()
+        oldest_allowed = created_at - INTERVAL / 2
+        unique_accounts = {user for _, user in bucket}
+        if len(unique_accounts) >= 2:
+            [user for user in unique_accounts if max(ts for ts, usr in bucket if usr == user) >= oldest_allowed]
+    return time.perf_counter() - began
+
+
+def run_window(messages: list[tuple[datetime.datetime, int]]) -> float:
+    window = ActivityWindow()
+    began = time.perf_counter()
+    for created_at, author in messages:
+        window.add(created_at, author)
+        window.expire(created_at - INTERVAL)
+        if len(window) >= 2:
+            window.active_since(created_at - INTERVAL / 2)
+    return time.perf_counter() - began
+
+
+def bulk_delete(messages: list[tuple[datetime.datetime, int]], window_size: int) -> tuple[float, float]:
+    recent = messages[-window_size:]
+    deleted = random.sample(recent, max(1, window_size // 10))
+
+    bucket = deque(recent)
+    began = time.perf_counter()
+    to_remove = set(deleted)
+    bucket = deque(entry for entry in bucket if entry not in to_remove)
+    deque_time = time.perf_counter() - began
+
+    window = ActivityWindow()
+    for created_at, author in recent:
+        window.add(created_at, author)
+    began = time.perf_counter()
+    for created_at, author in deleted:
+        window.remove(created_at, author)
+    return deque_time, time.perf_counter() - began
+
+
+def main():
+    random.seed(0)
+    print("authors | msgs/min | window size | deque us/msg | window us/msg | speedup | bulk delete deque/window us")
+    for authors, per_minute in SCENARIOS:
+        window_size = per_minute * 10
+        messages = make_messages(authors, per_minute, window_size * 4)
+        deque_time = run_deque(messages)
+        window_time = run_window(messages)
+        bulk_deque, bulk_window = bulk_delete(messages, window_size)
+        print(
+            f"{authors:7} | {per_minute:8} | {window_size:11} | "
+            f"{deque_time / len(messages) * 1e6:12.2f} | {window_time / len(messages) * 1e6:13.2f} | "
+            f"{deque_time / window_time:6.1f}x | {bulk_deque * 1e6:.1f}/{bulk_window * 1e6:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
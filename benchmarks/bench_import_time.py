@@ -0,0 +1,71 @@
+"""Measure the import time of charbot and each of its extensions, with ``python -X importtime``.
+
+Every extension is imported in a fresh interpreter after ``charbot`` itself, like a cold start, so each one is only
+charged for what it adds. The fastest of ``--repeat`` runs is kept for each module.
+
+Run with ``python benchmarks/bench_import_time.py``. Save a baseline with ``--save baseline.json``, and compare against
+it with ``--baseline baseline.json``, which exits with status 1 if a module got slower than the tolerance allows.
+"""
+
+import argparse
+import json
+import pathlib
+import subprocess
+import sys
+
+from charbot import EXTENSIONS
+
+
+def import_time(module: str) -> dict[str, int]:
+    """Get the cumulative import time, in microseconds, of every module imported by importing ``module``."""
+    code = f"import charbot; import {module}" if module != "charbot" else "import charbot"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, check=True
+    )
+    times: dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def measure(repeat: int) -> dict[str, float]:
+    """Get the import time of charbot and each extension, in milliseconds."""
+    results: dict[str, float] = {}
+    for module in ("charbot", *EXTENSIONS):
+        runs = [import_time(module).get(module, 0) for _ in range(repeat)]
+        results[module] = min(runs) / 1000
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the import time of charbot and its extensions.")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per module, the fastest is kept")
+    parser.add_argument("--save", type=pathlib.Path, help="write the results to this JSON file")
+    parser.add_argument("--baseline", type=pathlib.Path, help="compare against the results in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="allowed slowdown factor against the baseline")
+    parser.add_argument("--slack", type=float, default=5.0, help="allowed slowdown in ms, for noisy small modules")
+    args = parser.parse_args()
+
+    results = measure(args.repeat)
+    baseline: dict[str, float] = json.loads(args.baseline.read_text()) if args.baseline else {}
+    regressions = []
+    print(f"{'module':<28} | {'ms':>8} | {'baseline':>8}")
+    for module, took in sorted(results.items(), key=lambda item: item[1], reverse=True):
+        before = baseline.get(module)
+        flag = ""
+        if before is not None and took > before * args.tolerance + args.slack:
+            regressions.append(module)
+            flag = "  REGRESSION"
+        print(f"{module:<28} | {took:8.1f} | {'-' if before is None else f'{before:.1f}':>8}{flag}")
+    if args.save:
+        args.save.write_text(json.dumps(results, indent=2, sort_keys=True))
+    if regressions:
+        print(f"Import time regressed for: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Benchmark the per-message latency of ``Leveling.proc_xp`` against a slow Discord HTTP layer.
+
+The database is an in memory fake with a fixed latency per query, and every Discord request (editing roles, sending
+messages) sleeps for the given HTTP delay. Messages from several channels are dispatched concurrently, like the
+gateway does, and the time until ``proc_xp`` returns is recorded for each of them.
+
+Run with ``python benchmarks/bench_proc_xp.py``.
+"""
+
+import argparse
+import asyncio
+import datetime
+import random
+import statistics
+import time
+from types import SimpleNamespace
+from typing import Any, cast
+
+import discord
+
+from charbot import CBot, levels
+
+
+class FakeConnection:
+    """Connection that answers the queries used by ``proc_xp`` from a dict, counting the round trips."""
+
+    def __init__(self, xp: dict[int, int], latency: float):
+        self.xp = xp
+        self.latency = latency
+        self.queries = 0
+
+    def transaction(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        await asyncio.sleep(self.latency)
+
+    async def execute(self, query: str):
+        await asyncio.sleep(self.latency)
+        self.queries += 1
+
+    async def copy_records_to_table(self, table: str, *, records, columns):
+        await asyncio.sleep(self.latency)
+        self.queries += 1
+
+    async def fetch(self, query: str, *args):
+        await asyncio.sleep(self.latency)
+        self.queries += 1
+        if query.startswith("SELECT"):
+            return [{"id": user, "xp": self.xp[user]} for user in args[0] if user in self.xp]
+        users, xp_to_add, cap, _ = args
+        for user, xp in zip(users, xp_to_add, strict=True):
+            self.xp[user] = min(cap, self.xp.get(user, 0) + xp)
+        return [{"id": user, "xp": self.xp[user]} for user in users]
+
+
+class FakePool:
+    """Pool with a single shared fake connection, tracking how long connections are held."""
+
+    def __init__(self, latency: float):
+        self.xp: dict[int, int] = {}
+        self.conn = FakeConnection(self.xp, latency)
+        self.held = 0.0
+
+    def acquire(self):
+        return self
+
+    async def fetch(self, query: str):
+        return [{"guild": 1, "channels": [], "roles": []}]
+
+    async def __aenter__(self):
+        self._start = time.perf_counter()
+        return self.conn
+
+    async def __aexit__(self, *_):
+        self.held += time.perf_counter() - self._start
+
+
+async def slow(delay: float):
+    await asyncio.sleep(delay)
+
+
+def make_member(user: int, http_delay: float):
+    return SimpleNamespace(
+        id=user,
+        roles=[],
+        mention=f"<@{user}>",
+        guild=SimpleNamespace(get_member=lambda _: None),
+        edit=lambda *_, **__: slow(http_delay),
+    )
+
+
+async def run(http_delay: float, db_latency: float, channels: int, users: int, messages: int, spacing: float):
+    random.seed(0)
+    pool = FakePool(db_latency)
+    bot = SimpleNamespace(holder={}, pool=pool)
+    cog = levels.Leveling(cast("CBot", bot))
+    await cog.cog_load()
+
+    members = {user: make_member(user, http_delay) for user in range(users)}
+    # Start everyone just below a level so a good share of the awards are level ups
+    pool.xp.update({user: random.randrange(levels.XP_PER_LEVEL - 3, levels.XP_PER_LEVEL) for user in members})
+    guild = SimpleNamespace(id=1, get_member=members.get, fetch_member=None)
+    text_channels = [
+        SimpleNamespace(id=100 + channel, send=lambda *_, **__: slow(http_delay)) for channel in range(channels)
+    ]
+    start = datetime.datetime.now(datetime.UTC)
+    latencies: list[float] = []
+
+    async def dispatch(index: int):
+        message: Any = SimpleNamespace(
+            author=SimpleNamespace(id=random.randrange(users), bot=False),
+            guild=guild,
+            channel=text_channels[index % channels],
+            created_at=start + datetime.timedelta(seconds=30 * index),
+            is_system=lambda: False,
+        )
+        began = time.perf_counter()
+        await cog.proc_xp(cast("discord.Message", message))
+        latencies.append(time.perf_counter() - began)
+
+    began = time.perf_counter()
+    tasks: list[asyncio.Task[None]] = []
+    for index in range(messages):
+        tasks.append(asyncio.create_task(dispatch(index)))
+        await asyncio.sleep(spacing)
+    await asyncio.gather(*tasks)
+    wall = time.perf_counter() - began
+    await cog.cog_unload()
+
+    latencies.sort()
+    print(
+        f"http delay {http_delay * 1000:6.1f}ms | "
+        f"p50 {statistics.median(latencies) * 1000:8.2f}ms | "
+        f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:8.2f}ms | "
+        f"max {latencies[-1] * 1000:8.2f}ms | "
+        f"queries/message {pool.conn.queries / messages:4.2f} | "
+        f"connection held {pool.held:6.2f}s | wall {wall:6.2f}s"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark the per-message latency of Leveling.proc_xp.")
+    parser.add_argument("--http-delays", type=float, nargs="+", default=[0.0, 0.25])
+    parser.add_argument("--db-latency", type=float, default=0.001)
+    parser.add_argument("--channels", type=int, default=8)
+    parser.add_argument("--users", type=int, default=12)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--spacing", type=float, default=0.04, help="Seconds between dispatched messages")
+    args = parser.parse_args()
+    for http_delay in args.http_delays:
+        await run(http_delay, args.db_latency, args.channels, args.users, args.messages, args.spacing)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,36 @@
+"""Compare the cached reset clock with the ``CBot.TIME`` implementation it replaced.
+
+Run with ``python benchmarks/bench_reset_clock.py``.
+"""
+
+import datetime
+import timeit
+from zoneinfo import ZoneInfo
+
+from charbot.clock import ResetClock
+
+
+ZONE = ZoneInfo("America/Detroit")
+CALLS = 200_000
+
+
+def old_time() -> datetime.datetime:
+    return (
+        datetime.datetime.now(ZONE).replace(microsecond=0, second=0, minute=0, hour=9)
+        if datetime.datetime.now(ZONE).replace(microsecond=0, second=0, minute=0, hour=9) <= datetime.datetime.now(ZONE)
+        else datetime.datetime.now(ZONE).replace(microsecond=0, second=0, minute=0, hour=9) - datetime.timedelta(days=1)
+    )
+
+
+def main():
+    clock = ResetClock(ZONE)
+    assert clock() == old_time()  # skipcq: BAN-B101
+    old = min(timeit.repeat(old_time, number=CALLS, repeat=5)) / CALLS
+    new = min(timeit.repeat(clock, number=CALLS, repeat=5)) / CALLS
+    print(f"CBot.TIME (old): {old * 1e9:8.0f} ns/call")
+    print(f"ResetClock:      {new * 1e9:8.0f} ns/call")
+    print(f"speedup:         {old / new:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
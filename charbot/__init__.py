@@ -1,12 +1,17 @@
 """Charbot Module."""
 
-import functools as _functools
 import logging
 import os as _os
 import pathlib as _pathlib
+import time as _time
+from collections.abc import Mapping as _Mapping
 from importlib import metadata as _metadata
 from pkgutil import iter_modules
+from types import MappingProxyType as _MappingProxyType
 from typing import Any
+from typing import NamedTuple as _NamedTuple
+from typing import NotRequired as _NotRequired
+from typing import TypedDict as _TypedDict
 
 
 __title__ = "charbot"
@@ -23,12 +28,102 @@ __all__ = (
 )
 __blacklist__ = [
     f"{__package__}.{item}"
-    for item in ("__main__", "bot", "betas", "card", "constants", "errors", "types", "xcom_helpers", "xcfp")
+    for item in (
+        "__main__",
+        "activity",
+        "backup",
+        "bot",
+        "betas",
+        "bus",
+        "card",
+        "clock",
+        "constants",
+        "db",
+        "errors",
+        "leaderboard",
+        "migrate",
+        "points",
+        "queries",
+        "state",
+        "types",
+        "xcom_helpers",
+        "xcfp",
+    )
 ]
 
 EXTENSIONS = [module.name for module in iter_modules(__path__, f"{__package__}.") if module.name not in __blacklist__]
 
 
+class DiscordConfig(_TypedDict):
+    """The ``[discord]`` config section."""
+
+    token: str
+    webhooks: _Mapping[str, int]
+    messages: _Mapping[str, int]
+
+
+class PostgresConfig(_TypedDict):
+    """The ``[postgres]`` config section."""
+
+    host: str
+    user: str
+    password: str
+    database: str
+    points_ledger: _NotRequired[bool]
+    slow_query_ms: _NotRequired[float]
+    pool_min_size: _NotRequired[int]
+    pool_max_size: _NotRequired[int]
+    pool_idle_timeout: _NotRequired[float]
+    pool_warmup: _NotRequired[int]
+    pool_reserved: _NotRequired[int]
+    job_caps: _NotRequired[_Mapping[str, int]]
+
+
+class SentryConfig(_TypedDict):
+    """The ``[sentry]`` config section."""
+
+    dsn: str
+    environment: str
+    release: str
+
+
+class CalendarConfig(_TypedDict):
+    """The ``[calendar]`` config section."""
+
+    key: str
+
+
+class LevelingConfig(_TypedDict):
+    """The optional ``[leveling]`` config section, the size limits of the leveling cog's in memory caches."""
+
+    max_tracked_channels: _NotRequired[int]
+    max_tracked_awards: _NotRequired[int]
+    max_tracked_departed: _NotRequired[int]
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, dict):
+        return _MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _thaw(value: Any) -> Any:
+    if isinstance(value, _Mapping):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(item) for item in value]
+    return value
+
+
+class _Snapshot(_NamedTuple):
+    """The parsed config file, and the modification time it was parsed at."""
+
+    data: _Mapping[str, Any]
+    mtime: int | None
+
+
 class _Config:
     """Config Class.
 
@@ -44,6 +139,9 @@ class _Config:
 
     Both of these will return the value of the key in the config _file, or raise the appropriate error as if trying to
         access a nonexistent key in a dict, or incorrect slicing of a str/int.
+
+    The file is parsed once into a read only snapshot. Its modification time is checked at most every
+    ``POLL_INTERVAL`` seconds when a key is looked up, and a new snapshot is swapped in if it changed.
     """
 
     __instance__: "_Config"
@@ -52,30 +150,106 @@ class _Config:
     else:
         _file: _pathlib.Path = _pathlib.Path(__file__).parent.parent / "config.toml"
     logger = logging.getLogger("charbot.config")
+    POLL_INTERVAL = 1.0
+    _snapshot: _Snapshot | None
+    _checked: float
+    _logged: set[tuple[str, ...]]
+    # The modification time of a file that failed to parse, wrapped so a missing file (None) can be remembered too
+    _failed: tuple[int | None] | None
 
-    def clear_cache(self):  # pragma: no cover
-        """Clear the config cache if a config has changed"""
-        self.logger.info(
-            "Clearing config cache, this can cause previously expected values to disappear. Cache stats: %r",
-            self.get.cache_info(),
-        )
-        self.get.cache_clear()
+    def clear_cache(self):
+        """Parse the config file again on the next lookup, even if it hasn't changed"""
+        self.logger.info("Clearing config cache, this can cause previously expected values to disappear.")
+        self._snapshot = None
 
     def __new__(cls):
         if not hasattr(cls, "__instance__"):
             cls.__instance__ = super().__new__(cls)
+            cls.__instance__._snapshot = None
+            cls.__instance__._checked = float("-inf")
+            cls.__instance__._logged = set()
+            cls.__instance__._failed = None
         return cls.__instance__
 
     def __getitem__(self, item: str) -> dict[str, Any]:
         return self.get(item)  # pyright: ignore[reportReturnType]
 
-    @_functools.cache
-    def get(self, *args: str) -> str | int | dict[str, Any]:
-        """Get a config key"""
+    @property
+    def discord(self) -> DiscordConfig:
+        """The ``[discord]`` section."""
+        return self["discord"]  # pyright: ignore[reportReturnType]
+
+    @property
+    def postgres(self) -> PostgresConfig:
+        """The ``[postgres]`` section."""
+        return self["postgres"]  # pyright: ignore[reportReturnType]
+
+    @property
+    def sentry(self) -> SentryConfig:
+        """The ``[sentry]`` section."""
+        return self["sentry"]  # pyright: ignore[reportReturnType]
+
+    @property
+    def calendar(self) -> CalendarConfig:
+        """The ``[calendar]`` section."""
+        return self["calendar"]  # pyright: ignore[reportReturnType]
+
+    @property
+    def leveling(self) -> LevelingConfig:
+        """The ``[leveling]`` section, empty if the file has none."""
+        return self.snapshot().get("leveling", _MappingProxyType({}))
+
+    @property
+    def logging(self) -> dict[str, Any]:
+        """A mutable copy of the ``[logging]`` section, for :func:`logging.config.dictConfig`."""
+        return _thaw(self["logging"])
+
+    def snapshot(self) -> _Mapping[str, Any]:
+        """Get the current config, reloading it first if the file changed.
+
+        Returns
+        -------
+        Mapping[str, Any]
+            The read only config.
+        """
+        snapshot = self._snapshot
+        now = _time.monotonic()
+        if snapshot is not None and now - self._checked < self.POLL_INTERVAL:
+            return snapshot.data
+        self._checked = now
+        try:
+            mtime = self._file.stat().st_mtime_ns
+        except OSError:
+            mtime = None
+        # A file that failed to parse is only read again once it changes
+        if snapshot is None or (mtime != snapshot.mtime and self._failed != (mtime,)):
+            snapshot = self._load(snapshot, mtime)
+        return snapshot.data
+
+    def _load(self, previous: _Snapshot | None, mtime: int | None) -> _Snapshot:
         import tomllib
 
-        with self._file.open("rb") as f:
-            config = tomllib.load(f)
+        try:
+            with self._file.open("rb") as f:
+                snapshot = _Snapshot(_freeze(tomllib.load(f)), mtime)
+        except (OSError, tomllib.TOMLDecodeError):
+            if previous is None:
+                raise
+            # The file may be half written, keep using the old config and try again once it changes
+            self._failed = (mtime,)
+            self.logger.warning("Failed to reload the config file, keeping the previous config.")
+            return previous
+        # One assignment, so every lookup sees either the old or the new config, never a mix
+        self._snapshot = snapshot
+        self._logged = set()
+        self._failed = None
+        if previous is not None:
+            self.logger.info("Reloaded the config file.")
+        return snapshot
+
+    def get(self, *args: str) -> str | int | dict[str, Any]:
+        """Get a config key"""
+        config: Any = self.snapshot()
         badkey: Any = ""
         try:
             for item in args:
@@ -83,7 +257,9 @@ class _Config:
                     badkey = item
                     raise TypeError(f"Config keys must be strings, {item!r} is a {type(item)}.")
                 config = config[item]
-            self.logger.info("Got key %s from config file.", ":".join(args))
+            if args not in self._logged:
+                self._logged.add(args)
+                self.logger.info("Got key %s from config file.", ":".join(args))
             return config
         except KeyError:
             self.logger.exception("Tried to get key %s from config file, but it was not found.", ":".join(args))
@@ -1,32 +1,34 @@
 """Charbot discord bot."""
 
 import asyncio
+import functools
 import logging.config
 import os
+from typing import Any
 
 import asyncpg
 import discord
 import sentry_sdk
 from discord.ext import commands
 
-from . import CBot, Config, Tree
+from . import CBot, Config, Tree, bus, db, migrate, queries
 
 
 async def main():
     """Run charbot."""
     # set up logging because i'm using `client.start()`, not `client.run()`
     # so I don't get the sane logging defaults set by discord.py
-    logging.config.dictConfig(Config["logging"])  # skipcq: PY-A6006
+    logging.config.dictConfig(Config.logging)  # skipcq: PY-A6006
 
     # Setup sentry.io integration so that exceptions are logged to sentry.io as well.
     sentry_sdk.init(
-        dsn=Config["sentry"]["dsn"],
+        dsn=Config.sentry["dsn"],
         # Set traces_sample_rate to 1.0 to capture 100%
         # of transactions for performance monitoring.
         # We recommend adjusting this value in production.
         traces_sample_rate=1.0,
-        environment=Config["sentry"]["environment"],
-        release=Config["sentry"]["release"],
+        environment=Config.sentry["environment"],
+        release=Config.sentry["release"],
         send_default_pii=True,
         attach_stacktrace=True,
         in_app_include=[
@@ -38,8 +40,34 @@ async def main():
         ],
     )
 
-    # Instantiate a Bot instance
+    connection: dict[str, Any] = {
+        "host": Config.postgres["host"],
+        "user": Config.postgres["user"],
+        "password": Config.postgres["password"],
+        "database": Config.postgres["database"],
+    }
+
+    # Bring the schema up to date before the pool prepares its statements against it
+    conn = await asyncpg.connect(**connection)
+    try:
+        await migrate.migrate(conn)
+    finally:
+        await conn.close()
+
+    # Every query run through the pool is counted, and the ones slower than the threshold are logged
+    query_stats = db.QueryStats(Config.postgres.get("slow_query_ms", 500) / 1000)
+
+    # Instantiate a Bot instance, the pool is opened first so it is still open while the cogs flush their writes on close
     async with (
+        db.create_pool(
+            query_stats,
+            statements=queries.statements(),
+            # Start with few connections and open more when they're needed, idle ones are closed again
+            min_size=Config.postgres.get("pool_min_size", 1),
+            max_size=Config.postgres.get("pool_max_size", 10),
+            max_inactive_connection_lifetime=Config.postgres.get("pool_idle_timeout", 120),
+            **connection,
+        ) as pool,
         CBot(  # skipcq: PYL-E1701
             tree_cls=Tree,
             command_prefix=commands.when_mentioned_or("!"),
@@ -48,17 +76,11 @@ async def main():
             help_command=None,
             activity=discord.Activity(type=discord.ActivityType.watching, name="over the server"),
         ) as bot,
-        asyncpg.create_pool(
-            min_size=50,
-            max_size=100,
-            host=Config["postgres"]["host"],
-            user=Config["postgres"]["user"],
-            password=Config["postgres"]["password"],
-            database=Config["postgres"]["database"],
-        ) as pool,
     ):
         bot.pool = pool
-        await bot.start(Config["discord"]["token"])
+        bot.query_stats = query_stats
+        bot.bus = bus.InvalidationBus(functools.partial(asyncpg.connect, **connection))
+        await bot.start(Config.discord["token"])
 
 
 if __name__ == "__main__":
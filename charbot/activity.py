@@ -0,0 +1,339 @@
+"""Bounded in memory tracking of recent message activity."""
+
+import bisect
+import datetime
+import sys
+from collections import Counter, OrderedDict, deque
+from collections.abc import Callable, Hashable, Iterable
+from typing import Self
+
+
+__all__ = ("ActivityWindow", "ExpiringLRU")
+
+# The approximate size of a message in the window, a tuple of its time and author
+_ENTRY_SIZE = sys.getsizeof((datetime.datetime.min, 0)) + sys.getsizeof(datetime.datetime.min)
+
+
+class ActivityWindow:
+    """The messages sent in a channel within a sliding window of time.
+
+    Messages are kept in the order they arrived for expiry, and in a sorted list per author, so that:
+
+    - expiring old messages is amortized O(1) per message
+    - the number of unique authors is O(1)
+    - the newest message of an author is O(1)
+    - deleting a message is O(log n) to find it
+
+    Deleted messages are only marked in the arrival order queue, and skipped once they expire.
+    """
+
+    __slots__ = ("_deleted", "_messages", "_users")
+
+    def __init__(self):
+        self._messages: deque[tuple[datetime.datetime, int]] = deque()
+        self._users: dict[int, list[datetime.datetime]] = {}
+        self._deleted: Counter[tuple[datetime.datetime, int]] = Counter()
+
+    def __len__(self) -> int:
+        """The number of unique authors in the window."""
+        return len(self._users)
+
+    def __contains__(self, user: object) -> bool:
+        return user in self._users
+
+    def __sizeof__(self) -> int:
+        return (
+            object.__sizeof__(self)
+            + sys.getsizeof(self._messages)
+            + len(self._messages) * _ENTRY_SIZE
+            + sys.getsizeof(self._users)
+            + sum(sys.getsizeof(times) for times in self._users.values())
+            + sys.getsizeof(self._deleted)
+        )
+
+    def add(self, created_at: datetime.datetime, user: int) -> None:
+        """Add a message to the window.
+
+        Parameters
+        ----------
+        created_at : datetime.datetime
+            When the message was sent.
+        user : int
+            The id of the author.
+        """
+        self._messages.append((created_at, user))
+        times = self._users.setdefault(user, [])
+        if not times or times[-1] <= created_at:
+            times.append(created_at)
+        else:
+            bisect.insort(times, created_at)
+
+    def expire(self, oldest: datetime.datetime) -> None:
+        """Remove the messages sent before a time.
+
+        Like a deque of messages, this stops at the first message that arrived which is still in the window.
+
+        Parameters
+        ----------
+        oldest : datetime.datetime
+            The time of the oldest message to keep.
+        """
+        messages = self._messages
+        while messages and messages[0][0] < oldest:
+            entry = messages.popleft()
+            if self._deleted[entry]:
+                self._deleted[entry] -= 1
+                if not self._deleted[entry]:
+                    del self._deleted[entry]
+                continue
+            self._discard(*entry)
+
+    def remove(self, created_at: datetime.datetime, user: int) -> bool:
+        """Remove a message from the window, because it was deleted.
+
+        Parameters
+        ----------
+        created_at : datetime.datetime
+            When the message was sent.
+        user : int
+            The id of the author.
+
+        Returns
+        -------
+        bool
+            Whether the message was in the window.
+        """
+        if not self._discard(created_at, user):
+            return False
+        self._deleted[created_at, user] += 1
+        return True
+
+    def newest(self, user: int) -> datetime.datetime | None:
+        """Get the time of the newest message of an author.
+
+        Parameters
+        ----------
+        user : int
+            The id of the author.
+
+        Returns
+        -------
+        datetime.datetime | None
+            The time, or None if the author has no messages in the window.
+        """
+        times = self._users.get(user)
+        return times[-1] if times else None
+
+    def active_since(self, since: datetime.datetime) -> list[int]:
+        """Get the authors that sent a message at or after a time.
+
+        Parameters
+        ----------
+        since : datetime.datetime
+            The time.
+
+        Returns
+        -------
+        list[int]
+            The ids of the authors.
+        """
+        return [user for user, times in self._users.items() if times[-1] >= since]
+
+    def messages(self) -> list[tuple[datetime.datetime, int]]:
+        """Get the messages in the window, oldest first, to save them.
+
+        Returns
+        -------
+        list[tuple[datetime.datetime, int]]
+            The time and author of each message.
+        """
+        return sorted((created_at, user) for user, times in self._users.items() for created_at in times)
+
+    @classmethod
+    def from_messages(cls, messages: Iterable[tuple[datetime.datetime, int]]) -> Self:
+        """Create a window from saved messages.
+
+        Parameters
+        ----------
+        messages : Iterable[tuple[datetime.datetime, int]]
+            The time and author of each message, oldest first.
+
+        Returns
+        -------
+        ActivityWindow
+            The window.
+        """
+        window = cls()
+        for created_at, user in messages:
+            window.add(created_at, user)
+        return window
+
+    def _discard(self, created_at: datetime.datetime, user: int) -> bool:
+        times = self._users.get(user)
+        if times is None:
+            return False
+        index = bisect.bisect_left(times, created_at)
+        if index == len(times) or times[index] != created_at:
+            return False
+        del times[index]
+        if not times:
+            del self._users[user]
+        return True
+
+
+class ExpiringLRU[K: Hashable, V]:
+    """A mapping that is bounded in both size and age.
+
+    Entries expire once they haven't been set for ``ttl`` seconds, and the least recently set entries are evicted once
+    there are more than ``maxsize`` of them. Times are passed in by the caller, so entries can age with message
+    timestamps instead of the wall clock.
+
+    Parameters
+    ----------
+    maxsize : int
+        The maximum number of entries.
+    ttl : float
+        The number of seconds after an entry was last set that it expires.
+    sizeof : Callable[[V], int]
+        Gets the approximate size of a value in bytes, for :meth:`memory_usage`. Defaults to :func:`sys.getsizeof`.
+    """
+
+    __slots__ = ("_data", "_sizeof", "evictions", "expirations", "maxsize", "ttl")
+
+    def __init__(self, maxsize: int, ttl: float, sizeof: Callable[[V], int] = sys.getsizeof):
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._sizeof = sizeof
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._data
+
+    def get(self, key: K, now: float) -> V | None:
+        """Get the value of a key, if it hasn't expired.
+
+        Parameters
+        ----------
+        key : K
+            The key.
+        now : float
+            The current time, in seconds.
+
+        Returns
+        -------
+        V | None
+            The value, or None if the key is missing or expired.
+        """
+        if (entry := self._data.get(key)) is None:
+            return None
+        set_at, value = entry
+        if set_at < now - self.ttl:
+            del self._data[key]
+            self.expirations += 1
+            return None
+        return value
+
+    def peek(self, key: K) -> V | None:
+        """Get the value of a key, without checking if it has expired.
+
+        Parameters
+        ----------
+        key : K
+            The key.
+
+        Returns
+        -------
+        V | None
+            The value, or None if the key is missing.
+        """
+        entry = self._data.get(key)
+        return None if entry is None else entry[1]
+
+    def discard(self, key: K) -> None:
+        """Remove a key, if it is in the mapping.
+
+        Parameters
+        ----------
+        key : K
+            The key.
+        """
+        self._data.pop(key, None)
+
+    def set(self, key: K, value: V, now: float) -> None:
+        """Set the value of a key, making it the most recently used.
+
+        Expired entries are removed first, then the least recently used ones if there are too many.
+
+        Parameters
+        ----------
+        key : K
+            The key.
+        value : V
+            The value.
+        now : float
+            The current time, in seconds.
+        """
+        self._data[key] = (now, value)
+        self._data.move_to_end(key)
+        self.prune(now)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def prune(self, now: float) -> None:
+        """Remove the expired entries.
+
+        Parameters
+        ----------
+        now : float
+            The current time, in seconds.
+        """
+        data = self._data
+        oldest = now - self.ttl
+        while data and next(iter(data.values()))[0] < oldest:
+            data.popitem(last=False)
+            self.expirations += 1
+
+    def entries(self) -> list[tuple[K, float, V]]:
+        """Get the entries, least recently set first, to save them.
+
+        Returns
+        -------
+        list[tuple[K, float, V]]
+            The key, the time it was set and the value of each entry.
+        """
+        return [(key, set_at, value) for key, (set_at, value) in self._data.items()]
+
+    def load(self, entries: Iterable[tuple[K, float, V]]) -> None:
+        """Add saved entries, least recently set first.
+
+        Unlike :meth:`set`, nothing is expired, as there is no current time yet. The least recently set entries are
+        still evicted if there are too many.
+
+        Parameters
+        ----------
+        entries : Iterable[tuple[K, float, V]]
+            The key, the time it was set and the value of each entry.
+        """
+        for key, set_at, value in entries:
+            self._data[key] = (set_at, value)
+            self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def memory_usage(self) -> int:
+        """Get the approximate memory used by the entries, in bytes.
+
+        Returns
+        -------
+        int
+            The approximate size.
+        """
+        return sys.getsizeof(self._data) + sum(
+            sys.getsizeof(key) + sys.getsizeof(entry) + self._sizeof(entry[1]) for key, entry in self._data.items()
+        )
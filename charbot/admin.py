@@ -1,13 +1,22 @@
 """Admin commands for the reputation system."""
 
-from typing import cast
+import asyncio
+import datetime
+from collections.abc import Callable, Coroutine
+from typing import TYPE_CHECKING, Any, cast
 
+import asyncpg
 import discord
 from discord import Interaction, app_commands, ui
 from discord.ext import commands
-from discord.utils import format_dt, utcnow
+from discord.utils import MISSING, format_dt, utcnow
 
-from . import CBot, constants
+from . import CBot, backup, constants, queries
+from .db import InstrumentedPool, Order
+
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .levels import Leveling
 
 
 MOD_ROLE = discord.Object(338173415527677954)
@@ -34,6 +43,12 @@ class Admin(
     def __init__(self, bot: CBot):
         self.bot = bot
 
+    def _refresh_no_xp(self, record: queries.NoXpRow | None) -> None:
+        """Push an updated no_xp row into the leveling cog's cache, if it is loaded."""
+        leveling = cast("Leveling | None", self.bot.get_cog("Leveling"))
+        if leveling is not None:
+            leveling.set_no_xp(record)
+
     levels = app_commands.Group(
         name="levels",
         description="Administration commands for the leveling system.",
@@ -53,23 +68,19 @@ class Admin(
         """
         await interaction.response.defer(ephemeral=True)
         async with self.bot.pool.acquire() as conn, conn.transaction():
-            no_xp = await conn.fetchrow("SELECT * FROM no_xp WHERE guild = $1", interaction.guild_id)
-            if no_xp is None:
-                await interaction.followup.send("Xp is not set up??.")
-            elif role.id in no_xp["roles"]:
-                await conn.execute(
-                    "UPDATE no_xp SET roles = array_remove(roles, $1) WHERE guild = $2",
-                    role.id,
-                    interaction.guild_id,
-                )
-                await interaction.followup.send(f"Role `{role.name}` removed from noxp.")
-            else:
-                await conn.execute(
-                    "UPDATE no_xp SET roles = array_append(roles, $1) WHERE guild = $2",
-                    role.id,
-                    interaction.guild_id,
-                )
-                await interaction.followup.send(f"Role `{role.name}` added to noxp.")
+            no_xp = await queries.no_xp(conn, interaction.guild_id)
+            blocked = no_xp is not None and role.id not in no_xp["roles"]
+            updated = (
+                None
+                if no_xp is None
+                else await queries.block_xp(conn, interaction.guild_id, role=role.id, blocked=blocked)
+            )
+        # The cache only follows the change once it's committed, and the reply doesn't hold the row lock
+        if updated is None:
+            await interaction.followup.send("Xp is not set up??.")
+            return
+        self._refresh_no_xp(updated)
+        await interaction.followup.send(f"Role `{role.name}` {'added to' if blocked else 'removed from'} noxp.")
 
     @levels.command()
     async def no_xp_channel(self, interaction: Interaction[CBot], channel: discord.TextChannel | discord.VoiceChannel):
@@ -84,23 +95,19 @@ class Admin(
         """
         await interaction.response.defer(ephemeral=True)
         async with self.bot.pool.acquire() as conn, conn.transaction():
-            no_xp = await conn.fetchrow("SELECT * FROM no_xp WHERE guild = $1", interaction.guild_id)
-            if no_xp is None:
-                await interaction.followup.send("Xp is not set up??.")
-            elif channel.id in no_xp["channels"]:
-                await conn.execute(
-                    "UPDATE no_xp SET channels = array_remove(channels, $1) WHERE guild = $2",
-                    channel.id,
-                    interaction.guild_id,
-                )
-                await interaction.followup.send(f"{channel.mention} removed from noxp.")
-            else:
-                await conn.execute(
-                    "UPDATE no_xp SET channels = array_append(channels, $1) WHERE guild = $2",
-                    channel.id,
-                    interaction.guild_id,
-                )
-                await interaction.followup.send(f"{channel.mention} added to noxp.")
+            no_xp = await queries.no_xp(conn, interaction.guild_id)
+            blocked = no_xp is not None and channel.id not in no_xp["channels"]
+            updated = (
+                None
+                if no_xp is None
+                else await queries.block_xp(conn, interaction.guild_id, channel=channel.id, blocked=blocked)
+            )
+        # The cache only follows the change once it's committed, and the reply doesn't hold the row lock
+        if updated is None:
+            await interaction.followup.send("Xp is not set up??.")
+            return
+        self._refresh_no_xp(updated)
+        await interaction.followup.send(f"{channel.mention} {'added to' if blocked else 'removed from'} noxp.")
 
     @levels.command()
     async def noxp_query(self, interaction: Interaction[CBot]):
@@ -113,7 +120,7 @@ class Admin(
         """
         await interaction.response.defer(ephemeral=True)
         async with self.bot.pool.acquire() as conn:
-            noxp = await conn.fetchrow("SELECT * FROM no_xp WHERE guild = $1", interaction.guild_id)
+            noxp = await queries.no_xp(conn, interaction.guild_id)
             if noxp is None:
                 await interaction.followup.send("Xp is not set up??.")
             else:
@@ -132,6 +139,110 @@ class Admin(
                 )
                 await interaction.followup.send(view=view)
 
+    @commands.command(hidden=True, name="dbstats")
+    @commands.is_owner()
+    async def db_stats(self, ctx: commands.Context, count: int = 10, order: Order = "total", reset: bool = False):
+        """Show the slowest statements, the waits for a connection, and the connections of the pool and background jobs.
+
+        Parameters
+        ----------
+        ctx : commands.Context
+            The context of the command.
+        count : int
+            How many statements to show.
+        order : Literal["total", "count", "mean", "max"]
+            What to rank the statements by.
+        reset : bool
+            Whether to start counting from zero after showing the stats.
+        """
+        if (stats := self.bot.query_stats) is None:
+            await ctx.send("Query stats aren't being recorded.")
+            return
+        report = stats.report(count, order, self.bot.pool if isinstance(self.bot.pool, InstrumentedPool) else None)
+        if reset:
+            stats.reset()
+        if self.bot.budgets is not MISSING:
+            report = f"{self.bot.budgets.report()}\n{report}"
+        await ctx.send(f"```\n{report[:1990]}\n```")
+
+    async def _copy(
+        self, ctx: commands.Context, action: str, run: Callable[[backup.Progress], Coroutine[Any, Any, dict[str, int]]]
+    ) -> None:
+        """Run a backup or restore, editing a message with its progress every few seconds."""
+        latest = ""
+
+        def progress(table: str, done: int, total: int | None) -> None:
+            nonlocal latest
+            latest = f"{table}: {done // 1024} KiB" + (f" of {total // 1024} KiB" if total is not None else "")
+
+        message = await ctx.send(f"{action}...")
+        task = asyncio.create_task(run(progress))
+        while not task.done():
+            await asyncio.wait((task,), timeout=3)
+            if not task.done() and latest:
+                await message.edit(content=f"{action}... {latest}")
+        try:
+            rows = task.result()
+        except (ValueError, OSError, asyncpg.PostgresError) as error:
+            await message.edit(content=f"{action} failed: {error}")
+            return
+        except Exception as error:  # skipcq: PYL-W0703
+            # Still reported in the message, then left to the command error handler to log
+            await message.edit(content=f"{action} failed unexpectedly: {type(error).__name__}")
+            raise
+        await message.edit(content=f"{action} done: {', '.join(f'{count} {table}' for table, count in rows.items())}")
+
+    @commands.command(hidden=True, name="backup")
+    @commands.is_owner()
+    async def backup_tables(self, ctx: commands.Context, *tables: str):
+        """Back up the users, levels and banners tables to a new directory in the backups directory.
+
+        Parameters
+        ----------
+        ctx : commands.Context
+            The context of the command.
+        tables : str
+            The tables to back up, all of them if none are given.
+        """
+        name = datetime.datetime.now(datetime.UTC).strftime("%Y%m%d-%H%M%S")
+
+        async def run(progress: backup.Progress) -> dict[str, int]:
+            async with self.bot.background("backup").acquire() as conn:
+                return await backup.export(conn, backup.BACKUP_DIR / name, tables or None, progress)
+
+        await self._copy(ctx, f"Backing up to `{name}`", run)
+
+    @commands.command(hidden=True, name="restore")
+    @commands.is_owner()
+    async def restore_tables(self, ctx: commands.Context, name: str, *tables: str):
+        """Restore tables from a directory in the backups directory, merging them with the rows already there.
+
+        Parameters
+        ----------
+        ctx : commands.Context
+            The context of the command.
+        name : str
+            The name of the backup, as shown when it was made.
+        tables : str
+            The tables to restore, all of those in the backup if none are given.
+        """
+        # Only backups that exist can be named, so the name can't point outside the backups directory
+        if not backup.BACKUP_DIR.is_dir() or name not in {
+            path.name for path in backup.BACKUP_DIR.iterdir() if path.is_dir()
+        }:
+            await ctx.send(f"There is no backup named `{name}`.")
+            return
+
+        async def run(progress: backup.Progress) -> dict[str, int]:
+            async with self.bot.background("backup").acquire() as conn:
+                rows = await backup.restore(conn, backup.BACKUP_DIR / name, tables or None, progress)
+            # Ranks are served from memory, they'd be those from before the restore until the next restart
+            if "levels" in rows and (leveling := cast("Leveling | None", self.bot.get_cog("Leveling"))) is not None:
+                await leveling.reload_ranks()
+            return rows
+
+        await self._copy(ctx, f"Restoring `{name}`", run)
+
 
 async def setup(bot: CBot):
     """Initialize the cog."""
@@ -0,0 +1,242 @@
+"""Backups of the ``users``, ``levels`` and ``banners`` tables in Postgres' binary COPY format.
+
+A backup is a directory with one ``<table>.copy`` file per table and a ``manifest.json`` with their columns and row
+counts. Run ``python -m charbot.backup export|import <directory>`` to make or restore one outside of the bot.
+"""
+
+import argparse
+import asyncio
+import datetime
+import os
+import pathlib
+import sys
+from collections.abc import AsyncIterator, Callable, Iterable
+from typing import BinaryIO, NamedTuple
+
+import asyncpg
+import orjson
+from asyncpg.pool import PoolConnectionProxy
+
+from . import Config
+
+
+__all__ = ("BACKUP_DIR", "TABLES", "Progress", "Table", "export", "restore")
+
+if path := os.getenv("CHARBOT_BACKUP_DIR"):  # pragma: no cover
+    BACKUP_DIR = pathlib.Path(path)
+else:
+    BACKUP_DIR = pathlib.Path(__file__).parent.parent / "backups"
+
+# Bytes read from a backup file per message sent to the server
+_CHUNK_SIZE = 256 * 1024
+
+
+class Table(NamedTuple):
+    """A table that is backed up.
+
+    The columns are listed explicitly, since binary COPY data has no header to match them up by.
+    """
+
+    name: str
+    key: str
+    columns: tuple[str, ...]
+
+
+# In restore order, banners reference users
+TABLES = (
+    Table("users", "id", ("id", "points", "last_claim", "last_particip_dt", "particip", "won", "wins")),
+    Table("levels", "id", ("id", "xp", "last_message")),
+    Table("banners", "user_id", ("user_id", "quote", "color", "cooldown", "approved")),
+)
+
+# Called with the table being copied, the bytes copied so far, and the size of the file when restoring
+type Progress = Callable[[str, int, int | None], None]
+
+
+def _select(names: Iterable[str] | None) -> list[Table]:
+    if names is None:
+        return list(TABLES)
+    names = set(names)
+    if unknown := names.difference(table.name for table in TABLES):
+        raise ValueError(f"Can't back up {', '.join(sorted(unknown))}, only {', '.join(t.name for t in TABLES)}.")
+    return [table for table in TABLES if table.name in names]
+
+
+class _Output:
+    """Writes what a COPY sends to a file, counting the bytes written."""
+
+    __slots__ = ("file", "progress", "table", "written")
+
+    def __init__(self, file: BinaryIO, table: str, progress: Progress | None):
+        self.file = file
+        self.table = table
+        self.progress = progress
+        self.written = 0
+
+    async def __call__(self, chunk: bytes) -> None:
+        self.file.write(chunk)
+        self.written += len(chunk)
+        if self.progress is not None:
+            self.progress(self.table, self.written, None)
+
+
+async def _read(path: pathlib.Path, table: str, progress: Progress | None) -> AsyncIterator[bytes]:
+    total = path.stat().st_size
+    done = 0
+    with path.open("rb") as file:
+        while chunk := file.read(_CHUNK_SIZE):
+            done += len(chunk)
+            if progress is not None:
+                progress(table, done, total)
+            yield chunk
+
+
+def _rows(status: str) -> int:
+    # Command tags look like "COPY 42" or "INSERT 0 42"
+    return int(status.rsplit(" ", 1)[-1])
+
+
+async def export(
+    conn: asyncpg.Connection | PoolConnectionProxy,
+    directory: pathlib.Path,
+    tables: Iterable[str] | None = None,
+    progress: Progress | None = None,
+) -> dict[str, int]:
+    """Write tables to a backup directory.
+
+    All tables are read from the same snapshot, so the backup is consistent even while the bot keeps writing.
+
+    Parameters
+    ----------
+    conn : asyncpg.Connection | PoolConnectionProxy
+        The connection to read with.
+    directory : pathlib.Path
+        The directory to write the backup to, it is created if it doesn't exist.
+    tables : Iterable[str] | None
+        The names of the tables to back up, all of them if None.
+    progress : Progress | None
+        Called as data is written.
+
+    Returns
+    -------
+    dict[str, int]
+        The number of rows written by table.
+
+    Raises
+    ------
+    ValueError
+        If a table can't be backed up.
+    """
+    selected = _select(tables)
+    directory.mkdir(parents=True, exist_ok=True)
+    rows: dict[str, int] = {}
+    async with conn.transaction(isolation="repeatable_read", readonly=True):
+        for table in selected:
+            with (directory / f"{table.name}.copy").open("wb") as file:
+                status = await conn.copy_from_query(
+                    f"SELECT {', '.join(table.columns)} FROM {table.name} ORDER BY {table.key}",
+                    output=_Output(file, table.name, progress),
+                    format="binary",
+                )
+            rows[table.name] = _rows(status)
+    manifest = {
+        "created": datetime.datetime.now(datetime.UTC).isoformat(),
+        "tables": {table.name: {"columns": table.columns, "rows": rows[table.name]} for table in selected},
+    }
+    (directory / "manifest.json").write_bytes(orjson.dumps(manifest, option=orjson.OPT_INDENT_2))
+    return rows
+
+
+async def restore(
+    conn: asyncpg.Connection | PoolConnectionProxy,
+    directory: pathlib.Path,
+    tables: Iterable[str] | None = None,
+    progress: Progress | None = None,
+) -> dict[str, int]:
+    """Load tables from a backup directory.
+
+    Rows are merged by their key, rows in the backup replace the ones in the database and other rows are kept. Either
+    every table is restored or none is.
+
+    Parameters
+    ----------
+    conn : asyncpg.Connection | PoolConnectionProxy
+        The connection to write with.
+    directory : pathlib.Path
+        The backup directory.
+    tables : Iterable[str] | None
+        The names of the tables to restore, all of those in the backup if None.
+    progress : Progress | None
+        Called as data is read.
+
+    Returns
+    -------
+    dict[str, int]
+        The number of rows restored by table.
+
+    Raises
+    ------
+    ValueError
+        If a table isn't in the backup, or its columns don't match the table's.
+    """
+    manifest = orjson.loads((directory / "manifest.json").read_bytes())["tables"]
+    selected = _select(manifest if tables is None else tables)
+    for table in selected:
+        if table.name not in manifest:
+            raise ValueError(f"The backup has no {table.name} table.")
+        if tuple(manifest[table.name]["columns"]) != table.columns:
+            raise ValueError(f"The columns of {table.name} in the backup don't match the table.")
+    rows: dict[str, int] = {}
+    async with conn.transaction():
+        for table in selected:
+            # Copied into a copy of the table first, COPY itself can't merge with existing rows
+            staging = f"restore_{table.name}"
+            await conn.execute(
+                f"CREATE TEMPORARY TABLE {staging} (LIKE {table.name} INCLUDING DEFAULTS) ON COMMIT DROP"
+            )
+            await conn.copy_to_table(
+                staging,
+                source=_read(directory / f"{table.name}.copy", table.name, progress),
+                columns=list(table.columns),
+                format="binary",
+            )
+            columns = ", ".join(table.columns)
+            updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in table.columns if column != table.key)
+            status = await conn.execute(
+                f"INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {staging} "
+                f"ON CONFLICT ({table.key}) DO UPDATE SET {updates}"
+            )
+            rows[table.name] = _rows(status)
+    return rows
+
+
+def _print_progress(table: str, done: int, total: int | None) -> None:  # pragma: no cover
+    size = f"{done / 1024:.0f}/{total / 1024:.0f} KiB" if total is not None else f"{done / 1024:.0f} KiB"
+    print(f"\r{table}: {size}", end="", file=sys.stderr, flush=True)
+
+
+async def _main(args: argparse.Namespace) -> None:  # pragma: no cover
+    conn = await asyncpg.connect(
+        host=Config.postgres["host"],
+        user=Config.postgres["user"],
+        password=Config.postgres["password"],
+        database=Config.postgres["database"],
+    )
+    try:
+        run = export if args.action == "export" else restore
+        rows = await run(conn, args.directory, args.tables, _print_progress)
+    finally:
+        await conn.close()
+    print(file=sys.stderr)
+    for table, count in rows.items():
+        print(f"{table}: {count} rows {'exported' if args.action == 'export' else 'restored'}")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    parser = argparse.ArgumentParser(
+        prog="python -m charbot.backup", description="Back up or restore the users, levels and banners tables."
+    )
+    parser.add_argument("action", choices=("export", "import"))
+    parser.add_argument("directory", type=pathlib.Path)
+    parser.add_argument("--tables", nargs="+", choices=[table.name for table in TABLES])
+    asyncio.run(_main(parser.parse_args()))
@@ -1,6 +1,7 @@
 """Banner code."""
 
 import asyncio
+import functools
 from collections.abc import Iterable
 from io import BytesIO
 from pathlib import Path
@@ -16,12 +17,27 @@ from ._types import BannerStatus
 
 __FONT_PATH = Path(__file__).parent.parent.joinpath("media/pools/font.ttf").resolve().as_posix()
 
-FONT: Final = ImageFont.truetype(__FONT_PATH, 30)
-FONT_QUOTE: Final = ImageFont.truetype(__FONT_PATH, 20)
 BASE_PATH: Final[Path] = Path(__file__).parent / "user_assets"
 STAR_COLOR: Final[tuple[int, int, int]] = (69, 79, 191)
 
 
+@functools.cache
+def font(size: int) -> ImageFont.FreeTypeFont:
+    """Get the banner font, loading it the first time each size is used.
+
+    Parameters
+    ----------
+    size : int
+        The size of the font.
+
+    Returns
+    -------
+    ImageFont.FreeTypeFont
+        The font.
+    """
+    return ImageFont.truetype(__FONT_PATH, size)
+
+
 def interpolate(
     f_co: tuple[int, int, int], t_co: tuple[int, int, int], interval: int
 ) -> Iterable[tuple[int, int, int]]:
@@ -127,11 +143,11 @@ def banner(
         (img.width - 20, 50),
         fill(quote, width=30, max_lines=4, break_long_words=True),
         fill=(255, 255, 255),
-        font=FONT,
+        font=font(30),
         align="right",
         anchor="ra",
     )
-    draw.text((20, 15), username, fill=(255, 255, 255), font=FONT, anchor="la", align="left")
+    draw.text((20, 15), username, fill=(255, 255, 255), font=font(30), anchor="la", align="left")
     profile_pic_holder = Image.new("RGBA", img.size, (255, 255, 255, 0))  # Is used for a blank image so that I can mask
     mask = Image.new("RGBA", img.size, 0)
     mask_draw = ImageDraw.Draw(mask)
@@ -13,9 +13,8 @@ from discord import Interaction, app_commands, utils
 from discord.ext import commands
 from PIL import Image
 
-from .. import CBot, constants
+from .. import CBot, constants, queries
 from . import ColorOpts, views
-from ._types import BannerStatus, BannerStatusPoints
 from .banner import generate_banner
 
 
@@ -43,11 +42,7 @@ class Betas(commands.Cog):
             return
         if "my banner" in message.content.lower() and message.channel.id == constants.GUILD_ID:
             async with self.bot.pool.acquire() as conn:
-                banner_rec: BannerStatusPoints | None = await conn.fetchrow(  # pyright: ignore[reportAssignmentType]
-                    "SELECT banners.user_id as user_id, quote, banners.color as color, cooldown, approved,"
-                    "u.points as POINTS FROM banners JOIN users u on banners.user_id = u.id WHERE banners.user_id = $1",
-                    message.author.id,
-                )
+                banner_rec = await queries.banner(conn, message.author.id)
                 if (
                     banner_rec is not None
                     and banner_rec["cooldown"] < utils.utcnow()
@@ -57,11 +52,7 @@ class Betas(commands.Cog):
                     banner_bytes = await generate_banner(banner_rec, message.author)
                     banner_file = discord.File(banner_bytes, filename="banner.png")
                     await message.reply(file=banner_file)
-                    await conn.execute(
-                        "UPDATE banners SET cooldown = $1 WHERE user_id = $2",
-                        utils.utcnow() + datetime.timedelta(days=7),
-                        message.author.id,
-                    )
+                    await queries.banner_cooldown(conn, message.author.id, utils.utcnow() + datetime.timedelta(days=7))
                     # await conn.execute("UPDATE users SET points = points - 50 WHERE id = $1", member.id)
 
     @banner.command()
@@ -89,7 +80,7 @@ class Betas(commands.Cog):
         await interaction.response.defer(ephemeral=True)
         conn: asyncpg.pool.PoolConnectionProxy
         async with interaction.client.pool.acquire() as conn, conn.transaction():
-            points: int | None = await conn.fetchval("SELECT points FROM users WHERE id = $1", interaction.user.id)
+            points = await queries.user_points(conn, interaction.user.id)
             if points is None:
                 await interaction.followup.send("You don't have any rep yet, earn some first!")
                 return
@@ -133,16 +124,8 @@ class Betas(commands.Cog):
                     await interaction.followup.send("If you don't specify a base image, a banner color is required.")
                     return
                 insert_color: str | None = str(color.value.value)
-            await conn.execute(
-                "INSERT INTO banners (user_id, quote, color) VALUES ($1, $2, $3) ON CONFLICT (user_id) DO UPDATE SET"
-                " quote = EXCLUDED.quote, color = EXCLUDED.color, approved = FALSE",
-                interaction.user.id,
-                quote,
-                insert_color,
-            )
-            remaining: int = await conn.fetchval(
-                "UPDATE users SET points = points - 350 WHERE id = $1 RETURNING points", interaction.user.id
-            )
+            await queries.request_banner(conn, interaction.user.id, quote, insert_color)
+            remaining = await queries.spend_points(conn, interaction.user.id, 350)
             await interaction.followup.send(f"You now have {remaining} rep remaining.\nYou have requested a banner!")
 
     @banner.command()
@@ -155,11 +138,7 @@ class Betas(commands.Cog):
             The interaction object for the current context
         """
         await interaction.response.defer(ephemeral=True)
-        banner_rec: BannerStatusPoints | None = await interaction.client.pool.fetchrow(  # pyright: ignore[reportAssignmentType]
-            "SELECT banners.user_id as user_id, quote, banners.color as color, cooldown, approved,"
-            "u.points as POINTS FROM banners JOIN users u on banners.user_id = u.id WHERE banners.user_id = $1",
-            interaction.user.id,
-        )
+        banner_rec = await queries.banner(interaction.client.pool, interaction.user.id)
         if banner_rec is None:
             await interaction.followup.send("You don't have a banner_rec, or haven't requested one!")
             return
@@ -181,11 +160,7 @@ class Betas(commands.Cog):
         member = cast(discord.Member, ctx.author)
         if not member.guild_permissions.manage_roles:
             return
-        banner_rec: BannerStatus | None = await ctx.bot.pool.fetchrow(  # pyright: ignore[reportAssignmentType]
-            "SELECT banners.user_id as user_id, quote, banners.color as color, cooldown, approved,"
-            "u.points as POINTS FROM banners JOIN users u on banners.user_id = u.id WHERE banners.approved = FALSE "
-            "ORDER BY cooldown LIMIT 1",
-        )
+        banner_rec = await queries.pending_banner(ctx.bot.pool)
         if banner_rec is None:
             await ctx.reply("There are currently no banner awaiting approval!")
             return
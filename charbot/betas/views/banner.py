@@ -3,7 +3,7 @@
 import discord
 from discord import Interaction, ui
 
-from ... import CBot
+from ... import CBot, queries
 from .._types import BannerStatus
 
 
@@ -33,9 +33,7 @@ class ApprovalView(ui.View):
     async def approve(self, interaction: Interaction[CBot], _: ui.Button):
         """Approve the banner."""
         await interaction.response.defer(ephemeral=True)
-        await interaction.client.pool.execute(
-            "UPDATE banners SET approved = TRUE, cooldown = now() WHERE user_id = $1", self.requester
-        )
+        await queries.approve_banner(interaction.client.pool, self.requester)
         await interaction.edit_original_response(content="Banner approved.", attachments=[], view=None)
         self.stop()
 
@@ -43,7 +41,7 @@ class ApprovalView(ui.View):
     async def deny(self, interaction: Interaction[CBot], _: ui.Button):
         """Deny the banner."""
         await interaction.response.defer(ephemeral=True)
-        await interaction.client.pool.execute("DELETE FROM banners WHERE user_id = $1", self.requester)
+        await queries.delete_banner(interaction.client.pool, self.requester)
         await interaction.edit_original_response(content="Banner denied.", attachments=[], view=None)
         self.stop()
 
@@ -1,25 +1,44 @@
 """Charbot discord bot."""
 
+import asyncio
 import datetime
 import logging
+import pathlib
 import sys
+import time
 from typing import Any, ClassVar, Self, TypeVar, cast
 from zoneinfo import ZoneInfo
 
 import asyncpg
 import discord
+import orjson
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord.utils import MISSING
 
 from . import EXTENSIONS, Config, errors
+from .bus import InvalidationBus
+from .clock import ResetClock
+from .db import Budget, ConnectionBudgets, InstrumentedPool, QueryStats
+from .points import PointsLedger
+from .queries import give_game_points
+from .state import STATE_FILE, STATE_KEYS, STATE_VERSION, StateKey
 
 
 _VT = TypeVar("_VT")
 
 
 class Holder(dict[str, Any]):
-    """Holder for data."""
+    """Holder for data.
+
+    Cogs hand their state to their next instance through the holder when they are reloaded. State declared with a
+    :class:`~charbot.state.StateKey` is typed, and can also be saved to disk on shutdown and restored on startup.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        # Saved state that hasn't been taken yet, still in its JSON form
+        self.restored: dict[str, Any] = {}
 
     def __getitem__(self, k: Any) -> Any:
         """Get item."""
@@ -45,6 +64,94 @@ class Holder(dict[str, Any]):
             self[__key] = default
         return self[__key]
 
+    def take[T](self, key: StateKey[T]) -> T:
+        """Take a value out of the holder.
+
+        Parameters
+        ----------
+        key : StateKey[T]
+            The key of the value.
+
+        Returns
+        -------
+        T
+            The value left by the last instance of the cog, or restored from disk, or else a new default value.
+        """
+        if key.name in self:
+            return super().pop(key.name)
+        if key.name in self.restored and key.load is not None:
+            raw = self.restored.pop(key.name)
+            try:
+                return key.load(raw)
+            except Exception:  # skipcq: PYL-W0703
+                logging.getLogger("charbot.state").exception("Failed to restore %s, starting from empty", key.name)
+        return key.default()
+
+    def put[T](self, key: StateKey[T], value: T) -> None:
+        """Leave a value in the holder for the next instance of the cog.
+
+        Parameters
+        ----------
+        key : StateKey[T]
+            The key of the value.
+        value : T
+            The value.
+        """
+        self[key.name] = value
+
+    def save(self, path: pathlib.Path) -> int:
+        """Write the persisted state to a file.
+
+        State restored from the file that no cog has taken yet, because its cog failed to load, is written back as it
+        was. The file is replaced atomically, so a crash while saving keeps the previous file.
+
+        Parameters
+        ----------
+        path : pathlib.Path
+            The file to write.
+
+        Returns
+        -------
+        int
+            The number of entries written.
+        """
+        state = dict(self.restored)
+        for name, value in self.items():
+            if (key := STATE_KEYS.get(name)) is not None and key.dump is not None:
+                state[name] = key.dump(value)
+        temp = path.with_suffix(".tmp")
+        temp.write_bytes(orjson.dumps({"version": STATE_VERSION, "state": state}))
+        temp.replace(path)
+        return len(state)
+
+    def restore(self, path: pathlib.Path) -> int:
+        """Read the state saved by :meth:`save`, to be decoded by :meth:`take` once the cogs load.
+
+        A missing, unreadable or outdated file is ignored, the cogs start from empty then.
+
+        Parameters
+        ----------
+        path : pathlib.Path
+            The file to read.
+
+        Returns
+        -------
+        int
+            The number of entries read.
+        """
+        try:
+            data = orjson.loads(path.read_bytes())
+        except FileNotFoundError:
+            return 0
+        except (OSError, orjson.JSONDecodeError):
+            logging.getLogger("charbot.state").exception("Failed to read the saved state from %s", path)
+            return 0
+        if not isinstance(data, dict) or data.get("version") != STATE_VERSION:
+            logging.getLogger("charbot.state").warning("Ignoring saved state in %s from another version", path)
+            return 0
+        self.restored = data["state"]
+        return len(self.restored)
+
 
 class CBot(commands.Bot):
     """Custom bot class. extends discord.ext.commands.Bot.
@@ -111,6 +218,7 @@ class CBot(commands.Bot):
 
     ZONEINFO: ClassVar[ZoneInfo] = ZoneInfo("America/Detroit")
     CHANNEL_ID: ClassVar[int] = 969972085445238784
+    CLOCK: ClassVar[ResetClock] = ResetClock(ZONEINFO)
     user: discord.ClientUser
 
     @classmethod
@@ -122,23 +230,24 @@ class CBot(commands.Bot):
         datetime.datetime
             The current day reset time in the bot's timezone.
         """
-        return (
-            datetime.datetime.now(cls.ZONEINFO).replace(microsecond=0, second=0, minute=0, hour=9)
-            if datetime.datetime.now(cls.ZONEINFO).replace(microsecond=0, second=0, minute=0, hour=9)
-            <= datetime.datetime.now(cls.ZONEINFO)
-            else datetime.datetime.now(cls.ZONEINFO).replace(microsecond=0, second=0, minute=0, hour=9)
-            - datetime.timedelta(days=1)
-        )
+        return cls.CLOCK()
 
     def __init__(
         self, *args: Any, strip_after_prefix: bool = True, tree_cls: type["Tree"], **kwargs: Any
     ) -> None:  # pragma: no cover
         super().__init__(*args, strip_after_prefix=strip_after_prefix, tree_cls=tree_cls, **kwargs)
         self.pool: asyncpg.Pool = MISSING
+        self.bus: InvalidationBus = MISSING
         self.program_logs: discord.Webhook = MISSING
         self.error_logs: discord.Webhook = MISSING
         self.holder: Holder = Holder()
         self.no_dms: set[int] = set()
+        self.points_ledger: PointsLedger | None = None
+        self.query_stats: QueryStats | None = None
+        self.budgets: ConnectionBudgets = MISSING
+        self.pool_warmup: asyncio.Task[int] | None = None
+        self.startup_time: float = 0.0
+        self.load_times: dict[str, float] = {}
 
     async def setup_hook(self):  # pragma: no cover
         """Initialize hook for the bot.
@@ -148,138 +257,129 @@ class CBot(commands.Bot):
         Also loads the cogs, and prints who the bot is logged in as
         """
         print("Setup started")
-        webhooks = Config["discord"]["webhooks"]
-        self.program_logs = await self.fetch_webhook(webhooks["program_logs"])
-        self.error_logs = await self.fetch_webhook(webhooks["error"])
+        started = time.perf_counter()
+        webhooks = Config.discord["webhooks"]
+        self.program_logs, self.error_logs = await asyncio.gather(
+            self.fetch_webhook(webhooks["program_logs"]), self.fetch_webhook(webhooks["error"])
+        )
         print("Webhooks Fetched")
-        await self.load_extension("jishaku")
-        for extension in EXTENSIONS:
-            await self.load_extension(extension)
-        print("Extensions loaded")
+        self.budgets = ConnectionBudgets(
+            self.pool, Config.postgres.get("pool_reserved", 2), Config.postgres.get("job_caps", {})
+        )
+        if Config.postgres.get("points_ledger", False):
+            self.points_ledger = PointsLedger(self.pool)
+            self.flush_points.start()
+            print("Points ledger enabled")
+        # Cogs subscribe to the bus as they load, so it has to be listening before the first cached read
+        await self.bus.start()
+        print("Invalidation bus listening")
+        print(f"Restored {self.holder.restore(STATE_FILE)} state entries")
+        # The extensions don't depend on each other, so they and their network warmups load concurrently
+        try:
+            async with asyncio.TaskGroup() as group:
+                for extension in ("jishaku", *EXTENSIONS):
+                    group.create_task(self._timed_load(extension))
+        except ExceptionGroup as failed:
+            # Fail startup with the error of the extension that broke first, as loading them one by one would
+            raise failed.exceptions[0] from None
+        self.startup_time = time.perf_counter() - started
+        print(f"Extensions loaded in {self.startup_time:.2f}s")
+        # The pool starts small so startup doesn't wait on it, the connections the bot usually needs are opened now
+        if isinstance(self.pool, InstrumentedPool) and (warmup := Config.postgres.get("pool_warmup", 4)):
+            self.pool_warmup = asyncio.create_task(self.pool.warmup(warmup))
+        for extension, took in sorted(self.load_times.items(), key=lambda item: item[1], reverse=True):
+            print(f"    {extension}: {took:.2f}s")
         print(f"Logged in: {self.user}")
 
-    async def give_game_points(self, member: discord.Member | discord.User, points: int, bonus: int = 0) -> int:
-        """Give the user points.
+    async def _timed_load(self, extension: str) -> None:  # pragma: no cover
+        began = time.perf_counter()
+        await self.load_extension(extension)
+        self.load_times[extension] = time.perf_counter() - began
 
-        Parameters
-        ----------
-        member: discord.Member
-            The member to give points to.
-        points : int
-            The amount of points to give.
-        bonus : int, optional
-            The amount of points to add to the user's total points.
+    def background(self, job: str) -> Budget:
+        """Get the connection budget of a background job.
 
-        Returns
-        -------
-        gained: int
-            The points gained
-        """
-        user = await self.pool.fetchrow(
-            "SELECT id, points, particip, won, "
-            "last_claim as daily, last_particip_dt as particip_dt "
-            "FROM users WHERE id = $1",
-            member.id,
-        )
-        if user is None:
-            return await self.first_time_game_gain(member.id, points, bonus)
-        if user["particip_dt"] < self.TIME():
-            return await self.first_of_day_game_gain(member.id, points, bonus)
-        if user["particip_dt"] == self.TIME():
-            return await self.fallback_game_gain(member.id, user["particip"], points, bonus)
-        return 0
-
-    async def fallback_game_gain(self, user: int, previous: int, points: int, bonus: int, /) -> int:
-        """Fallback game gain.
+        Long running jobs query through their budget instead of the pool, so they queue for connections rather than
+        take the ones reserved for handling messages.
 
         Parameters
         ----------
-        user : int
-            The user ID to give points to.
-        previous: int
-            The user's previous amount of participation points.
-        points : int
-            The amount of points to give.
-        bonus : int
-            The amount of bonus points to give.
+        job : str
+            The name of the job, which its cap is configured by.
 
         Returns
         -------
-        gained: int
-            The amount of points gained.
+        Budget
+            The budget, which can be used like the pool.
         """
-        if previous + points > 10:  # pragma: no branch
-            real_points = 10 - previous
-            bonus = -(-(real_points * bonus) // points)
-            points = real_points
-        async with self.pool.acquire() as conn:
-            await conn.execute(
-                "UPDATE users SET points = points + $1, particip = particip + $2, won = won + $3 WHERE id = $4",
-                points + bonus,
-                points,
-                bonus,
-                user,
-            )
-        return points + bonus
+        return self.budgets[job]
 
-    async def first_of_day_game_gain(self, user: int, points: int, bonus: int, /) -> int:
-        """Give the user points for the first time of the day.
+    async def give_game_points(self, member: discord.Member | discord.User, points: int, bonus: int = 0) -> int:
+        """Give the user points.
 
         Parameters
         ----------
-        user : int
-            The user to give points to.
+        member: discord.Member
+            The member to give points to.
         points : int
             The amount of points to give.
-        bonus : int
-            The amount of bonus points to give.
+        bonus : int, optional
+            The amount of points to add to the user's total points.
 
         Returns
         -------
         gained: int
-            The points gained.
+            The points gained
+
+        Notes
+        -----
+        The daily reset, the cap of 10 participation points a day and the scaling of the bonus are all done by the
+        ``give_game_points`` database function, in one round trip that locks the user's row. If the points ledger is
+        enabled, they are done in memory instead, and written later by :meth:`flush_points`.
         """
-        async with self.pool.acquire() as conn:
-            await conn.execute(
-                "UPDATE users SET last_particip_dt = $1, points = points + $2, particip = $3, won = $4 WHERE id = $5",
-                self.TIME(),
-                points + bonus,
-                points,
-                bonus,
-                user,
+        if self.points_ledger is not None:
+            return await self.points_ledger.award(member.id, points, bonus, self.TIME())
+        return await give_game_points(self.pool, member.id, points, bonus, self.TIME())
+
+    @tasks.loop(seconds=10)
+    async def flush_points(self) -> None:
+        """Write the game points awarded since the last flush."""
+        if self.points_ledger is None:  # pragma: no cover
+            return
+        try:
+            await self.points_ledger.flush()
+        except (asyncpg.PostgresError, OSError):
+            logging.getLogger("charbot.points").exception(
+                "Failed to flush %s game point awards, retrying later", len(self.points_ledger)
             )
-        return points + bonus
 
-    async def first_time_game_gain(self, user: int, points: int, bonus: int, /) -> int:
-        """Give the user points for the first time.
+    async def close(self) -> None:  # pragma: no cover
+        """Close the bot, then write any game points that are still pending, and the state the cogs left behind.
 
-        Parameters
-        ----------
-        user : int
-            The user id to give points to.
-        points : int
-            The amount of points to give.
-        bonus : int
-            The amount of bonus points to give.
-
-        Returns
-        -------
-        gained: int
-            The points gained
+        Each step runs even if the ones before it failed, the game points go first since the pool is still open.
         """
-        time = self.TIME()
-        async with self.pool.acquire() as conn:
-            await conn.execute(
-                "INSERT INTO users (id, points, last_claim, last_particip_dt, particip, won) "
-                "VALUES ($1, $2, $3, $4, $5, $6)",
-                user,
-                points + bonus,
-                time - datetime.timedelta(days=1),
-                time,
-                points,
-                bonus,
-            )
-            return points + bonus
+        self.flush_points.cancel()
+        if self.pool_warmup is not None:
+            self.pool_warmup.cancel()
+        try:
+            await super().close()
+        finally:
+            if self.points_ledger is not None:
+                try:
+                    await self.points_ledger.flush()
+                except Exception:  # skipcq: PYL-W0703
+                    logging.getLogger("charbot.points").exception(
+                        "Failed to flush the game points on shutdown, %s awards were dropped", len(self.points_ledger)
+                    )
+            # The cogs have been unloaded by now, so their state is in the holder
+            try:
+                print(f"Saved {self.holder.save(STATE_FILE)} state entries")
+            except Exception:  # skipcq: PYL-W0703
+                logging.getLogger("charbot.state").exception("Failed to save the state to %s", STATE_FILE)
+            try:
+                await self.bus.close()
+            except Exception:  # skipcq: PYL-W0703
+                logging.getLogger("charbot.bus").exception("Failed to close the invalidation bus")
 
     # for some reason deepsource doesn't like this, so i'm skipcq'ing the definition header
     async def on_command_error(
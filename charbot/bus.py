@@ -0,0 +1,172 @@
+"""Invalidation of cached tables, published by triggers over Postgres LISTEN/NOTIFY."""
+
+import asyncio
+import logging
+from collections import defaultdict
+from collections.abc import Awaitable, Callable
+from typing import NamedTuple, cast
+
+import asyncpg
+import orjson
+
+
+__all__ = ("CHANNEL", "RESYNC", "Invalidation", "InvalidationBus", "Subscriber")
+
+_LOGGER = logging.getLogger("charbot.bus")
+
+# The channel the notify_invalidation trigger publishes on
+CHANNEL = "charbot_invalidate"
+
+# Sent to every subscriber after the bus reconnects, changes made while it was disconnected were missed
+RESYNC = "RESYNC"
+
+
+class Invalidation(NamedTuple):
+    """A change to a row of a cached table.
+
+    Attributes
+    ----------
+    table : str
+        The table that was changed.
+    op : str
+        INSERT, UPDATE, DELETE or TRUNCATE, or :data:`RESYNC` when the changes aren't known.
+    key : int | None
+        The key of the changed row, None if the whole table has to be read again.
+    """
+
+    table: str
+    op: str
+    key: int | None
+
+
+# Called with every invalidation of the tables it's subscribed to
+type Subscriber = Callable[[Invalidation], Awaitable[None]]
+
+
+class InvalidationBus:
+    """Listens for changes to cached tables and hands them to the cogs that cache them.
+
+    Subscribers are called one at a time in the order the changes were committed, so a subscriber that reads the row
+    again never overwrites a newer read with an older one. The bus holds its own connection rather than one of the
+    pool's, and reconnects if it is lost.
+
+    Parameters
+    ----------
+    connect : Callable[[], Awaitable[asyncpg.Connection]]
+        Opens the connection to listen on.
+    retry : float
+        Seconds to wait between attempts to reconnect.
+    """
+
+    def __init__(self, connect: Callable[[], Awaitable[asyncpg.Connection]], *, retry: float = 5.0):
+        self._connect = connect
+        self._retry = retry
+        self._subscribers: defaultdict[str, list[Subscriber]] = defaultdict(list)
+        self._queue: asyncio.Queue[Invalidation] = asyncio.Queue()
+        self._conn: asyncpg.Connection | None = None
+        self._worker: asyncio.Task[None] | None = None
+        self._reconnect: asyncio.Task[None] | None = None
+        self._closed = False
+
+    def __repr__(self) -> str:
+        return f"<InvalidationBus connected={self.connected} tables={sorted(self._subscribers)}>"
+
+    @property
+    def connected(self) -> bool:
+        """Whether the bus is listening for changes."""
+        return self._conn is not None and not self._conn.is_closed()
+
+    def subscribe(self, table: str, subscriber: Subscriber) -> None:
+        """Call a subscriber with every change to a table.
+
+        Parameters
+        ----------
+        table : str
+            The table to watch.
+        subscriber : Subscriber
+            The coroutine function to call with the changes.
+        """
+        self._subscribers[table].append(subscriber)
+
+    def unsubscribe(self, table: str, subscriber: Subscriber) -> None:
+        """Stop calling a subscriber with the changes to a table, nothing happens if it isn't subscribed.
+
+        Parameters
+        ----------
+        table : str
+            The table that was watched.
+        subscriber : Subscriber
+            The subscriber to remove.
+        """
+        if subscriber in (subscribers := self._subscribers.get(table, [])):
+            subscribers.remove(subscriber)
+            if not subscribers:
+                del self._subscribers[table]
+
+    async def start(self) -> None:
+        """Connect and start handing out changes."""
+        self._closed = False
+        self._worker = asyncio.create_task(self._deliver())
+        await self._listen()
+
+    async def close(self) -> None:
+        """Stop listening, changes that were already received are dropped."""
+        self._closed = True
+        for task in (self._reconnect, self._worker):
+            if task is not None:
+                task.cancel()
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+    def publish(self, invalidation: Invalidation) -> None:
+        """Hand a change to the subscribers of its table.
+
+        Parameters
+        ----------
+        invalidation : Invalidation
+            The change.
+        """
+        if invalidation.table in self._subscribers:
+            self._queue.put_nowait(invalidation)
+
+    async def _listen(self) -> None:
+        conn = await self._connect()
+        await conn.add_listener(CHANNEL, self._on_notification)
+        conn.add_termination_listener(self._on_termination)
+        self._conn = conn
+
+    def _on_notification(self, _conn: object, _pid: int, _channel: str, payload: object) -> None:
+        try:
+            data = orjson.loads(cast("str", payload))
+            self.publish(Invalidation(data["table"], data["op"], data["key"]))
+        except (orjson.JSONDecodeError, KeyError, TypeError):
+            _LOGGER.exception("Ignoring malformed invalidation %r", payload)
+
+    def _on_termination(self, _conn: object) -> None:
+        self._conn = None
+        if not self._closed:
+            _LOGGER.warning("Lost the invalidation connection, reconnecting")
+            self._reconnect = asyncio.create_task(self._reconnect_loop())
+
+    async def _reconnect_loop(self) -> None:
+        while not self._closed:
+            await asyncio.sleep(self._retry)
+            try:
+                await self._listen()
+            except (OSError, asyncpg.PostgresError):
+                _LOGGER.warning("Failed to reconnect the invalidation bus, retrying in %ss", self._retry)
+                continue
+            # Anything could have changed while nobody was listening
+            for table in tuple(self._subscribers):
+                self.publish(Invalidation(table, RESYNC, None))
+            return
+
+    async def _deliver(self) -> None:
+        while True:
+            invalidation = await self._queue.get()
+            for subscriber in tuple(self._subscribers.get(invalidation.table, ())):
+                try:
+                    await subscriber(invalidation)
+                except Exception:
+                    _LOGGER.exception("Subscriber %r failed to handle %s", subscriber, invalidation)
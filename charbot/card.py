@@ -1,5 +1,6 @@
 """Card generator for Charbot."""
 
+import functools
 import math
 import pathlib
 from collections.abc import Callable
@@ -20,9 +21,10 @@ __IDLE__: Final[pathlib.Path] = __BASE_PATH__ / "idle.png"
 __DND__: Final[pathlib.Path] = __BASE_PATH__ / "dnd.png"
 __STREAMING__: Final[pathlib.Path] = __BASE_PATH__ / "streaming.png"
 __FONT__: Final[str] = str(__BASE_PATH__ / "font2.ttf")
-__SMALL_FONT__: Final[ImageFont.FreeTypeFont] = ImageFont.truetype(str(__BASE_PATH__ / "font.ttf"), 20)
-__NORMAL_FONT__: Final[ImageFont.FreeTypeFont] = ImageFont.truetype(__FONT__, 36)
-__SIGNA_FONT__: Final[ImageFont.FreeTypeFont] = ImageFont.truetype(__FONT__, 25)
+# (path, size) of each font, they are loaded by _font the first time a card is drawn
+__SMALL_FONT__: Final[tuple[str, int]] = (str(__BASE_PATH__ / "font.ttf"), 20)
+__NORMAL_FONT__: Final[tuple[str, int]] = (__FONT__, 36)
+__SIGNA_FONT__: Final[tuple[str, int]] = (__FONT__, 25)
 __WHITE__: Final[tuple[int, int, int]] = (255, 255, 255)
 __DARK__: Final[tuple[int, int, int]] = (252, 179, 63)
 __YELLOW__: Final[tuple[int, int, int]] = (255, 234, 167)
@@ -31,6 +33,11 @@ __XP_AS_STR__: Final[Callable[[int], str]] = lambda xp: (
 )
 
 
+@functools.cache
+def _font(path: str, size: int) -> ImageFont.FreeTypeFont:
+    return ImageFont.truetype(path, size)
+
+
 def _overlay(card: Image.Image, profile: Image.Image, status: Image.Image, percentage: float, ellipse: bool) -> BytesIO:
     # Add another blank layer for the progress bar
     # Because drawing on card doesn't make their background transparent
@@ -130,14 +137,14 @@ def generate_card(
     mask_draw.ellipse((29, 29, 209, 209), fill=(255, 25, 255, 255))  # The part need to be cropped
 
     draw = ImageDraw.Draw(card)
-    draw.text((245, 22), pool_name, __WHITE__, font=__NORMAL_FONT__)
-    draw.text((245, 98), f"Pool Level {level}", __WHITE__, font=__SMALL_FONT__)
-    draw.text((245, 123), reward, __WHITE__, font=__SMALL_FONT__)
+    draw.text((245, 22), pool_name, __WHITE__, font=_font(*__NORMAL_FONT__))
+    draw.text((245, 98), f"Pool Level {level}", __WHITE__, font=_font(*__SMALL_FONT__))
+    draw.text((245, 123), reward, __WHITE__, font=_font(*__SMALL_FONT__))
     draw.text(
         (245, 150),
         f"Rep {__XP_AS_STR__(current_rep)}/{__XP_AS_STR__(completed_rep)}",
         __WHITE__,
-        font=__SMALL_FONT__,
+        font=_font(*__SMALL_FONT__),
     )
 
     xp_need = completed_rep - base_rep
@@ -196,14 +203,14 @@ def generate_profile(  # pragma: no cover
     mask_draw.ellipse((29, 29, 209, 209), fill=(255, 25, 255, 255))  # The part need to be cropped
 
     draw = ImageDraw.Draw(card)
-    draw.text((245, 22), user_name, __WHITE__, font=__NORMAL_FONT__)
-    draw.text((245, 98), f"Rank #{user_position}", __WHITE__, font=__SMALL_FONT__)
-    draw.text((245, 123), f"Level {level}", __WHITE__, font=__SMALL_FONT__)
+    draw.text((245, 22), user_name, __WHITE__, font=_font(*__NORMAL_FONT__))
+    draw.text((245, 98), f"Rank #{user_position}", __WHITE__, font=_font(*__SMALL_FONT__))
+    draw.text((245, 123), f"Level {level}", __WHITE__, font=_font(*__SMALL_FONT__))
     draw.text(
         (245, 150),
         f"Exp {__XP_AS_STR__(user_xp)}/{__XP_AS_STR__(next_xp)}",
         __WHITE__,
-        font=__SMALL_FONT__,
+        font=_font(*__SMALL_FONT__),
     )
 
     xp_need = next_xp - current_xp
@@ -0,0 +1,99 @@
+"""The daily reset clock."""
+
+import datetime
+import time
+from zoneinfo import ZoneInfo
+
+
+__all__ = ("ResetClock",)
+
+
+class ResetClock:
+    """The time of the last daily reset, cached until the next one.
+
+    The reset is worked out once per day, after that each call is one comparison against the time of the next reset,
+    and every caller gets the same datetime object until then.
+
+    Parameters
+    ----------
+    zone : ZoneInfo
+        The timezone the reset happens in.
+    hour : int
+        The hour of the day, in ``zone``, that the reset happens at.
+    """
+
+    __slots__ = ("_current", "_frozen", "_next", "hour", "zone")
+
+    def __init__(self, zone: ZoneInfo, hour: int = 9):
+        self.zone = zone
+        self.hour = hour
+        self._frozen: float | None = None
+        self._current = datetime.datetime.min.replace(tzinfo=zone)
+        # The POSIX time of the next reset, so the fast path doesn't need to build a datetime
+        self._next = float("-inf")
+
+    def __call__(self) -> datetime.datetime:
+        """Get the time of the last reset.
+
+        Returns
+        -------
+        datetime.datetime
+            The time of the last reset, in the clock's timezone.
+        """
+        now = time.time() if self._frozen is None else self._frozen
+        if now >= self._next:
+            self._update(now)
+        return self._current
+
+    def now(self) -> datetime.datetime:
+        """Get the current time of the clock, which is the frozen time if it is frozen.
+
+        Returns
+        -------
+        datetime.datetime
+            The current time, in the clock's timezone.
+        """
+        return datetime.datetime.fromtimestamp(time.time() if self._frozen is None else self._frozen, self.zone)
+
+    def freeze(self, at: datetime.datetime) -> None:
+        """Stop the clock at a time, for tests.
+
+        Parameters
+        ----------
+        at : datetime.datetime
+            The aware time to stop at.
+        """
+        self._frozen = at.timestamp()
+        # The clock may have been moved back, so the cached reset can't be trusted
+        self._next = float("-inf")
+
+    def advance(self, delta: datetime.timedelta) -> None:
+        """Move a frozen clock forward.
+
+        Parameters
+        ----------
+        delta : datetime.timedelta
+            How far to move the clock.
+
+        Raises
+        ------
+        RuntimeError
+            If the clock isn't frozen.
+        """
+        if self._frozen is None:
+            raise RuntimeError("Only a frozen clock can be advanced.")
+        self._frozen += delta.total_seconds()
+
+    def unfreeze(self) -> None:
+        """Let the clock follow the real time again."""
+        self._frozen = None
+        self._next = float("-inf")
+
+    def _update(self, now: float) -> None:
+        current = datetime.datetime.fromtimestamp(now, self.zone)
+        reset = current.replace(microsecond=0, second=0, minute=0, hour=self.hour)
+        if reset > current:
+            reset -= datetime.timedelta(days=1)
+        self._current = reset
+        # Wall clock arithmetic, so the reset stays at the same hour across DST changes
+        self._next = (reset + datetime.timedelta(days=1)).timestamp()
@@ -0,0 +1,661 @@
+"""Statistics for the queries run through the database pool, the pool itself, and the budgets of background jobs."""
+
+import asyncio
+import bisect
+import contextlib
+import logging
+import re
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable, Generator, Iterable, Iterator, Mapping
+from typing import Any, Literal, NamedTuple, cast
+
+import asyncpg
+from asyncpg.connection import LoggedQuery
+from asyncpg.pool import PoolAcquireContext, PoolConnectionProxy
+from asyncpg.prepared_stmt import PreparedStatement
+
+
+__all__ = (
+    "BUCKETS",
+    "Budget",
+    "Connection",
+    "ConnectionBudgets",
+    "InstrumentedPool",
+    "Order",
+    "PoolMetrics",
+    "QueryStats",
+    "StatementStats",
+    "create_pool",
+    "normalize",
+)
+
+_LOGGER = logging.getLogger("charbot.db")
+_SLOW_LOGGER = logging.getLogger("charbot.db.slow")
+
+# Upper bounds of the latency histogram buckets in milliseconds, anything slower goes in one more bucket at the end
+BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+_WHITESPACE = re.compile(r"\s+")
+
+# What statements can be ranked by
+Order = Literal["total", "count", "mean", "max"]
+
+
+def normalize(query: str) -> str:
+    """Collapse the whitespace of a query, so the same statement is always counted under the same text.
+
+    The queries are parametrized, so their text doesn't vary with the values they are run with.
+
+    Parameters
+    ----------
+    query : str
+        The query.
+
+    Returns
+    -------
+    str
+        The query on one line.
+    """
+    return _WHITESPACE.sub(" ", query).strip()
+
+
+class StatementStats:
+    """The latencies of one statement, or of acquiring connections.
+
+    Attributes
+    ----------
+    count : int
+        How many times it was run.
+    errors : int
+        How many of the runs raised.
+    total : float
+        The sum of the latencies, in seconds.
+    max : float
+        The highest latency, in seconds.
+    buckets : list[int]
+        The number of runs in each latency bucket, see :data:`BUCKETS`.
+    """
+
+    __slots__ = ("buckets", "count", "errors", "max", "total")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def __repr__(self) -> str:
+        return f"<StatementStats count={self.count} mean={self.mean * 1000:.2f}ms max={self.max * 1000:.2f}ms>"
+
+    def record(self, elapsed: float, failed: bool = False) -> None:
+        """Add a run.
+
+        Parameters
+        ----------
+        elapsed : float
+            How long it took, in seconds.
+        failed : bool
+            Whether it raised.
+        """
+        self.count += 1
+        self.errors += failed
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.buckets[bisect.bisect_left(BUCKETS, elapsed * 1000)] += 1
+
+    @property
+    def mean(self) -> float:
+        """The mean latency, in seconds."""
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q: float) -> float:
+        """Estimate a latency percentile from the histogram.
+
+        Parameters
+        ----------
+        q : float
+            The percentile, between 0 and 100.
+
+        Returns
+        -------
+        float
+            The upper bound of the bucket the percentile falls in, in seconds. The slowest bucket has no upper bound,
+            so the highest latency is used for it.
+        """
+        if not self.count:
+            return 0.0
+        target = self.count * q / 100
+        seen = 0
+        for bound, amount in zip(BUCKETS, self.buckets, strict=False):
+            seen += amount
+            if seen >= target:
+                return min(bound / 1000, self.max)
+        return self.max
+
+
+class QueryStats:
+    """Counts and latencies of every statement run on a pool, and of the waits for a connection.
+
+    Parameters
+    ----------
+    slow_threshold : float
+        Queries that take longer than this many seconds are logged to the ``charbot.db.slow`` logger.
+
+    Attributes
+    ----------
+    waiting : int
+        The acquires that are waiting for a connection right now.
+    peak_waiting : int
+        The most acquires that were waiting at once.
+    peak_in_use : int
+        The most connections that were in use at once.
+    """
+
+    __slots__ = ("acquire", "peak_in_use", "peak_waiting", "since", "slow_threshold", "statements", "waiting")
+
+    def __init__(self, slow_threshold: float = 0.5):
+        self.slow_threshold = slow_threshold
+        self.statements: dict[str, StatementStats] = {}
+        self.acquire = StatementStats()
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.peak_in_use = 0
+        self.since = time.monotonic()
+
+    def record(self, query: str, elapsed: float, exception: BaseException | None = None) -> None:
+        """Add a query run.
+
+        Parameters
+        ----------
+        query : str
+            The query that was run.
+        elapsed : float
+            How long it took, in seconds.
+        exception : BaseException | None
+            What it raised, if anything.
+        """
+        statement = normalize(query)
+        if (stats := self.statements.get(statement)) is None:
+            stats = self.statements[statement] = StatementStats()
+        stats.record(elapsed, exception is not None)
+        if elapsed >= self.slow_threshold:
+            _SLOW_LOGGER.warning(
+                "Slow query took %.1fms%s: %s",
+                elapsed * 1000,
+                "" if exception is None else f" and raised {type(exception).__name__}",
+                statement,
+            )
+
+    def record_query(self, record: LoggedQuery) -> None:
+        """Add a query run, this is registered as a query logger on every connection of the pool.
+
+        Parameters
+        ----------
+        record : LoggedQuery
+            The query that was run.
+        """
+        self.record(record.query, record.elapsed, record.exception)
+
+    def record_acquire(self, elapsed: float, failed: bool = False, in_use: int = 0) -> None:
+        """Add a wait for a connection from the pool.
+
+        Parameters
+        ----------
+        elapsed : float
+            How long the wait took, in seconds.
+        failed : bool
+            Whether the wait timed out or raised.
+        in_use : int
+            The connections in use once the wait was over.
+        """
+        self.acquire.record(elapsed, failed)
+        self.peak_in_use = max(self.peak_in_use, in_use)
+
+    def top(self, count: int = 10, order: Order = "total") -> list[tuple[str, StatementStats]]:
+        """Get the statements that took the most time.
+
+        Parameters
+        ----------
+        count : int
+            How many statements to get.
+        order : Literal["total", "count", "mean", "max"]
+            What to rank the statements by.
+
+        Returns
+        -------
+        list[tuple[str, StatementStats]]
+            The statements and their stats, highest first.
+        """
+        return sorted(self.statements.items(), key=lambda item: getattr(item[1], order), reverse=True)[:count]
+
+    def report(self, count: int = 10, order: Order = "total", pool: "InstrumentedPool | None" = None) -> str:
+        """Format the top statements and the connection waits as a table.
+
+        Parameters
+        ----------
+        count : int
+            How many statements to include.
+        order : Literal["total", "count", "mean", "max"]
+            What to rank the statements by.
+        pool : InstrumentedPool | None
+            The pool to describe above the table, if any.
+
+        Returns
+        -------
+        str
+            The table.
+        """
+        lines = []
+        if pool is not None:
+            metrics = pool.metrics()
+            lines.append(
+                f"Pool: {metrics.size} open of {metrics.min_size}-{metrics.max_size}, {metrics.in_use} in use "
+                f"(peak {self.peak_in_use}), {metrics.waiting} waiting (peak {self.peak_waiting})"
+            )
+        lines += [
+            f"{len(self.statements)} statements over {time.monotonic() - self.since:.0f}s, by {order}",
+            f"{'count':>7} {'total ms':>10} {'mean':>7} {'p95':>7} {'max':>7} {'err':>4}  statement",
+        ]
+        rows: list[tuple[str, StatementStats]] = [("<acquire connection>", self.acquire), *self.top(count, order)]
+        for statement, stats in rows:
+            lines.append(
+                f"{stats.count:>7} {stats.total * 1000:>10.1f} {stats.mean * 1000:>7.2f} "
+                f"{stats.percentile(95) * 1000:>7.2f} {stats.max * 1000:>7.2f} {stats.errors:>4}  {statement[:100]}"
+            )
+        return "\n".join(lines)
+
+    def reset(self) -> None:
+        """Forget everything recorded so far."""
+        self.statements.clear()
+        self.acquire = StatementStats()
+        self.peak_waiting = self.waiting
+        self.peak_in_use = 0
+        self.since = time.monotonic()
+
+
+class PoolMetrics(NamedTuple):
+    """The connections of a pool at a point in time."""
+
+    size: int
+    idle: int
+    in_use: int
+    waiting: int
+    min_size: int
+    max_size: int
+
+
+class _TimedAcquire(PoolAcquireContext):
+    """Acquire a connection, and record how long the wait for it took."""
+
+    __slots__ = ("stats",)
+
+    def __init__(self, pool: asyncpg.Pool, timeout: float | None, stats: QueryStats):
+        super().__init__(pool, timeout)
+        self.stats = stats
+
+    @contextlib.contextmanager
+    def _timed(self) -> Iterator[None]:
+        stats = self.stats
+        stats.waiting += 1
+        stats.peak_waiting = max(stats.peak_waiting, stats.waiting)
+        started = time.perf_counter()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            stats.waiting -= 1
+            in_use = self.pool.get_size() - self.pool.get_idle_size()
+            stats.record_acquire(time.perf_counter() - started, failed, in_use)
+
+    async def __aenter__(self):
+        with self._timed():
+            return await super().__aenter__()
+
+    def __await__(self) -> Generator[Any, None, Any]:
+        with self._timed():
+            return (yield from super().__await__())
+
+
+class Connection(asyncpg.Connection):
+    """A connection that keeps statements prepared, so they are parsed and planned once when it connects.
+
+    :meth:`fetch`, :meth:`fetchrow`, :meth:`fetchval` and :meth:`execute` run a query with its prepared statement when
+    its text is one of them, and as usual otherwise. Prepared statements don't go through the query loggers, so their
+    runs are recorded in :attr:`stats` directly.
+
+    Attributes
+    ----------
+    prepared : dict[str, PreparedStatement]
+        The prepared statements, by their text.
+    stats : QueryStats | None
+        Where to record the runs of the prepared statements.
+    """
+
+    __slots__ = ("prepared", "stats")
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.prepared: dict[str, PreparedStatement] = {}
+        self.stats: QueryStats | None = None
+
+    async def prepare_statements(self, statements: Iterable[str]) -> int:
+        """Prepare statements to be used by the query methods.
+
+        A statement that fails to prepare is logged and left to run unprepared.
+
+        Parameters
+        ----------
+        statements : Iterable[str]
+            The text of each statement.
+
+        Returns
+        -------
+        int
+            How many statements were prepared.
+        """
+        for query in statements:
+            try:
+                self.prepared[query] = await self.prepare(query)
+            except asyncpg.PostgresError:
+                _LOGGER.exception("Failed to prepare %s", normalize(query))
+        return len(self.prepared)
+
+    @contextlib.contextmanager
+    def _timed(self, query: str) -> Iterator[None]:
+        started = time.perf_counter()
+        exception = None
+        try:
+            yield
+        except BaseException as error:
+            exception = error
+            raise
+        finally:
+            if self.stats is not None:
+                self.stats.record(query, time.perf_counter() - started, exception)
+
+    def _statement(self, query: str, record_class: type | None = None) -> PreparedStatement | None:
+        return self.prepared.get(query) if record_class is None else None
+
+    async def fetch(self, query: str, *args: Any, timeout: float | None = None, record_class: Any = None) -> Any:
+        """Run a query and get all its rows, see :meth:`asyncpg.Connection.fetch`."""
+        if (prepared := self._statement(query, record_class)) is None:
+            return await super().fetch(query, *args, timeout=timeout, record_class=record_class)
+        with self._timed(query):
+            return await prepared.fetch(*args, timeout=timeout)
+
+    async def fetchrow(self, query: str, *args: Any, timeout: float | None = None, record_class: Any = None) -> Any:
+        """Run a query and get its first row, see :meth:`asyncpg.Connection.fetchrow`."""
+        if (prepared := self._statement(query, record_class)) is None:
+            return await super().fetchrow(query, *args, timeout=timeout, record_class=record_class)
+        with self._timed(query):
+            return await prepared.fetchrow(*args, timeout=timeout)
+
+    async def fetchval(self, query: str, *args: Any, column: int = 0, timeout: float | None = None) -> Any:
+        """Run a query and get a value of its first row, see :meth:`asyncpg.Connection.fetchval`."""
+        if (prepared := self._statement(query)) is None:
+            return await super().fetchval(query, *args, column=column, timeout=timeout)
+        with self._timed(query):
+            return await prepared.fetchval(*args, column=column, timeout=timeout)
+
+    async def execute(self, query: str, *args: Any, timeout: float | None = None) -> str:
+        """Run a statement and get its status, see :meth:`asyncpg.Connection.execute`."""
+        if (prepared := self._statement(query)) is None:
+            return await super().execute(query, *args, timeout=timeout)
+        with self._timed(query):
+            await prepared.fetch(*args, timeout=timeout)
+        return prepared.get_statusmsg() or ""
+
+
+class InstrumentedPool(asyncpg.Pool):
+    """A pool that records its queries and connection waits in a :class:`QueryStats`.
+
+    Takes the same arguments as :class:`asyncpg.Pool`, and the stats to record to. The query logger is added to each
+    connection before the ``init`` callback runs.
+
+    The pool is meant to start small and grow on demand up to ``max_size``. Connections that sit idle for
+    ``max_inactive_connection_lifetime`` seconds are closed, which shrinks it back when the bot is quiet.
+
+    Parameters
+    ----------
+    stats : QueryStats
+        Where to record the queries.
+    statements : Iterable[str]
+        Statements to prepare on each connection, if the pool's ``connection_class`` is :class:`Connection`.
+    """
+
+    __slots__ = ("stats",)
+
+    def __init__(
+        self,
+        *connect_args: Any,
+        stats: QueryStats,
+        statements: Iterable[str] = (),
+        init: Callable[[asyncpg.Connection], Awaitable[None]] | None = None,
+        **kwargs: Any,
+    ):
+        statements = tuple(statements)
+
+        async def _init(conn: asyncpg.Connection) -> None:
+            conn.add_query_logger(stats.record_query)
+            # isinstance is true for any connection, asyncpg's metaclass only checks for its own base class
+            if issubclass(type(conn), Connection):
+                prepared = cast(Connection, conn)
+                prepared.stats = stats
+                await prepared.prepare_statements(statements)
+            if init is not None:
+                await init(conn)
+
+        super().__init__(*connect_args, init=_init, **kwargs)
+        self.stats = stats
+
+    def acquire(self, *, timeout: float | None = None) -> PoolAcquireContext:
+        """Acquire a connection from the pool, timing the wait."""
+        return _TimedAcquire(self, timeout, self.stats)
+
+    def metrics(self) -> PoolMetrics:
+        """Get the connections of the pool right now.
+
+        Returns
+        -------
+        PoolMetrics
+            The open, idle, in use and waiting connections, and the size limits.
+        """
+        size, idle = self.get_size(), self.get_idle_size()
+        return PoolMetrics(size, idle, size - idle, self.stats.waiting, self.get_min_size(), self.get_max_size())
+
+    async def warmup(self, count: int) -> int:
+        """Open connections until ``count`` are open, so the first commands after startup don't wait for them.
+
+        The connections are opened concurrently, and the waits aren't recorded. A connection that fails to open is
+        logged, it is opened again when it's needed.
+
+        Parameters
+        ----------
+        count : int
+            How many connections should be open, capped to ``max_size``.
+
+        Returns
+        -------
+        int
+            How many connections are open afterwards.
+        """
+        target = min(count, self.get_max_size())
+        if self.get_size() < target:
+            try:
+                # Holding every connection until all are acquired makes each acquire take a different one
+                async with contextlib.AsyncExitStack() as stack, asyncio.TaskGroup() as group:
+                    for _ in range(target):
+                        group.create_task(stack.enter_async_context(asyncpg.Pool.acquire(self)))
+            except* (OSError, asyncpg.PostgresError):
+                _LOGGER.exception("Failed to warm up the pool to %s connections", target)
+        return self.get_size()
+
+
+def create_pool(stats: QueryStats, **kwargs: Any) -> InstrumentedPool:
+    """Create an :class:`InstrumentedPool` of :class:`Connection`, otherwise like :func:`asyncpg.create_pool`.
+
+    Parameters
+    ----------
+    stats : QueryStats
+        Where to record the queries.
+    **kwargs : Any
+        Passed to the pool.
+
+    Returns
+    -------
+    InstrumentedPool
+        The pool, which still has to be awaited or entered to connect.
+    """
+    defaults: dict[str, Any] = {
+        "min_size": 10,
+        "max_size": 10,
+        "max_queries": 50000,
+        "max_inactive_connection_lifetime": 300.0,
+        "loop": None,
+        "connection_class": Connection,
+        "record_class": asyncpg.Record,
+    }
+    _LOGGER.debug("Creating a pool that logs queries slower than %.0fms", stats.slow_threshold * 1000)
+    return InstrumentedPool(stats=stats, **(defaults | kwargs))
+
+
+class Budget:
+    """The connections one background job may take from the pool.
+
+    Has the same query shortcuts as :class:`asyncpg.Pool`, so it can be used in its place. Every acquire waits for a
+    free slot of the job first, and then for the capacity shared by all background jobs.
+
+    Parameters
+    ----------
+    pool : asyncpg.Pool
+        The pool to acquire from.
+    name : str
+        The name of the job.
+    cap : int
+        The most connections the job may hold at once.
+    shared : asyncio.Semaphore
+        The capacity shared by all background jobs.
+
+    Attributes
+    ----------
+    active : int
+        The connections the job holds right now.
+    waiting : int
+        The acquires of the job that are queued.
+    """
+
+    __slots__ = ("_own", "_shared", "active", "cap", "name", "pool", "waiting")
+
+    def __init__(self, pool: asyncpg.Pool, name: str, cap: int, shared: asyncio.Semaphore):
+        self.pool = pool
+        self.name = name
+        self.cap = cap
+        self._own = asyncio.Semaphore(cap)
+        self._shared = shared
+        self.active = 0
+        self.waiting = 0
+
+    def __repr__(self) -> str:
+        return f"<Budget {self.name!r} active={self.active}/{self.cap} waiting={self.waiting}>"
+
+    @contextlib.asynccontextmanager
+    async def acquire(self) -> AsyncIterator[PoolConnectionProxy]:
+        """Acquire a connection once the job is within its budget.
+
+        Yields
+        ------
+        PoolConnectionProxy
+            The connection, released when the context exits.
+        """
+        self.waiting += 1
+        try:
+            # The job's own slot comes first, so a job over its cap doesn't hold shared capacity while it waits
+            await self._own.acquire()
+            try:
+                await self._shared.acquire()
+            except BaseException:
+                self._own.release()
+                raise
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        try:
+            async with self.pool.acquire() as conn:
+                yield conn
+        finally:
+            self.active -= 1
+            self._shared.release()
+            self._own.release()
+
+    async def execute(self, query: str, *args: Any) -> str:
+        """Run a statement, see :meth:`asyncpg.Pool.execute`."""
+        async with self.acquire() as conn:
+            return await conn.execute(query, *args)
+
+    async def fetch(self, query: str, *args: Any) -> list[asyncpg.Record]:
+        """Run a query and get all its rows, see :meth:`asyncpg.Pool.fetch`."""
+        async with self.acquire() as conn:
+            return await conn.fetch(query, *args)
+
+    async def fetchrow(self, query: str, *args: Any) -> asyncpg.Record | None:
+        """Run a query and get its first row, see :meth:`asyncpg.Pool.fetchrow`."""
+        async with self.acquire() as conn:
+            return await conn.fetchrow(query, *args)
+
+    async def fetchval(self, query: str, *args: Any, column: int = 0) -> Any:
+        """Run a query and get a value of its first row, see :meth:`asyncpg.Pool.fetchval`."""
+        async with self.acquire() as conn:
+            return await conn.fetchval(query, *args, column=column)
+
+
+class ConnectionBudgets:
+    """The budgets of the background jobs sharing a pool with the hot path.
+
+    Message handling and commands use the pool directly. Background jobs go through the :class:`Budget` of their
+    name, which keeps ``reserved`` connections of the pool free for the hot path, and caps each job on its own, so
+    jobs queue for connections instead of taking the ones processing XP needs.
+
+    Parameters
+    ----------
+    pool : asyncpg.Pool
+        The pool the jobs share.
+    reserved : int
+        How many connections of the pool background jobs can never take, at least one is always left to them.
+    caps : Mapping[str, int]
+        The most connections each job may hold at once, by name.
+    default_cap : int
+        The cap of jobs that aren't in ``caps``.
+    """
+
+    __slots__ = ("_budgets", "_shared", "capacity", "caps", "default_cap", "pool")
+
+    def __init__(self, pool: asyncpg.Pool, reserved: int, caps: Mapping[str, int] | None = None, default_cap: int = 1):
+        self.pool = pool
+        self.capacity = max(pool.get_max_size() - reserved, 1)
+        self.caps = dict(caps or {})
+        self.default_cap = default_cap
+        self._shared = asyncio.Semaphore(self.capacity)
+        self._budgets: dict[str, Budget] = {}
+
+    def __getitem__(self, job: str) -> Budget:
+        if (budget := self._budgets.get(job)) is None:
+            cap = min(self.caps.get(job, self.default_cap), self.capacity)
+            budget = self._budgets[job] = Budget(self.pool, job, cap, self._shared)
+        return budget
+
+    def report(self) -> str:
+        """Describe the connections each job holds and waits for.
+
+        Returns
+        -------
+        str
+            One line per job that has used its budget.
+        """
+        lines = [f"Background capacity: {sum(budget.active for budget in self._budgets.values())}/{self.capacity}"]
+        lines.extend(
+            f"    {name}: {budget.active}/{budget.cap} active, {budget.waiting} waiting"
+            for name, budget in sorted(self._budgets.items())
+        )
+        return "\n".join(lines)
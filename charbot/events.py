@@ -1,7 +1,9 @@
 """Event handling for Charbot."""
 # cspell: ignore modmail
 
+import asyncio
 import difflib
+import functools
 import logging
 import re
 from datetime import UTC, datetime, time, timedelta
@@ -12,12 +14,14 @@ from discord import Color, ui
 from discord.ext import tasks
 from discord.ext.commands import Cog
 from discord.utils import format_dt, utcnow
-from urlextract import URLExtract
 
 from . import CBot, constants
+from .state import StateKey
 
 
 if TYPE_CHECKING:  # pragma: no cover
+    from urlextract import URLExtract
+
     from .levels import Leveling
 
 
@@ -25,6 +29,23 @@ CONTENT_PLANS_CURRENT_PLANS = 922616414781714442
 CONTENT_PLANS_FUTURE_PLANS = 941908627399258162
 NOSY_ALLOWED_MENTIONS = discord.AllowedMentions(roles=[discord.Object(constants.NOSY_ROLE)])
 _LOGGER = logging.getLogger(__name__)
+# Members that are timed out, and when their timeout ends, so the end is still logged after a restart
+_TIMEOUTS: StateKey[dict[int, datetime]] = StateKey(
+    "events_timeouts",
+    dict,
+    dump=lambda timeouts: [(member, until.timestamp()) for member, until in timeouts.items()],
+    load=lambda timeouts: {member: datetime.fromtimestamp(until, UTC) for member, until in timeouts},
+)
+_CURRENT_PLANS: StateKey[str] = StateKey("content_plans_current_message_content", str, dump=str, load=str)
+_FUTURE_PLANS: StateKey[str] = StateKey("content_plans_future_message_content", str, dump=str, load=str)
+
+
+@functools.cache
+def _url_extractor() -> "URLExtract":
+    # Importing urlextract and loading its TLD list is slow, so it's done on the first message that needs it
+    from urlextract import URLExtract
+
+    return URLExtract()
 
 
 class UnTimeoutView(ui.LayoutView):
@@ -164,7 +185,6 @@ class Events(Cog):
         "members",
         "webhook",
         "tilde_regex",
-        "extractor",
     )
 
     def __init__(self, bot: CBot):
@@ -174,7 +194,11 @@ class Events(Cog):
         self.tilde_regex = re.compile(
             r"~~:\.\|:;~~|tilde tilde colon dot vertical bar colon semicolon tilde tilde", re.MULTILINE | re.IGNORECASE
         )
-        self.extractor = URLExtract()
+
+    @property
+    def extractor(self) -> "URLExtract":
+        """The URL extractor, created the first time it is used."""
+        return _url_extractor()
 
     async def cog_load(self) -> None:  # pragma: no cover
         """Cog load function.
@@ -182,28 +206,36 @@ class Events(Cog):
         This is called when the cog is loaded, and initializes the
         log_un-timeout task and the members cache
         """
-        self.timeout_webhook = await self.bot.fetch_webhook(945514428047167578)
-        self.ban_webhook = await self.bot.fetch_webhook(1496177828331258036)
-        self.nosy_webhook = await self.bot.fetch_webhook(1464810032020324500)
+        # Taken before anything is awaited, so timeouts seen meanwhile and the log_untimeout task use the restored ones
+        self.timeouts = self.bot.holder.take(_TIMEOUTS)
+        self.timeout_webhook, self.ban_webhook, self.nosy_webhook = await asyncio.gather(
+            self.bot.fetch_webhook(945514428047167578),
+            self.bot.fetch_webhook(1496177828331258036),
+            self.bot.fetch_webhook(1464810032020324500),
+        )
         self.log_untimeout.start()
         guild = self.bot.get_guild(constants.GUILD_ID) or await self.bot.fetch_guild(constants.GUILD_ID)
         self.update_channel = cast(
             discord.TextChannel,
             guild.get_channel(constants.CONTENT_PLANS) or await guild.fetch_channel(constants.CONTENT_PLANS),
         )
-        self.current_message = (
-            self.bot.holder.pop("content_plans_current_message_content", None)
-            or (await self.update_channel.fetch_message(CONTENT_PLANS_CURRENT_PLANS)).content
-        )
-        self.future_message = (
-            self.bot.holder.pop("content_plans_future_message_content", None)
-            or (await self.update_channel.fetch_message(CONTENT_PLANS_FUTURE_PLANS)).content
-        )
-        self.members.update(
-            {user.id: user.joined_at async for user in guild.fetch_members(limit=None) if user.joined_at is not None}
+        self.current_message, self.future_message = await asyncio.gather(
+            self._plans_message(_CURRENT_PLANS, CONTENT_PLANS_CURRENT_PLANS),
+            self._plans_message(_FUTURE_PLANS, CONTENT_PLANS_FUTURE_PLANS),
         )
+        # Fetching every member is slow, so the cache is filled in the background instead of holding up startup
+        self.members_warmup = asyncio.create_task(self._load_members(guild))
         self.notify_updated_content_plans.start()
 
+    async def _plans_message(self, key: StateKey[str], message_id: int) -> str:  # pragma: no cover
+        return self.bot.holder.take(key) or (await self.update_channel.fetch_message(message_id)).content
+
+    async def _load_members(self, guild: discord.Guild) -> None:  # pragma: no cover
+        async for user in guild.fetch_members(limit=None):
+            if user.joined_at is not None:
+                # Joins seen while fetching are already in the cache
+                self.members.setdefault(user.id, user.joined_at)
+
     async def cog_unload(self) -> None:  # skipcq: PYL-W0236  # pragma: no cover
         """Call when cog is unloaded.
 
@@ -211,8 +243,10 @@ class Events(Cog):
         """
         self.log_untimeout.cancel()
         self.notify_updated_content_plans.cancel()
-        self.bot.holder["content_plans_current_message_content"] = self.current_message
-        self.bot.holder["content_plans_future_message_content"] = self.future_message
+        self.members_warmup.cancel()
+        self.bot.holder.put(_CURRENT_PLANS, self.current_message)
+        self.bot.holder.put(_FUTURE_PLANS, self.future_message)
+        self.bot.holder.put(_TIMEOUTS, self.timeouts)
 
     async def parse_timeout(self, after: discord.Member, *, rejoin: bool = False) -> None:
         """Parse the timeout and logs it to the mod log.
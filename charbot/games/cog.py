@@ -7,14 +7,12 @@ from itertools import count
 from typing import Final, Literal
 
 import discord
-import niquests
 from discord import Interaction, app_commands
 from discord.ext import commands
 
 from .. import CBot, constants  # , errors
-from . import shrugman, sudoku
-from .minesweeper.game import Game as MinesweeperGame
-from .minesweeper.view import Minesweeper
+
+# Difficulty is needed for the command's choices, the other games are imported by their commands on first use
 from .tictactoe import Difficulty, TicTacToe
 
 
@@ -41,6 +39,8 @@ class Reputation(commands.Cog, name="Programs"):
     # beta = app_commands.Group(name="beta", description="Beta programs..", parent=programs)
 
     async def _get_sudoku(self) -> str:  # pragma: no cover
+        import niquests
+
         async with await niquests.aget("https://nine.websudoku.com/?level=2") as response:
             return response.text or ""
 
@@ -55,6 +55,8 @@ class Reputation(commands.Cog, name="Programs"):
         mobile: bool
             Whether to turn off formatting that only works on desktop.
         """
+        from . import sudoku
+
         await interaction.response.defer(ephemeral=True)
         match = self.SUDOKU_REGEX.search(await self._get_sudoku())
         if match is None:
@@ -104,8 +106,10 @@ class Reputation(commands.Cog, name="Programs"):
         interaction: Interaction[CBot]
             The interaction of the command.
         """
+        from . import shrugman
+
         await interaction.response.defer(ephemeral=True)
-        word = random.choice(shrugman.words)
+        word = random.choice(shrugman.get_words())
         embed = discord.Embed(
             title="Shrugman",
             description=f"Guess the word: `{''.join(['-' for _ in word])}`",
@@ -131,6 +135,9 @@ class Reputation(commands.Cog, name="Programs"):
         difficulty: {"Beginner", "Intermediate", "Expert", "Super Expert"}
             The difficulty of the game.
         """
+        from .minesweeper.game import Game as MinesweeperGame
+        from .minesweeper.view import Minesweeper
+
         await interaction.response.defer(ephemeral=True)
         if difficulty == "Beginner":
             game = MinesweeperGame.beginner()
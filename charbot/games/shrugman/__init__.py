@@ -1,6 +1,6 @@
 """Shrugman minigame."""
 
-__all__ = ("GuessModal", "Shrugman", "words")
+__all__ = ("GuessModal", "Shrugman", "get_words")
 
 from .modal import GuessModal
-from .view import Shrugman, words
+from .view import Shrugman, get_words
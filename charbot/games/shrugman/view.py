@@ -1,6 +1,7 @@
 """Shrugman view."""
 
 import datetime
+import functools
 import pathlib
 import random
 from enum import Enum
@@ -16,7 +17,7 @@ from . import modal
 if TYPE_CHECKING:
     from ... import CBot  # pragma: no cover
 
-__all__ = ("Shrugman", "words")
+__all__ = ("Shrugman", "get_words")
 
 FailStates = Enum(
     "FailStates",
@@ -24,8 +25,18 @@ FailStates = Enum(
     start=0,
 )
 
-with (pathlib.Path(__file__).parent.parent.parent / "media/shrugman/words.csv").open() as f:
-    words = [word.replace("\n", "") for word in f.readlines()]
+
+@functools.cache
+def get_words() -> tuple[str, ...]:
+    """Get the words that can be picked for a game, reading them the first time they are needed.
+
+    Returns
+    -------
+    tuple[str, ...]
+        The words.
+    """
+    with (pathlib.Path(__file__).parent.parent.parent / "media/shrugman/words.csv").open() as f:
+        return tuple(word.replace("\n", "") for word in f.readlines())
 
 
 class Shrugman(ui.View):
@@ -80,7 +91,7 @@ class Shrugman(ui.View):
     def __init__(self, bot: "CBot", word: str, *, fail_enum=FailStates):
         super().__init__(timeout=600)
         self.bot = bot
-        self.word = word or random.choice(words)
+        self.word = word or random.choice(get_words())
         self.fail_enum = fail_enum
         self.guess_count = 0
         self.guesses: list[str] = []
@@ -16,6 +16,7 @@ from discord.utils import MISSING, format_dt, utcnow
 from validators import url
 
 from . import CBot, Config
+from .state import StateKey
 
 
 ytLink = "https://www.youtube.com/charliepryor/live"
@@ -24,6 +25,9 @@ calTimeZone = ZoneInfo("America/New_York")
 time_format = "%H:%M %x %Z"
 
 _LOGGER = logging.getLogger(__name__)
+# Discord objects can't be saved, so these only survive a reload
+_MESSAGE: StateKey[discord.WebhookMessage] = StateKey("calendar_message", lambda: MISSING)
+_WEBHOOK: StateKey[discord.Webhook | None] = StateKey("calendar_webhook", lambda: None)
 
 
 class EmbedField(NamedTuple):
@@ -77,7 +81,7 @@ def get_params(mintime: datetime, maxtime: datetime) -> dict[str, str]:
         The url to query the Google calendar API.
     """
     return {
-        "key": Config["calendar"]["key"],
+        "key": Config.calendar["key"],
         "singleEvents": "True",
         "timeMin": mintime.isoformat(),
         "timeMax": maxtime.isoformat(),
@@ -234,16 +238,16 @@ class Calendar(commands.Cog):
     async def cog_unload(self) -> None:  # skipcq: PYL-W0236
         """Unload hook."""
         self.calendar.cancel()
-        self.bot.holder["message"] = self.message
-        self.bot.holder["webhook"] = self.webhook
+        self.bot.holder.put(_MESSAGE, self.message)
+        self.bot.holder.put(_WEBHOOK, self.webhook)
         await self.session.close()
 
     async def cog_load(self) -> None:
         """Load hook."""
-        self.webhook = self.bot.holder.pop("webhook", None) or await self.bot.fetch_webhook(
-            Config["discord"]["webhooks"]["calendar"]
+        self.webhook = self.bot.holder.take(_WEBHOOK) or await self.bot.fetch_webhook(
+            Config.discord["webhooks"]["calendar"]
         )
-        self.message = self.bot.holder.pop("message", MISSING)
+        self.message = self.bot.holder.take(_MESSAGE)
         self.calendar.start()
 
     @commands.command(hidden=True, name="calendar")
@@ -316,7 +320,7 @@ class Calendar(commands.Cog):
             fields.pop(timegm(sub_time.utctimetuple()), None)
             times.discard(sub_time)
         if self.message is MISSING:  # pragma: no branch
-            self.message = await self.webhook.fetch_message(Config["discord"]["messages"]["calendar"])
+            self.message = await self.webhook.fetch_message(Config.discord["messages"]["calendar"])
         try:
             self.message = await self.message.edit(embed=calendar_embed(fields, min(times, default=None)))
         except discord.DiscordServerError as e:  # Discord server error, log and skip
@@ -5,6 +5,7 @@ import random
 import secrets
 from collections import Counter
 from datetime import datetime, time
+from typing import TYPE_CHECKING, cast
 
 import discord
 from discord import app_commands, ui
@@ -12,7 +13,11 @@ from discord.ext import tasks
 from discord.ext.commands import Cog
 from discord.utils import format_dt, utcnow
 
-from . import CBot, constants
+from . import CBot, constants, queries
+
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .levels import Leveling
 
 
 _LOGGER = logging.getLogger(__name__)
@@ -125,11 +130,7 @@ class GiveawaySetupModal(ui.Modal, title="Giveaway Setup"):
                 self.min_level,
                 random_number,
             )
-            await conn.execute(
-                "UPDATE no_xp SET channels = array_append(channels, $1) WHERE guild = $2",
-                channel.id,
-                interaction.guild_id,
-            )
+            no_xp = await queries.block_xp(conn, interaction.guild_id, channel=channel.id, blocked=True)
 
             enter_by = "Enter by sending a *single* message in this channel."
             if random_number:
@@ -140,6 +141,10 @@ class GiveawaySetupModal(ui.Modal, title="Giveaway Setup"):
             if self.min_level > 0:
                 enter_by += f"\n\nAt the time of the draw, **you must either be at least level {self.min_level} or be a channel supporter**. See <#338734957251788803> for more details on our leveling system."
 
+        # The update has been committed by now, so the cache can follow it
+        if (leveling := cast("Leveling | None", interaction.client.get_cog("Leveling"))) is not None:
+            leveling.set_no_xp(no_xp)
+
         msg = await channel.send(f"""**NEW GIVEAWAY** for **{self.game}** available to everyone! <@&605419188873330739> 
 
 {description}
@@ -292,129 +297,130 @@ class Giveaways(Cog):
         """Task loop to finish giveaways."""
         log_channel = self.bot.get_channel(LOG_CHANNEL) or await self.bot.fetch_channel(LOG_CHANNEL)
         assert isinstance(log_channel, discord.TextChannel)
-        async with self.bot.pool.acquire() as conn:
-            giveaways = await conn.fetch("SELECT * FROM giveaway WHERE end_dt <= $1 AND complete = FALSE", utcnow())
-            for giveaway in giveaways:
-                channel_id = giveaway["channel"]
-                num_winners = giveaway["winners"]
-                channel = self.bot.get_channel(channel_id) or await self.bot.fetch_channel(channel_id)
-                if not isinstance(channel, discord.TextChannel):
-                    _LOGGER.warning("Channel with ID %s not found for giveaway ID %s", channel_id, channel_id)
-                    continue
-                guild = channel.guild
-                deliverer_id = giveaway["distributor"]
-
-                ## Update Channel Overwrites to only allow the deliverer to send messages, preventing any further entries in the giveaway while winners are being selected
-
-                deliverer = guild.get_member(deliverer_id) or await guild.fetch_member(deliverer_id)
-                everyone = guild.default_role
-                overwrites = channel.overwrites
-                everyone_overwrite = overwrites.get(everyone, discord.PermissionOverwrite())
-                everyone_overwrite.send_messages = False
-                overwrites[everyone] = everyone_overwrite
-                deliverer_overwrite = overwrites.get(deliverer, discord.PermissionOverwrite())
-                deliverer_overwrite.send_messages = True
-                overwrites[deliverer] = deliverer_overwrite
-                await channel.edit(overwrites=overwrites)
-
+        # Scanning the channel histories takes a while, so a connection is only taken for each query
+        budget = self.bot.background("giveaways")
+        giveaways = await queries.due_giveaways(budget, utcnow())
+        for giveaway in giveaways:
+            channel_id = giveaway["channel"]
+            num_winners = giveaway["winners"]
+            channel = self.bot.get_channel(channel_id) or await self.bot.fetch_channel(channel_id)
+            if not isinstance(channel, discord.TextChannel):
+                _LOGGER.warning("Channel with ID %s not found for giveaway ID %s", channel_id, channel_id)
+                continue
+            guild = channel.guild
+            deliverer_id = giveaway["distributor"]
+
+            ## Update Channel Overwrites to only allow the deliverer to send messages, preventing any further entries in the giveaway while winners are being selected
+
+            deliverer = guild.get_member(deliverer_id) or await guild.fetch_member(deliverer_id)
+            everyone = guild.default_role
+            overwrites = channel.overwrites
+            everyone_overwrite = overwrites.get(everyone, discord.PermissionOverwrite())
+            everyone_overwrite.send_messages = False
+            overwrites[everyone] = everyone_overwrite
+            deliverer_overwrite = overwrites.get(deliverer, discord.PermissionOverwrite())
+            deliverer_overwrite.send_messages = True
+            overwrites[deliverer] = deliverer_overwrite
+            await channel.edit(overwrites=overwrites)
+
+            entries = [
+                message
+                async for message in channel.history(limit=None)
+                if not message.edited_at and isinstance(message.author, discord.Member)
+            ]
+            # Eliminate bots and messages from the giveaway deliverer
+            entries = [entry for entry in entries if not entry.author.bot and entry.author.id != deliverer_id]
+            author_counts = Counter(entry.author.id for entry in entries)
+            duplicate_authors = {author_id for author_id, count in author_counts.items() if count > 1}
+
+            entries = [entry for entry in entries if entry.author.id not in duplicate_authors]
+
+            await log_channel.send(f"Finishing giveaway for {giveaway['game']} with {len(entries)} valid entries.")
+
+            if (min_level := giveaway["min_level"]) > 0:
+                # Filter entries based on minimum level requirement for non-supporters
+                required_roles = (
+                    frozenset(constants.LEVEL_ROLE_IDS_LIST[min_level - 1 :])
+                    | constants.SUPPORTER_ROLE_IDS
+                    | constants.MOD_ROLE_IDS
+                    | constants.LEGACY_ROLE_IDS
+                )
                 entries = [
-                    message
-                    async for message in channel.history(limit=None)
-                    if not message.edited_at and isinstance(message.author, discord.Member)
+                    entry
+                    for entry in entries
+                    if any(entry.author.get_role(role_id) for role_id in required_roles)  # pyright: ignore[reportAttributeAccessIssue]
                 ]
-                # Eliminate bots and messages from the giveaway deliverer
-                entries = [entry for entry in entries if not entry.author.bot and entry.author.id != deliverer_id]
-                author_counts = Counter(entry.author.id for entry in entries)
-                duplicate_authors = {author_id for author_id, count in author_counts.items() if count > 1}
-
-                entries = [entry for entry in entries if entry.author.id not in duplicate_authors]
-
-                await log_channel.send(f"Finishing giveaway for {giveaway['game']} with {len(entries)} valid entries.")
-
-                if (min_level := giveaway["min_level"]) > 0:
-                    # Filter entries based on minimum level requirement for non-supporters
-                    required_roles = (
-                        frozenset(constants.LEVEL_ROLE_IDS_LIST[min_level - 1 :])
-                        | constants.SUPPORTER_ROLE_IDS
-                        | constants.MOD_ROLE_IDS
-                        | constants.LEGACY_ROLE_IDS
-                    )
-                    entries = [
-                        entry
-                        for entry in entries
-                        if any(entry.author.get_role(role_id) for role_id in required_roles)  # pyright: ignore[reportAttributeAccessIssue]
-                    ]
 
-                REMINDER_TEXT = f"Remember to DM {deliverer.mention} **within 48 hours** to claim your prize!"
+            REMINDER_TEXT = f"Remember to DM {deliverer.mention} **within 48 hours** to claim your prize!"
 
-                if giveaway["random_num"]:
-                    # Select winners by random number method
-                    winning_number = secrets.randbelow(100) + 1
+            if giveaway["random_num"]:
+                # Select winners by random number method
+                winning_number = secrets.randbelow(100) + 1
 
-                    def get_entry(msg: discord.Message):
-                        try:
-                            return int(msg.content.strip())
-                        except ValueError:
-                            return -1
+                def get_entry(msg: discord.Message):
+                    try:
+                        return int(msg.content.strip())
+                    except ValueError:
+                        return -1
 
-                    entry_numbers = [(entry, val) for entry in entries if 1 <= (val := get_entry(entry)) <= 100]
+                entry_numbers = [(entry, val) for entry in entries if 1 <= (val := get_entry(entry)) <= 100]
 
-                    if not entry_numbers:
-                        await channel.send("No valid entries were submitted. No winners can be selected.")
-                        await conn.execute("UPDATE giveaway SET complete = TRUE WHERE channel = $1", channel_id)
-                        continue
+                if not entry_numbers:
+                    await channel.send("No valid entries were submitted. No winners can be selected.")
+                    await queries.complete_giveaway(budget, channel_id)
+                    continue
 
-                    if len(entry_numbers) < num_winners:
-                        await channel.send(f"""There were less valid entries than winners for this giveaway. The winning number was **{winning_number}**. The following {len(entry_numbers)} participant(s) win by default:
+                if len(entry_numbers) < num_winners:
+                    await channel.send(f"""There were less valid entries than winners for this giveaway. The winning number was **{winning_number}**. The following {len(entry_numbers)} participant(s) win by default:
 {", ".join(entry[0].author.mention for entry in entry_numbers)}
 
 {REMINDER_TEXT}""")
-                        await conn.execute("UPDATE giveaway SET complete = TRUE WHERE channel = $1", channel_id)
-                        continue
+                    await queries.complete_giveaway(budget, channel_id)
+                    continue
 
-                    sorted_entries = sorted(entry_numbers, key=lambda x: abs(x[1] - winning_number))
-                    winners = sorted_entries[:num_winners]
-                    await conn.execute("UPDATE giveaway SET complete = TRUE WHERE channel = $1", channel_id)
+                sorted_entries = sorted(entry_numbers, key=lambda x: abs(x[1] - winning_number))
+                winners = sorted_entries[:num_winners]
+                await queries.complete_giveaway(budget, channel_id)
 
-                    winner_mentions = ", ".join(entry[0].author.mention for entry in winners)
+                winner_mentions = ", ".join(entry[0].author.mention for entry in winners)
+                await channel.send(
+                    f"The winning number is **{winning_number}**! Congratulations to the winner(s):\n{winner_mentions}!\n\n{REMINDER_TEXT}"
+                )
+                backups = sorted_entries[num_winners : (num_winners * 3)]
+                if backups:
+                    backup_mentions = ", ".join(entry[0].author.mention for entry in backups)
+                    backup_message = f"In case any winners fail to claim their prize, the following {len(backups)} participant(s) are backups:\n{backup_mentions}"
+                    await deliverer.send(
+                        f"In case any winners fail to claim their prize, the following {len(backups)} participant(s) are backups:\n{backup_mentions}"
+                    )
+                    await log_channel.send(f"Backups for giveaway {giveaway['game']}: {backup_mentions}")
+            else:
+                # Select winners by shuffle method
+                if not entries:
+                    await channel.send("No entries were submitted. No winners can be selected.")
+                    await queries.complete_giveaway(budget, channel_id)
+                    continue
+
+                if len(entries) < num_winners:
+                    winner_mentions = ", ".join(entry.author.mention for entry in entries)
                     await channel.send(
-                        f"The winning number is **{winning_number}**! Congratulations to the winner(s):\n{winner_mentions}!\n\n{REMINDER_TEXT}"
+                        f"There were less entries than winners for this giveaway. The following {len(entries)} participant(s) win by default:\n{winner_mentions}\n\n{REMINDER_TEXT}"
                     )
-                    backups = sorted_entries[num_winners : (num_winners * 3)]
-                    if backups:
-                        backup_mentions = ", ".join(entry[0].author.mention for entry in backups)
-                        backup_message = f"In case any winners fail to claim their prize, the following {len(backups)} participant(s) are backups:\n{backup_mentions}"
-                        await deliverer.send(
-                            f"In case any winners fail to claim their prize, the following {len(backups)} participant(s) are backups:\n{backup_mentions}"
-                        )
-                        await log_channel.send(f"Backups for giveaway {giveaway['game']}: {backup_mentions}")
-                else:
-                    # Select winners by shuffle method
-                    if not entries:
-                        await channel.send("No entries were submitted. No winners can be selected.")
-                        await conn.execute("UPDATE giveaway SET complete = TRUE WHERE channel = $1", channel_id)
-                        continue
-
-                    if len(entries) < num_winners:
-                        winner_mentions = ", ".join(entry.author.mention for entry in entries)
-                        await channel.send(
-                            f"There were less entries than winners for this giveaway. The following {len(entries)} participant(s) win by default:\n{winner_mentions}\n\n{REMINDER_TEXT}"
-                        )
-                        await conn.execute("UPDATE giveaway SET complete = TRUE WHERE channel = $1", channel_id)
-                        continue
-
-                    random.shuffle(entries)
-                    winners = entries[:num_winners]
-                    winner_mentions = ", ".join(entry.author.mention for entry in winners)
-                    await channel.send(f"Congratulations to the winner(s):\n{winner_mentions}!\n\n{REMINDER_TEXT}")
-                    await conn.execute("UPDATE giveaway SET complete = TRUE WHERE channel = $1", channel_id)
-
-                    backups = entries[num_winners : (num_winners * 3)]
-                    if backups:
-                        backup_mentions = ", ".join(entry.author.mention for entry in backups)
-                        backup_message = f"In case any winners fail to claim their prize, the following {len(backups)} participant(s) are backups:\n{backup_mentions}"
-                        await deliverer.send(backup_message)
-                        await log_channel.send(f"Backups for giveaway {giveaway['game']}: {backup_mentions}")
+                    await queries.complete_giveaway(budget, channel_id)
+                    continue
+
+                random.shuffle(entries)
+                winners = entries[:num_winners]
+                winner_mentions = ", ".join(entry.author.mention for entry in winners)
+                await channel.send(f"Congratulations to the winner(s):\n{winner_mentions}!\n\n{REMINDER_TEXT}")
+                await queries.complete_giveaway(budget, channel_id)
+
+                backups = entries[num_winners : (num_winners * 3)]
+                if backups:
+                    backup_mentions = ", ".join(entry.author.mention for entry in backups)
+                    backup_message = f"In case any winners fail to claim their prize, the following {len(backups)} participant(s) are backups:\n{backup_mentions}"
+                    await deliverer.send(backup_message)
+                    await log_channel.send(f"Backups for giveaway {giveaway['game']}: {backup_mentions}")
 
 
 async def setup(bot: CBot):  # pragma: no cover
@@ -0,0 +1,182 @@
+"""XP ranks and leaderboard pages."""
+
+import bisect
+from collections.abc import Iterable
+
+import asyncpg
+import discord
+from discord import ui
+
+from . import queries
+
+
+__all__ = ("PAGE_SIZE", "LeaderboardView", "RankCache", "fetch_page")
+
+PAGE_SIZE = 10
+
+
+class RankCache:
+    """The XP of every member, kept sorted so ranks can be found without scanning the ``levels`` table.
+
+    Ranks are competition ranks, members with the same XP share a rank, and the next rank skips past them.
+    """
+
+    __slots__ = ("_order", "_xp")
+
+    def __init__(self):
+        self._xp: dict[int, int] = {}
+        # (-xp, id), so the highest XP is first
+        self._order: list[tuple[int, int]] = []
+
+    def __len__(self) -> int:
+        return len(self._xp)
+
+    def load(self, rows: Iterable[tuple[int, int]]) -> None:
+        """Replace the cache with the XP of every member.
+
+        Parameters
+        ----------
+        rows : Iterable[tuple[int, int]]
+            The id and XP of each member.
+        """
+        self._xp = dict(rows)
+        self._order = sorted((-xp, user) for user, xp in self._xp.items())
+
+    def get(self, user: int) -> int | None:
+        """Get the cached XP of a member.
+
+        Parameters
+        ----------
+        user : int
+            The id of the member.
+
+        Returns
+        -------
+        int | None
+            The XP, or None if the member isn't cached.
+        """
+        return self._xp.get(user)
+
+    def update(self, user: int, xp: int) -> None:
+        """Set the XP of a member, moving them to their new rank.
+
+        Parameters
+        ----------
+        user : int
+            The id of the member.
+        xp : int
+            Their new XP.
+        """
+        if (old := self._xp.get(user)) == xp:
+            return
+        if old is not None:
+            del self._order[bisect.bisect_left(self._order, (-old, user))]
+        bisect.insort(self._order, (-xp, user))
+        self._xp[user] = xp
+
+    def rank(self, xp: int) -> int:
+        """Get the rank of an amount of XP.
+
+        Parameters
+        ----------
+        xp : int
+            The XP.
+
+        Returns
+        -------
+        int
+            One more than the number of members with more XP.
+        """
+        return bisect.bisect_left(self._order, -xp, key=lambda entry: entry[0]) + 1
+
+
+async def fetch_page(
+    pool: asyncpg.Pool, after: tuple[int, int] | None, limit: int = PAGE_SIZE
+) -> list[tuple[int, int]]:
+    """Get a page of the leaderboard, with keyset pagination on the ``levels (xp DESC, id)`` index.
+
+    Parameters
+    ----------
+    pool : asyncpg.Pool
+        The database pool.
+    after : tuple[int, int] | None
+        The XP and id of the last member on the previous page, or None for the first page.
+    limit : int
+        The number of members to get.
+
+    Returns
+    -------
+    list[tuple[int, int]]
+        The XP and id of each member on the page, in rank order.
+    """
+    return await queries.leaderboard(pool, after, limit)
+
+
+class LeaderboardView(ui.LayoutView):
+    """A page of the XP leaderboard, with buttons to move between pages.
+
+    Parameters
+    ----------
+    pool : asyncpg.Pool
+        The database pool.
+    ranks : RankCache
+        The ranks to show next to each member.
+    user_id : int
+        The id of the user that can use the buttons.
+    xp_per_level : int
+        The XP needed for each level.
+    """
+
+    def __init__(self, pool: asyncpg.Pool, ranks: RankCache, user_id: int, xp_per_level: int):
+        super().__init__(timeout=300)
+        self.pool = pool
+        self.ranks = ranks
+        self.user_id = user_id
+        self.xp_per_level = xp_per_level
+        # The cursor each visited page started after, the last one is the current page
+        self.cursors: list[tuple[int, int] | None] = [None]
+        self.next_cursor: tuple[int, int] | None = None
+        self.previous_button: ui.Button[LeaderboardView] = ui.Button(label="Previous", emoji="⬅️")
+        self.previous_button.callback = self.previous_page
+        self.next_button: ui.Button[LeaderboardView] = ui.Button(label="Next", emoji="➡️")
+        self.next_button.callback = self.next_page
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.user_id:
+            await interaction.response.send_message("This leaderboard isn't yours, use /leaderboard.", ephemeral=True)
+            return False
+        return True
+
+    async def load(self) -> None:
+        """Fetch the current page and rebuild the view around it."""
+        # One extra row tells if there is a next page
+        page = await fetch_page(self.pool, self.cursors[-1], PAGE_SIZE + 1)
+        self.next_cursor = page[PAGE_SIZE - 1] if len(page) > PAGE_SIZE else None
+        page = page[:PAGE_SIZE]
+        lines = [
+            f"**#{self.ranks.rank(xp)}** <@{user}> - Level {xp // self.xp_per_level} ({xp} XP)" for xp, user in page
+        ] or ["Nobody has gained any XP yet."]
+        self.previous_button.disabled = len(self.cursors) == 1
+        self.next_button.disabled = self.next_cursor is None
+        self.clear_items()
+        self.add_item(
+            ui.Container(
+                ui.TextDisplay("## XP Leaderboard"),
+                ui.TextDisplay("\n".join(lines)),
+                ui.Separator(),
+                ui.ActionRow(self.previous_button, self.next_button),
+                accent_color=discord.Color.blurple(),
+            )
+        )
+
+    async def previous_page(self, interaction: discord.Interaction) -> None:
+        """Go back a page."""
+        self.cursors.pop()
+        await self.load()
+        await interaction.response.edit_message(view=self)
+
+    async def next_page(self, interaction: discord.Interaction) -> None:
+        """Go forward a page."""
+        self.cursors.append(self.next_cursor)
+        await self.load()
+        await interaction.response.edit_message(view=self)
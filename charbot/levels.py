@@ -1,26 +1,354 @@
 """Level system."""
 
 import asyncio
+import contextlib
 import datetime
+import logging
 import time
-from collections import defaultdict, deque
+from collections.abc import AsyncIterator, Iterable, Mapping
+from io import BytesIO
+from typing import NamedTuple, Self
 
+import asyncpg
 import discord
 from discord import Interaction, app_commands
 from discord.ext import commands, tasks
 
-from . import CBot, constants
+from . import CBot, Config, constants, queries
+from .activity import ActivityWindow, ExpiringLRU
+from .bus import Invalidation
+from .db import Budget
+from .leaderboard import LeaderboardView, RankCache
+from .state import StateKey
 
 
+_LOGGER = logging.getLogger(__name__)
 XP_PER_LEVEL = 10
 XP_CAP = (XP_PER_LEVEL * 5) + 1
 INTERVAL_LENGTH = 600
+AWARD_COOLDOWN = 600
+AWARD_BONUS_INTERVAL = INTERVAL_LENGTH * 1.5
+# Default size limits of the in memory caches, each can be changed in the [leveling] config section
+MAX_TRACKED_CHANNELS = 1_000
+MAX_TRACKED_AWARDS = 50_000
+MAX_TRACKED_DEPARTED = 10_000
+LOCK_STRIPES = 64
+DRAIN_CONCURRENCY = 4
+DEPARTED_TTL = 60 * 60 * 24
 LEVEL_1_ROLE = discord.Object(constants.LEVEL_1_ID, type=discord.Role)
 LEVEL_2_ROLE = discord.Object(constants.LEVEL_2_ID, type=discord.Role)
 LEVEL_3_ROLE = discord.Object(constants.LEVEL_3_ID, type=discord.Role)
 LEVEL_4_ROLE = discord.Object(constants.LEVEL_4_ID, type=discord.Role)
 LEVEL_5_ROLE = discord.Object(constants.LEVEL_5_ID, type=discord.Role)
 LEVEL_6_ROLE = discord.Object(constants.LEVEL_6_ID, type=discord.Role)
+# The roles managed by the level system, the role for level n is at index n - 1
+LEVEL_ROLES = (LEVEL_1_ROLE, LEVEL_2_ROLE, LEVEL_3_ROLE, LEVEL_4_ROLE, LEVEL_5_ROLE)
+LEVEL_ROLE_IDS = frozenset(role.id for role in LEVEL_ROLES)
+
+
+class NoXP(NamedTuple):
+    """Snapshot of the channels and roles of a guild that are blocked from gaining XP."""
+
+    channels: frozenset[int]
+    roles: frozenset[int]
+
+    @classmethod
+    def from_record(cls, record: queries.NoXpRow) -> Self:
+        """Create a snapshot from a ``no_xp`` table row.
+
+        Parameters
+        ----------
+        record : queries.NoXpRow
+            The row.
+
+        Returns
+        -------
+        NoXP
+            The snapshot of the row.
+        """
+        return cls(frozenset(record["channels"]), frozenset(record["roles"]))
+
+
+class LevelUp(NamedTuple):
+    """A member that reached a new level."""
+
+    member: discord.Member
+    level: int
+
+
+class RoleDrift(NamedTuple):
+    """The members whose level roles don't match their XP."""
+
+    missing: int
+    extra: int
+    members: list[LevelUp]
+
+    @classmethod
+    def find(cls, members: Iterable[discord.Member], xp: Mapping[int, int]) -> Self:
+        """Compare the level roles members have with the ones their XP says they should have.
+
+        Parameters
+        ----------
+        members : Iterable[discord.Member]
+            The members to check, with their cached roles.
+        xp : Mapping[int, int]
+            The XP of each member, members without XP are level 0.
+
+        Returns
+        -------
+        RoleDrift
+            The number of level roles that are missing and extra, and the level each drifted member should be.
+        """
+        have: dict[int, set[int]] = {role_id: set() for role_id in LEVEL_ROLE_IDS}
+        want: dict[int, set[int]] = {role_id: set() for role_id in LEVEL_ROLE_IDS}
+        levels: dict[int, LevelUp] = {}
+        for member in members:
+            for role in member.roles:
+                if role.id in have:
+                    have[role.id].add(member.id)
+            level = min(xp.get(member.id, 0) // XP_PER_LEVEL, len(LEVEL_ROLES))
+            if level > 0:
+                want[LEVEL_ROLES[level - 1].id].add(member.id)
+            levels[member.id] = LevelUp(member, level)
+        missing = [want[role_id] - have[role_id] for role_id in LEVEL_ROLE_IDS]
+        extra = [have[role_id] - want[role_id] for role_id in LEVEL_ROLE_IDS]
+        drifted = set[int]().union(*missing, *extra)
+        return cls(sum(map(len, missing)), sum(map(len, extra)), [levels[member_id] for member_id in sorted(drifted)])
+
+
+class LastMessageBuffer:
+    """Write-behind buffer for ``levels.last_message``.
+
+    Every message updates its author's last message time, but it is only read by the daily XP drain, so the latest
+    time of each user is kept in memory and written in bulk.
+    """
+
+    def __init__(self):
+        self.pending: dict[int, datetime.datetime] = {}
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    def add(self, user: int, at: datetime.datetime) -> None:
+        """Record that a user sent a message.
+
+        Parameters
+        ----------
+        user : int
+            The id of the user.
+        at : datetime.datetime
+            When the message was sent.
+        """
+        if (current := self.pending.get(user)) is None or at > current:
+            self.pending[user] = at
+
+    async def flush(self, pool: asyncpg.Pool | Budget) -> int:
+        """Write the buffered times to the database.
+
+        The times are copied into a temporary table and merged into ``levels`` in one statement. If that fails, they
+        are kept in the buffer for the next flush.
+
+        Parameters
+        ----------
+        pool : asyncpg.Pool | Budget
+            The pool, or background job budget, to write with.
+
+        Returns
+        -------
+        int
+            The number of users that were written.
+        """
+        if not self.pending:
+            return 0
+        pending, self.pending = self.pending, {}
+        try:
+            async with pool.acquire() as conn, conn.transaction():
+                await conn.execute(
+                    "CREATE TEMPORARY TABLE last_message_buffer (id BIGINT NOT NULL, last_message TIMESTAMPTZ NOT NULL) "
+                    "ON COMMIT DROP"
+                )
+                await conn.copy_records_to_table(
+                    "last_message_buffer", records=pending.items(), columns=("id", "last_message")
+                )
+                # Rows are merged in id order, so this can't deadlock with the XP upserts
+                await conn.execute(
+                    "INSERT INTO levels (id, last_message) SELECT id, last_message FROM last_message_buffer ORDER BY id "
+                    "ON CONFLICT (id) DO UPDATE SET last_message = GREATEST(levels.last_message, EXCLUDED.last_message)"
+                )
+        except BaseException:
+            for user, at in pending.items():
+                self.add(user, at)
+            raise
+        return len(pending)
+
+
+class RoleSync:
+    """Background queue that gives members the level role of their level.
+
+    Updates for a member that is still waiting are merged, so only their latest level is applied, and each member is
+    updated with a single request. Updates are applied one at a time, and retried with a backoff if they were rate
+    limited or Discord had a server error.
+
+    Parameters
+    ----------
+    max_attempts : int
+        The number of times to try each update.
+    backoff : float
+        The number of seconds to wait before the first retry, doubling each retry, unless Discord says how long to
+        wait.
+    """
+
+    def __init__(self, max_attempts: int = 5, backoff: float = 1.0):
+        self.pending: dict[int, tuple[discord.Member, int, str]] = {}
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self._ready = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    def update(self, member: discord.Member, level: int, reason: str) -> None:
+        """Queue a member to get the level role of a level, replacing any update for them that is still waiting.
+
+        Parameters
+        ----------
+        member : discord.Member
+            The member.
+        level : int
+            The level, members below level 1 get no level role.
+        reason : str
+            The reason for the audit log.
+        """
+        self.pending.pop(member.id, None)
+        self.pending[member.id] = (member, level, reason)
+        self._ready.set()
+
+    async def apply_next(self) -> bool:
+        """Wait for an update, and apply it.
+
+        Returns
+        -------
+        bool
+            Whether the member's roles were changed.
+        """
+        await self._ready.wait()
+        member_id = next(iter(self.pending))
+        member, level, reason = self.pending.pop(member_id)
+        if not self.pending:
+            self._ready.clear()
+        return await self.apply(member, level, reason)
+
+    async def apply(self, member: discord.Member, level: int, reason: str) -> bool:
+        """Give a member the level role of a level, and remove their other level roles.
+
+        Parameters
+        ----------
+        member : discord.Member
+            The member.
+        level : int
+            The level.
+        reason : str
+            The reason for the audit log.
+
+        Returns
+        -------
+        bool
+            Whether the member's roles were changed.
+        """
+        # The cached member has the latest roles, the queued one may be from before other updates
+        member = member.guild.get_member(member.id) or member
+        roles: list[discord.abc.Snowflake] = [role for role in member.roles if role.id not in LEVEL_ROLE_IDS]
+        if 1 <= level <= len(LEVEL_ROLES):
+            roles.append(LEVEL_ROLES[level - 1])
+        if {role.id for role in roles} == {role.id for role in member.roles}:
+            return False
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                await member.edit(roles=roles, reason=reason)
+                return True
+            except discord.NotFound:
+                # They left, their roles are given back when they rejoin
+                return False
+            except discord.HTTPException as error:
+                if (error.status != 429 and error.status < 500) or attempt == self.max_attempts:
+                    _LOGGER.exception("Failed to set the level role of %s to level %s", member.id, level)
+                    return False
+                retry_after = getattr(error, "retry_after", None) or self.backoff * 2 ** (attempt - 1)
+                _LOGGER.warning("Retrying level role update of %s in %.2fs", member.id, retry_after)
+                await asyncio.sleep(retry_after)
+        return False
+
+
+def _load_windows(entries: list) -> ExpiringLRU[int, ActivityWindow]:
+    windows: ExpiringLRU[int, ActivityWindow] = ExpiringLRU(MAX_TRACKED_CHANNELS, INTERVAL_LENGTH)
+    windows.load(
+        (
+            channel,
+            set_at,
+            ActivityWindow.from_messages(
+                (datetime.datetime.fromtimestamp(sent, datetime.UTC), user) for sent, user in messages
+            ),
+        )
+        for channel, set_at, messages in entries
+    )
+    return windows
+
+
+def _load_awards(entries: list) -> ExpiringLRU[tuple[int, int], float]:
+    awards: ExpiringLRU[tuple[int, int], float] = ExpiringLRU(MAX_TRACKED_AWARDS, AWARD_BONUS_INTERVAL)
+    awards.load(((channel, user), set_at, last) for (channel, user), set_at, last in entries)
+    return awards
+
+
+def _load_departed(entries: list) -> ExpiringLRU[int, bool]:
+    departed: ExpiringLRU[int, bool] = ExpiringLRU(MAX_TRACKED_DEPARTED, DEPARTED_TTL)
+    departed.load(entries)
+    return departed
+
+
+def _load_last_messages(entries: list) -> LastMessageBuffer:
+    buffer = LastMessageBuffer()
+    for user, at in entries:
+        buffer.add(user, datetime.datetime.fromtimestamp(at, datetime.UTC))
+    return buffer
+
+
+# A window with no messages newer than the interval is empty for the next message, so it can be dropped
+_WINDOWS: StateKey[ExpiringLRU[int, ActivityWindow]] = StateKey(
+    "leveling_windows",
+    lambda: ExpiringLRU(MAX_TRACKED_CHANNELS, INTERVAL_LENGTH),
+    dump=lambda windows: [
+        (channel, set_at, [(sent.timestamp(), user) for sent, user in window.messages()])
+        for channel, set_at, window in windows.entries()
+    ],
+    load=_load_windows,
+)
+# The time of the last XP award of each (channel, user), which decides both the cooldown and the bonus, so it means
+# nothing once it is older than the bonus interval
+_AWARDS: StateKey[ExpiringLRU[tuple[int, int], float]] = StateKey(
+    "leveling_awards",
+    lambda: ExpiringLRU(MAX_TRACKED_AWARDS, AWARD_BONUS_INTERVAL),
+    dump=ExpiringLRU.entries,
+    load=_load_awards,
+)
+# Members that weren't found by the drain, so it doesn't fetch them again every day
+_DEPARTED: StateKey[ExpiringLRU[int, bool]] = StateKey(
+    "leveling_departed",
+    lambda: ExpiringLRU(MAX_TRACKED_DEPARTED, DEPARTED_TTL),
+    dump=ExpiringLRU.entries,
+    load=_load_departed,
+)
+_LAST_MESSAGES: StateKey[LastMessageBuffer] = StateKey(
+    "leveling_last_messages",
+    LastMessageBuffer,
+    dump=lambda buffer: [(user, at.timestamp()) for user, at in buffer.pending.items()],
+    load=_load_last_messages,
+)
+# Members and channels can't be saved, so these only survive a reload
+_ROLE_SYNC: StateKey[RoleSync] = StateKey("leveling_role_sync", RoleSync)
+_LEVEL_UPS: StateKey[asyncio.Queue[tuple[discord.abc.Messageable, list[LevelUp]]]] = StateKey(
+    "leveling_level_ups", asyncio.Queue
+)
 
 
 class Leveling(commands.Cog):
@@ -28,22 +356,79 @@ class Leveling(commands.Cog):
 
     def __init__(self, bot: CBot):
         self.bot = bot
-        self.buckets: dict[int, deque[tuple[datetime.datetime, int]]] = self.bot.holder.pop("leveling_buckets", {})
-        self.cooldown: commands.CooldownMapping[discord.Message] = self.bot.holder.pop(
-            "leveling_bucket_cooldown",
-            commands.CooldownMapping.from_cooldown(1, 600, lambda message: (message.channel.id, message.author.id)),
-        )
-        self.bucket_previous: defaultdict[int, defaultdict[int, float]] = self.bot.holder.pop(
-            "leveling_bucket_previous", defaultdict(lambda: defaultdict(lambda: 0))
-        )
-        self.lock = asyncio.Lock()
+        self.buckets = self.bot.holder.take(_WINDOWS)
+        self.awards = self.bot.holder.take(_AWARDS)
+        self.no_xp: dict[int, NoXP] = {}
+        self.role_sync = self.bot.holder.take(_ROLE_SYNC)
+        self.departed = self.bot.holder.take(_DEPARTED)
+        self.level_ups = self.bot.holder.take(_LEVEL_UPS)
+        self.last_messages = self.bot.holder.take(_LAST_MESSAGES)
+        self.locks = tuple(asyncio.Lock() for _ in range(LOCK_STRIPES))
+        self.ranks = RankCache()
+
+    async def cog_load(self):
+        # Lowered limits take effect as entries are added, the least recently used ones are evicted first
+        limits = Config.leveling
+        self.buckets.maxsize = limits.get("max_tracked_channels", MAX_TRACKED_CHANNELS)
+        self.awards.maxsize = limits.get("max_tracked_awards", MAX_TRACKED_AWARDS)
+        self.departed.maxsize = limits.get("max_tracked_departed", MAX_TRACKED_DEPARTED)
+        records = await queries.all_no_xp(self.bot.pool)
+        self.no_xp = {record["guild"]: NoXP.from_record(record) for record in records}
+        self.bot.bus.subscribe("no_xp", self.invalidate_no_xp)
+        await self.reload_ranks()
         self.drain.start()
+        self.apply_level_ups.start()
+        self.sync_roles.start()
+        self.reconcile_roles.start()
+        self.flush_last_messages.start()
 
     async def cog_unload(self):
+        self.bot.bus.unsubscribe("no_xp", self.invalidate_no_xp)
         self.drain.cancel()
-        self.bot.holder["leveling_buckets"] = self.buckets
-        self.bot.holder["leveling_bucket_cooldown"] = self.cooldown
-        self.bot.holder["leveling_bucket_previous"] = self.bucket_previous
+        self.apply_level_ups.cancel()
+        self.sync_roles.cancel()
+        self.reconcile_roles.cancel()
+        self.flush_last_messages.cancel()
+        try:
+            await self.last_messages.flush(self.bot.pool)
+        finally:
+            # Anything that couldn't be written is picked up again if the cog is reloaded
+            self.bot.holder.put(_LAST_MESSAGES, self.last_messages)
+        self.bot.holder.put(_LEVEL_UPS, self.level_ups)
+        self.bot.holder.put(_ROLE_SYNC, self.role_sync)
+        self.bot.holder.put(_DEPARTED, self.departed)
+        self.bot.holder.put(_WINDOWS, self.buckets)
+        self.bot.holder.put(_AWARDS, self.awards)
+
+    def channel_lock(self, channel_id: int) -> asyncio.Lock:
+        """Get the lock that guards a channel's bucket.
+
+        Channels are striped over a fixed number of locks, so messages in different channels are usually processed
+        concurrently without keeping a lock around for every channel ever seen.
+
+        Parameters
+        ----------
+        channel_id : int
+            The id of the channel.
+
+        Returns
+        -------
+        asyncio.Lock
+            The lock of the channel's stripe.
+        """
+        return self.locks[channel_id % LOCK_STRIPES]
+
+    @contextlib.asynccontextmanager
+    async def global_lock(self) -> AsyncIterator[None]:
+        """Hold every channel lock, for a consistent view of all the buckets and XP.
+
+        The locks are always taken in the same order, and everything else only ever holds a single one, so this
+        can't deadlock.
+        """
+        async with contextlib.AsyncExitStack() as stack:
+            for lock in self.locks:
+                await stack.enter_async_context(lock)
+            yield
 
     async def proc_xp(self, message: discord.Message):
         """Add XP to the user when they send a message.
@@ -60,125 +445,202 @@ class Leveling(commands.Cog):
             return
 
         guild = message.guild
-        channel_id = message.channel.id
+        channel = message.channel
+        channel_id = channel.id
         created_at = message.created_at
-        # member = message.author
         author_id = message.author.id
 
-        async with self.lock, self.bot.pool.acquire() as conn, conn.transaction():
-            no_xp = await conn.fetchrow("SELECT * FROM no_xp WHERE guild = $1", guild.id)
-            no_xp_channels = set(no_xp["channels"]) if no_xp else set()
-            channel = message.channel
-            if (
-                no_xp is None
-                or channel.id in no_xp_channels
-                or (isinstance(channel, discord.Thread) and channel.parent_id in no_xp_channels)
-            ):
-                # Treat threads within channels with no XP the same as the parent channel
+        no_xp = self.no_xp.get(guild.id)
+        if (
+            no_xp is None
+            or channel_id in no_xp.channels
+            or (isinstance(channel, discord.Thread) and channel.parent_id in no_xp.channels)
+        ):
+            # Treat threads within channels with no XP the same as the parent channel
+            return
+
+        async with self.channel_lock(channel_id):
+            active, num_unique = self._track_message(message)
+            # Members are cached through the members intent, so an uncached member has left the guild
+            members = [
+                member
+                for user in active
+                if (member := guild.get_member(user)) is not None
+                and not any(role.id in no_xp.roles for role in member.roles)
+            ]
+
+            self.last_messages.add(author_id, created_at)
+            if not members:
                 return
 
-            await conn.execute(
-                "INSERT INTO levels (id, xp, last_message) VALUES ($1, 0, $2) "
-                "ON CONFLICT (id) DO UPDATE SET last_message = EXCLUDED.last_message",
-                author_id,
-                created_at,
+            user_ids = sorted(member.id for member in members)
+            async with self.bot.pool.acquire() as conn, conn.transaction():
+                # Lock every row up front in id order, so the XP read here is still current when it is written, and
+                # two channels sharing members can't deadlock on each other.
+                old_xp: dict[int, int] = dict.fromkeys(user_ids, 0) | dict(await queries.lock_xp(conn, user_ids))
+                awards = {
+                    member.id: (member, xp_to_add)
+                    for member, xp_to_add in self._award_xp(message, members, old_xp, num_unique)
+                }
+                if not awards:
+                    return
+                written = sorted(awards)
+                rows = await queries.award_xp(conn, written, [awards[user][1] for user in written], XP_CAP, created_at)
+            # Only XP that was committed starts a cooldown and reaches the rank cache, a failed write leaves both as is
+            self._start_cooldowns(message, written)
+            for row in rows:
+                self.ranks.update(row.id, row.xp)
+            level_ups = [
+                LevelUp(awards[row.id][0], level)
+                for row in rows
+                if old_xp[row.id] // XP_PER_LEVEL < (level := row.xp // XP_PER_LEVEL)
+            ]
+
+        if level_ups:
+            self.level_ups.put_nowait((channel, level_ups))
+
+    def _track_message(self, message: discord.Message) -> tuple[list[int], int]:
+        """Add a message to its channel's bucket, and find the users that are active in the channel.
+
+        Parameters
+        ----------
+        message : discord.Message
+            The message that was sent.
+
+        Returns
+        -------
+        tuple[list[int], int]
+            The ids of the users that sent a message in the last half interval, and the number of unique users in the
+            whole interval. No users are active if there are fewer than two unique users.
+        """
+        created_at = message.created_at
+        channel_id = message.channel.id
+        if (bucket := self.buckets.get(channel_id, created_at.timestamp())) is None:
+            bucket = ActivityWindow()
+        self.buckets.set(channel_id, bucket, created_at.timestamp())
+        bucket.add(created_at, message.author.id)
+        bucket.expire(created_at - datetime.timedelta(seconds=INTERVAL_LENGTH))
+
+        if (num_unique := len(bucket)) < 2:
+            return [], num_unique
+
+        return bucket.active_since(created_at - datetime.timedelta(seconds=INTERVAL_LENGTH // 2)), num_unique
+
+    def _award_xp(
+        self, message: discord.Message, members: list[discord.Member], old_xp: dict[int, int], num_unique: int
+    ) -> list[tuple[discord.Member, int]]:
+        """Decide how much XP each active member gets for a message.
+
+        Members can gain XP once per cooldown in each channel, and get a bonus if they gained XP there recently. This
+        only reads the in memory award times, so it never waits on Discord or the database. The cooldowns are started
+        by :meth:`_start_cooldowns` once the XP has been committed.
+
+        Parameters
+        ----------
+        message : discord.Message
+            The message that was sent.
+        members : list[discord.Member]
+            The active members in the channel that may gain XP.
+        old_xp : dict[int, int]
+            The current XP of each member.
+        num_unique : int
+            The number of unique users in the channel's bucket.
+
+        Returns
+        -------
+        list[tuple[discord.Member, int]]
+            The members that are off cooldown, and the XP to add to them.
+        """
+        channel_id = message.channel.id
+        at_ts = message.created_at.timestamp()
+        awards: list[tuple[discord.Member, int]] = []
+        for member in members:
+            if old_xp[member.id] // XP_PER_LEVEL >= 2 and num_unique == 2:
+                continue
+
+            key = (channel_id, member.id)
+            last_award = self.awards.get(key, at_ts)
+            if last_award is not None and at_ts - last_award <= AWARD_COOLDOWN:
+                continue
+            awards.append((member, 3 if last_award is not None and at_ts - last_award <= AWARD_BONUS_INTERVAL else 1))
+        return awards
+
+    def _start_cooldowns(self, message: discord.Message, user_ids: Iterable[int]) -> None:
+        """Record that members gained XP for a message in its channel.
+
+        Parameters
+        ----------
+        message : discord.Message
+            The message the XP was gained for.
+        user_ids : Iterable[int]
+            The ids of the members that gained XP.
+        """
+        at_ts = message.created_at.timestamp()
+        for user_id in user_ids:
+            self.awards.set((message.channel.id, user_id), at_ts, at_ts)
+
+    @tasks.loop()
+    async def apply_level_ups(self):
+        """Queue the level roles and send the congratulations for level ups, after their XP has been committed.
+
+        This runs separately from :meth:`proc_xp`, so slow Discord requests never hold up XP processing.
+        """
+        channel, level_ups = await self.level_ups.get()
+        for member, level in level_ups:
+            self.role_sync.update(member, level, f"Level {level} reached")
+        try:
+            await channel.send(
+                "\n".join(
+                    f"Congratulations {member.mention}, you have reached level **{level}**!"
+                    for member, level in level_ups
+                )
             )
-            message_tuple = (created_at, author_id)
+        except discord.HTTPException:
+            _LOGGER.exception("Failed to send level up congratulations")
 
-            if channel_id not in self.buckets:
-                self.buckets[channel_id] = deque([message_tuple])
-                return
-            bucket = self.buckets[channel_id]
-            bucket.append(message_tuple)
+    @tasks.loop()
+    async def sync_roles(self):
+        """Apply the queued level role updates."""
+        await self.role_sync.apply_next()
 
-            oldest_allowed = created_at - datetime.timedelta(seconds=INTERVAL_LENGTH)
+    @tasks.loop(seconds=5)
+    async def flush_last_messages(self):
+        """Write the buffered last message times to the database."""
+        try:
+            await self.last_messages.flush(self.bot.background("leveling"))
+        except (asyncpg.PostgresError, OSError):
+            _LOGGER.exception("Failed to flush %s last message times, retrying later", len(self.last_messages))
 
-            while bucket:
-                first_dt, *_ = bucket[0]
-                if first_dt < oldest_allowed:
-                    bucket.popleft()
-                else:
-                    break
+    def set_no_xp(self, record: queries.NoXpRow | None) -> None:
+        """Replace the cached no XP configuration of a guild after the ``no_xp`` table was changed.
 
-            oldest_allowed = created_at - datetime.timedelta(seconds=INTERVAL_LENGTH // 2)
+        Parameters
+        ----------
+        record : queries.NoXpRow | None
+            The updated ``no_xp`` row. Nothing is changed if it is None.
+        """
+        if record is not None:
+            self.no_xp[record["guild"]] = NoXP.from_record(record)
 
-            unique_accounts = {author for _, author in bucket}
+    async def reload_ranks(self) -> None:
+        """Read the XP of every user into the rank cache again, after ``levels`` was changed in bulk."""
+        self.ranks.load(await queries.all_xp(self.bot.pool))
 
-            if (num_unique := len(unique_accounts)) < 2:
-                return
+    async def invalidate_no_xp(self, invalidation: Invalidation) -> None:
+        """Read the no XP configuration again after the ``no_xp`` table was changed, by the bot or anyone else.
 
-            messages: list[str] = []
-            no_xp_roles: frozenset[int] = frozenset(no_xp["roles"])
-            for user in unique_accounts:
-                if max(ts for ts, usr in bucket if usr == user) < oldest_allowed:
-                    continue
-                try:
-                    this_member = guild.get_member(user) or await guild.fetch_member(user)
-                except discord.HTTPException:
-                    continue
-
-                if any(role.id in no_xp_roles for role in this_member.roles):
-                    continue
-
-                old_xp: int = await conn.fetchval("SELECT xp FROM levels WHERE id = $1", user) or 0
-                if (old_level := old_xp // XP_PER_LEVEL) >= 2 and num_unique == 2:
-                    continue
-
-                at_ts = created_at.timestamp()
-                if user == author_id:
-                    cooldown = self.cooldown.get_bucket(message)
-                    off_cooldown = cooldown is None or cooldown.update_rate_limit(at_ts) is None
-                else:
-                    self.cooldown._verify_cache_integrity()
-                    key = (channel_id, user)
-                    if key not in self.cooldown._cache:
-                        cooldown = self.cooldown.create_bucket(message)
-                        self.cooldown._cache[key] = cooldown
-                        off_cooldown = cooldown.update_rate_limit(at_ts) is None or True
-                    else:
-                        cooldown = self.cooldown._cache[key]
-                        off_cooldown = cooldown.update_rate_limit(at_ts) is None
-
-                if off_cooldown:
-                    last_author_time = self.bucket_previous[channel_id][user]
-                    self.bucket_previous[channel_id][user] = this_author_time = time.monotonic()
-                    diff = this_author_time - last_author_time
-                    xp_to_add = 3 if diff <= INTERVAL_LENGTH * 1.5 else 1
-                    new_xp: int = await conn.fetchval(
-                        "INSERT INTO levels (id, xp, last_message) VALUES ($1, $2, $3) "
-                        "ON CONFLICT (id) DO UPDATE SET "
-                        "xp = EXCLUDED.xp, last_message = EXCLUDED.last_message "
-                        "RETURNING xp",
-                        user,
-                        min(XP_CAP, old_xp + xp_to_add),
-                        created_at,
-                    )
-                    if old_level < (level := new_xp // XP_PER_LEVEL):
-                        match level:
-                            case 1:
-                                await this_member.add_roles(LEVEL_1_ROLE, reason="Level 1 reached")
-                            case 2:
-                                await this_member.add_roles(LEVEL_2_ROLE, reason="Level 2 reached")
-                                await this_member.remove_roles(LEVEL_1_ROLE)
-                            case 3:
-                                await this_member.add_roles(LEVEL_3_ROLE, reason="Level 3 reached")
-                                await this_member.remove_roles(LEVEL_2_ROLE)
-                            case 4:
-                                await this_member.add_roles(LEVEL_4_ROLE, reason="Level 4 reached")
-                                await this_member.remove_roles(LEVEL_3_ROLE)
-                            case 5:
-                                await this_member.add_roles(LEVEL_5_ROLE, reason="Level 5 reached")
-                                await this_member.remove_roles(LEVEL_4_ROLE)
-                        messages.append(f"Congratulations {this_member.mention}, you have reached level **{level}**!")
-                    # await self.bot.error_logs.send(
-                    #     f"{this_member.mention} got `{old_xp} + {xp_to_add} => {new_xp}`  (level {old_level} => {level}) in channel <#{channel_id}>\n"
-                    #     f" - `{cooldown=!r}`\n"
-                    #     f" - `this_author_time - last_author_time = {this_author_time} - {last_author_time} = {diff}`\n"
-                    #     f" - `{off_cooldown=}`\n"
-                    #     f" - `{unique_accounts=}`\n - `{at_ts=}`"
-                    # )
-            if messages:
-                await message.channel.send("\n".join(messages))
+        Parameters
+        ----------
+        invalidation : Invalidation
+            The change, the whole table is read again if it has no key.
+        """
+        if invalidation.key is None:
+            records = await queries.all_no_xp(self.bot.pool)
+            self.no_xp = {record["guild"]: NoXP.from_record(record) for record in records}
+        elif (record := await queries.no_xp(self.bot.pool, invalidation.key)) is None:
+            self.no_xp.pop(invalidation.key, None)
+        else:
+            self.set_no_xp(record)
 
     @commands.Cog.listener()
     async def on_member_join(self, member: discord.Member) -> None:
@@ -189,21 +651,12 @@ class Leveling(commands.Cog):
         member : discord.Member
             The member that joined.
         """
-        async with self.bot.pool.acquire() as conn:
-            xp: int | None = await conn.fetchval("SELECT xp FROM levels WHERE id = $1", member.id)
-            if xp is None:
-                return
-            match xp // XP_PER_LEVEL:
-                case 1:
-                    await member.add_roles(LEVEL_1_ROLE, reason="Rejoined at level 1")
-                case 2:
-                    await member.add_roles(LEVEL_2_ROLE, reason="Rejoined at level 2")
-                case 3:
-                    await member.add_roles(LEVEL_3_ROLE, reason="Rejoined at level 3")
-                case 4:
-                    await member.add_roles(LEVEL_4_ROLE, reason="Rejoined at level 4")
-                case 5:
-                    await member.add_roles(LEVEL_5_ROLE, reason="Rejoined at level 5")
+        self.departed.discard(member.id)
+        xp = await queries.xp(self.bot.pool, member.id)
+        if xp is None:
+            return
+        if (level := xp // XP_PER_LEVEL) > 0:
+            self.role_sync.update(member, level, f"Rejoined at level {level}")
 
     @commands.Cog.listener()
     async def on_message_delete(self, message: discord.Message):
@@ -217,13 +670,9 @@ class Leveling(commands.Cog):
         if message.guild is None or message.guild != constants.GUILD_ID:
             return
         channel_id = message.channel.id
-        async with self.lock:
-            if channel_id in self.buckets:
-                bucket = self.buckets[channel_id]
-                try:
-                    bucket.remove((message.created_at, message.author.id))
-                except ValueError:
-                    pass
+        async with self.channel_lock(channel_id):
+            if (bucket := self.buckets.peek(channel_id)) is not None:
+                bucket.remove(message.created_at, message.author.id)
 
     @commands.Cog.listener()
     async def on_bulk_message_delete(self, messages: list[discord.Message]):
@@ -239,60 +688,224 @@ class Leveling(commands.Cog):
         if (guild := messages[0].guild) is None or guild.id != constants.GUILD_ID:
             return
         channel_id = messages[0].channel.id
-        async with self.lock:
-            if channel_id in self.buckets:
-                bucket = self.buckets[channel_id]
-                to_remove = {(message.created_at, message.author.id) for message in messages}
-                bucket = deque(entry for entry in bucket if entry not in to_remove)
-                self.buckets[channel_id] = bucket
+        async with self.channel_lock(channel_id):
+            if (bucket := self.buckets.peek(channel_id)) is not None:
+                for message in messages:
+                    bucket.remove(message.created_at, message.author.id)
+
+    async def find_role_drift(self) -> RoleDrift | None:
+        """Find the members of the guild whose level roles don't match the ``levels`` table.
+
+        This is a single pass over every ``levels`` row and the cached members, no members are fetched.
+
+        Returns
+        -------
+        RoleDrift | None
+            The drift, or None if the guild isn't cached.
+        """
+        if (guild := self.bot.get_guild(constants.GUILD_ID)) is None:
+            return None
+        rows = await queries.all_xp(self.bot.background("leveling"))
+        return RoleDrift.find(guild.members, dict(rows))
+
+    @tasks.loop(time=datetime.time(hour=6, tzinfo=datetime.UTC))
+    async def reconcile_roles(self):
+        """Fix level roles that have drifted from the ``levels`` table, like after outages or manual edits."""
+        if (drift := await self.find_role_drift()) is None:
+            return
+        for member, level in drift.members:
+            self.role_sync.update(member, level, "Level role reconciled")
+        _LOGGER.info(
+            "Queued level role fixes for %s members, %s roles were missing and %s were extra",
+            len(drift.members),
+            drift.missing,
+            drift.extra,
+        )
+
+    @commands.command(hidden=True, name="reconcile")
+    @commands.is_owner()
+    async def reconcile(self, ctx: commands.Context, apply: bool = False) -> None:
+        """Report, and optionally fix, level roles that have drifted from the ``levels`` table.
+
+        Parameters
+        ----------
+        ctx : commands.Context
+            The context of the command.
+        apply : bool
+            Whether to queue the fixes, by default only a dry run report is sent.
+        """
+        if (drift := await self.find_role_drift()) is None:
+            await ctx.send("The guild isn't cached.")
+            return
+        lines = [
+            f"{len(drift.members)} members have drifted level roles, "
+            f"{drift.missing} roles are missing and {drift.extra} are extra."
+        ]
+        lines.extend(f"{member.mention} should be level {level}" for member, level in drift.members[:20])
+        if len(drift.members) > 20:
+            lines.append(f"... and {len(drift.members) - 20} more")
+        if apply:
+            for member, level in drift.members:
+                self.role_sync.update(member, level, "Level role reconciled")
+            lines.append(f"Queued {len(drift.members)} role updates.")
+        else:
+            lines.append("Dry run, nothing was changed. Run again with `true` to apply the fixes.")
+        await ctx.send("\n".join(lines), allowed_mentions=discord.AllowedMentions.none())
+
+    @commands.command(hidden=True, name="levelstate")
+    @commands.is_owner()
+    async def level_state(self, ctx: commands.Context) -> None:
+        """Show how much in memory state the level system is tracking.
+
+        Parameters
+        ----------
+        ctx : commands.Context
+            The context of the command.
+        """
+        lines = [
+            f"{name}: {len(store)}/{store.maxsize} entries, ~{store.memory_usage() / 1024:.1f} KiB, "
+            f"{store.expirations} expired, {store.evictions} evicted"
+            for name, store in (("Channel windows", self.buckets), ("Award times", self.awards))
+        ]
+        lines.append(f"Buffered last message times: {len(self.last_messages)}")
+        await ctx.send("\n".join(lines))
 
     @app_commands.command()
     @app_commands.guilds(constants.GUILD_ID)
     @app_commands.checks.cooldown(1, 900, key=lambda interaction: interaction.user.id)
     async def rank(self, interaction: Interaction[CBot]):
-        """Check your level.
+        """Check your level and rank.
 
         Parameters
         ----------
         interaction : Interaction
             The interaction object.
         """
+        # Pillow and the card fonts are only loaded once someone asks for their rank
+        from . import card
+
         await interaction.response.defer(ephemeral=True)
         if interaction.guild is None:
             await interaction.followup.send("This Must be used in a guild")
             return
 
-        async with self.bot.pool.acquire() as conn:
-            xp: int | None = await conn.fetchval("SELECT xp FROM levels WHERE id = $1", interaction.user.id)
+        user = interaction.user
+        if (xp := self.ranks.get(user.id)) is None:
+            xp = await queries.xp(self.bot.pool, user.id)
             if xp is None:
                 await interaction.followup.send("You haven't interacted on the server yet.")
-            else:
-                await interaction.followup.send(f"You are level **{xp // XP_PER_LEVEL}**.")
+                return
+            self.ranks.update(user.id, xp)
+        level = xp // XP_PER_LEVEL
+        member = interaction.guild.get_member(user.id)
+        if member is None:
+            status = "offline"
+        elif any(isinstance(activity, discord.Streaming) for activity in member.activities):
+            status = "streaming"
+        else:
+            status = str(member.status)
+        avatar = BytesIO(await user.display_avatar.replace(size=256, static_format="png").read())
+        image = await asyncio.to_thread(
+            card.generate_profile,
+            user.display_name,
+            avatar,
+            level,
+            level * XP_PER_LEVEL,
+            xp,
+            (level + 1) * XP_PER_LEVEL,
+            self.ranks.rank(xp),
+            status,
+        )
+        await interaction.followup.send(file=discord.File(image, "rank.png"))
+
+    @app_commands.command()
+    @app_commands.guilds(constants.GUILD_ID)
+    async def leaderboard(self, interaction: Interaction[CBot]):
+        """See who has the most XP.
+
+        Parameters
+        ----------
+        interaction : Interaction
+            The interaction object.
+        """
+        view = LeaderboardView(self.bot.pool, self.ranks, interaction.user.id, XP_PER_LEVEL)
+        await view.load()
+        await interaction.response.send_message(view=view, allowed_mentions=discord.AllowedMentions.none())
 
     @tasks.loop(time=datetime.time(hour=0, tzinfo=datetime.UTC))
     async def drain(self):
-        async with self.lock, self.bot.pool.acquire() as conn, conn.transaction():
-            users = await conn.fetch(
-                "UPDATE levels SET xp = xp - 1 "
-                "WHERE xp > $1 AND last_message < (CURRENT_TIMESTAMP - '3 days'::interval) "
-                "RETURNING id, xp",
-                XP_PER_LEVEL * 2,
-            )
-            guild = self.bot.get_guild(constants.GUILD_ID) or await self.bot.fetch_guild(constants.GUILD_ID)
-            for user in users:
-                xp: int = user["xp"]
-                if (xp % XP_PER_LEVEL) >= XP_PER_LEVEL - 1:
-                    new_level: int = xp // XP_PER_LEVEL
-                    member = guild.get_member(user["id"]) or await guild.fetch_member(user["id"])
-                    if new_level == 2:
-                        await member.add_roles(LEVEL_2_ROLE, reason="Dropped to Level 2")
-                        await member.remove_roles(LEVEL_3_ROLE, LEVEL_4_ROLE, LEVEL_5_ROLE)
-                    elif new_level == 3:
-                        await member.add_roles(LEVEL_3_ROLE, reason="Dropped to Level 3")
-                        await member.remove_roles(LEVEL_4_ROLE, LEVEL_5_ROLE)
-                    elif new_level == 4:
-                        await member.add_roles(LEVEL_4_ROLE, reason="Dropped to Level 4")
-                        await member.remove_roles(LEVEL_5_ROLE)
+        """Decay the XP of inactive members, and update the roles of those that dropped a level.
+
+        Members lose XP if they haven't sent a message in three days. Only the decay itself holds the locks, the roles
+        are updated after it has been committed.
+        """
+        start = time.perf_counter()
+        budget = self.bot.background("leveling")
+        async with self.global_lock():
+            # The drain decides on last_message, so it has to be up to date first
+            await self.last_messages.flush(budget)
+            result = await queries.decay_xp(budget, XP_PER_LEVEL * 2, XP_PER_LEVEL)
+        for user in result.decayed:
+            if (xp := self.ranks.get(user)) is not None:
+                self.ranks.update(user, xp - 1)
+        dropped: list[tuple[int, int]] = list(zip(result.ids, result.levels, strict=True))
+        guild = self.bot.get_guild(constants.GUILD_ID) or await self.bot.fetch_guild(constants.GUILD_ID)
+        departed = 0
+        semaphore = asyncio.Semaphore(DRAIN_CONCURRENCY)
+
+        async def reconcile(user: int, level: int) -> None:
+            nonlocal departed
+            try:
+                member = await self._find_member(guild, user, semaphore)
+            except discord.HTTPException:
+                _LOGGER.exception("Failed to fetch member %s to update their level role", user)
+                return
+            if member is None:
+                departed += 1
+            else:
+                self.role_sync.update(member, level, f"Dropped to Level {level}")
+
+        async with asyncio.TaskGroup() as group:
+            for user, level in dropped:
+                group.create_task(reconcile(user, level))
+        _LOGGER.info(
+            "Drained XP from %s members, %s dropped a level and %s of those left the server, in %.2fs",
+            len(result.decayed),
+            len(dropped),
+            departed,
+            time.perf_counter() - start,
+        )
+
+    async def _find_member(
+        self, guild: discord.Guild, user: int, semaphore: asyncio.Semaphore
+    ) -> discord.Member | None:
+        """Get a member from the cache, or fetch them if they aren't known to have left.
+
+        Parameters
+        ----------
+        guild : discord.Guild
+            The guild.
+        user : int
+            The id of the member.
+        semaphore : asyncio.Semaphore
+            Limits how many members are fetched at once.
+
+        Returns
+        -------
+        discord.Member | None
+            The member, or None if they aren't in the guild.
+        """
+        if (member := guild.get_member(user)) is not None:
+            return member
+        now = time.time()
+        if self.departed.get(user, now):
+            return None
+        async with semaphore:
+            try:
+                return await guild.fetch_member(user)
+            except discord.NotFound:
+                self.departed.set(user, True, now)
+                return None
 
 
 async def setup(bot: CBot):
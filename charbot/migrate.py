@@ -0,0 +1,139 @@
+"""Versioned schema migrations, applied in order at startup and in the tests."""
+
+import hashlib
+import logging
+import pathlib
+import re
+from typing import NamedTuple
+
+import asyncpg
+from asyncpg.pool import PoolConnectionProxy
+
+
+__all__ = ("MIGRATIONS_DIR", "Migration", "applied", "discover", "migrate")
+
+_LOGGER = logging.getLogger("charbot.migrate")
+
+MIGRATIONS_DIR = pathlib.Path(__file__).parent / "migrations"
+
+# Migrations are named like 0002_indexes.sql, the number is the version they're applied in order of
+_FILENAME = re.compile(r"(\d+)_(\w+)\.sql")
+
+# Held while migrating, so bots started at the same time don't apply the same migration twice
+_LOCK_KEY = 0x63_68_61_72_62_6F_74  # "charbot"
+
+
+class Migration(NamedTuple):
+    """A migration file."""
+
+    version: int
+    name: str
+    path: pathlib.Path
+
+    @property
+    def sql(self) -> str:
+        """The statements of the migration."""
+        return self.path.read_text()
+
+    @property
+    def checksum(self) -> str:
+        """The SHA-256 of the statements, to notice when an applied migration has been edited."""
+        return hashlib.sha256(self.path.read_bytes()).hexdigest()
+
+
+def discover(directory: pathlib.Path = MIGRATIONS_DIR) -> list[Migration]:
+    """Find the migrations in a directory.
+
+    Parameters
+    ----------
+    directory : pathlib.Path
+        The directory to look in, defaults to the migrations shipped with the bot.
+
+    Returns
+    -------
+    list[Migration]
+        The migrations, ordered by version.
+
+    Raises
+    ------
+    ValueError
+        If a file isn't named like a migration, or two migrations have the same version.
+    """
+    migrations: dict[int, Migration] = {}
+    for path in directory.glob("*.sql"):
+        if (match := _FILENAME.fullmatch(path.name)) is None:
+            raise ValueError(f"Migration {path.name!r} isn't named like <version>_<name>.sql.")
+        version = int(match[1])
+        if version in migrations:
+            raise ValueError(f"Migrations {migrations[version].path.name!r} and {path.name!r} have the same version.")
+        migrations[version] = Migration(version, match[2], path)
+    return [migrations[version] for version in sorted(migrations)]
+
+
+async def applied(conn: asyncpg.Connection | PoolConnectionProxy) -> dict[int, str]:
+    """Get the migrations that have been applied to a database.
+
+    Parameters
+    ----------
+    conn : asyncpg.Connection | PoolConnectionProxy
+        The connection to the database.
+
+    Returns
+    -------
+    dict[int, str]
+        The checksum of every applied migration by version.
+    """
+    await conn.execute(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INT NOT NULL CONSTRAINT schema_migrations_pk PRIMARY KEY, "
+        "name TEXT NOT NULL, "
+        "checksum CHAR(64) NOT NULL, "
+        "applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+    )
+    return {
+        row["version"]: row["checksum"] for row in await conn.fetch("SELECT version, checksum FROM schema_migrations")
+    }
+
+
+async def migrate(
+    conn: asyncpg.Connection | PoolConnectionProxy, directory: pathlib.Path = MIGRATIONS_DIR
+) -> list[Migration]:
+    """Apply the migrations that haven't been applied to a database yet.
+
+    Every migration runs in its own transaction, so one that fails leaves the database at the version before it.
+
+    Parameters
+    ----------
+    conn : asyncpg.Connection | PoolConnectionProxy
+        The connection to the database.
+    directory : pathlib.Path
+        The directory to look for migrations in, defaults to the migrations shipped with the bot.
+
+    Returns
+    -------
+    list[Migration]
+        The migrations that were applied.
+    """
+    migrations = discover(directory)
+    await conn.execute("SELECT pg_advisory_lock($1)", _LOCK_KEY)
+    try:
+        done = await applied(conn)
+        pending: list[Migration] = []
+        for migration in migrations:
+            if (checksum := done.get(migration.version)) is None:
+                pending.append(migration)
+            elif checksum != migration.checksum:
+                _LOGGER.warning("Migration %s has been edited since it was applied", migration.path.name)
+        for migration in pending:
+            _LOGGER.info("Applying migration %s", migration.path.name)
+            async with conn.transaction():
+                await conn.execute(migration.sql)
+                await conn.execute(
+                    "INSERT INTO schema_migrations (version, name, checksum) VALUES ($1, $2, $3)",
+                    migration.version,
+                    migration.name,
+                    migration.checksum,
+                )
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", _LOCK_KEY)
+    return pending
@@ -14,6 +14,52 @@ CREATE TABLE IF NOT EXISTS users
     wins             SMALLINT DEFAULT 0
 );
 
+CREATE TABLE IF NOT EXISTS points_ledger
+(
+    user_id    BIGINT                   NOT NULL,
+    points     SMALLINT                 NOT NULL,
+    bonus      SMALLINT                 NOT NULL,
+    reset_at   TIMESTAMP WITH TIME ZONE NOT NULL,
+    awarded_at TIMESTAMP WITH TIME ZONE NOT NULL
+                DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS points_ledger_user_idx ON points_ledger (user_id, awarded_at);
+
+-- Awards game points in one round trip. The row lock taken by the upsert serializes concurrent awards for a member,
+-- so the daily participation cap of 10 can't be raced past. Returns the points gained, 0 if reset_at is in the past.
+CREATE OR REPLACE FUNCTION give_game_points(user_id BIGINT, game_points INT, bonus_points INT, reset_at TIMESTAMPTZ)
+    RETURNS INT
+    LANGUAGE plpgsql
+AS
+$$
+DECLARE
+    previous_dt TIMESTAMPTZ;
+    previous    INT;
+BEGIN
+    INSERT INTO users (id, points, last_claim, last_particip_dt, particip, won)
+    VALUES (user_id, 0, reset_at - INTERVAL '1 day', reset_at, 0, 0)
+    ON CONFLICT (id) DO UPDATE SET last_particip_dt = users.last_particip_dt
+    RETURNING last_particip_dt, particip INTO previous_dt, previous;
+    IF previous_dt < reset_at THEN
+        previous := 0;
+    ELSIF previous_dt > reset_at THEN
+        RETURN 0;
+    END IF;
+    IF previous + game_points > 10 THEN
+        bonus_points := ceil(GREATEST(10 - previous, 0) * bonus_points / game_points::NUMERIC);
+        game_points := GREATEST(10 - previous, 0);
+    END IF;
+    UPDATE users
+    SET points           = points + game_points + bonus_points,
+        last_particip_dt = reset_at,
+        particip         = previous + game_points,
+        won              = CASE WHEN previous_dt < reset_at THEN 0 ELSE won END + bonus_points
+    WHERE id = user_id;
+    RETURN game_points + bonus_points;
+END;
+$$;
+
 CREATE TABLE IF NOT EXISTS levels
 (
     id            BIGINT             NOT NULL
@@ -22,6 +68,8 @@ CREATE TABLE IF NOT EXISTS levels
     last_message  TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
 
+CREATE INDEX IF NOT EXISTS levels_xp_idx ON levels (xp DESC, id);
+
 CREATE TABLE IF NOT EXISTS no_xp
 (
     guild    BIGINT                          NOT NULL
@@ -0,0 +1,15 @@
+-- Indexes for the filters of the background jobs, which otherwise scan their whole table every run
+
+-- The leveling drain decays members whose last message is older than three days
+CREATE INDEX IF NOT EXISTS levels_last_message_idx ON levels (last_message, xp);
+
+-- The giveaway loop only looks for giveaways that are due and haven't been completed yet
+CREATE INDEX IF NOT EXISTS giveaway_due_idx ON giveaway (end_dt) WHERE NOT complete;
+
+-- Reserving a character request takes the oldest unassigned ones
+CREATE INDEX IF NOT EXISTS xcom_character_request_unassigned_idx
+    ON xcom_character_request (req_dt) WHERE fulfiller IS NULL;
+
+-- Submitting from a thread looks the request up by the thread it's fulfilled in
+CREATE INDEX IF NOT EXISTS xcom_character_request_thread_idx
+    ON xcom_character_request (fulfill_thread) WHERE fulfill_thread IS NOT NULL;
@@ -0,0 +1,33 @@
+-- Publishes every change to a cached table on the charbot_invalidate channel, so the bot can refresh its copy no matter
+-- who made the change. The first trigger argument is the key column of the table. Notifications are only sent when
+-- the transaction commits. Only no_xp has a subscriber, so it is the only table with triggers, other tables get theirs
+-- in the migration that adds their subscriber.
+CREATE OR REPLACE FUNCTION notify_invalidation()
+    RETURNS TRIGGER
+    LANGUAGE plpgsql
+AS
+$$
+DECLARE
+    changed JSONB;
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        changed := NULL;
+    ELSIF TG_OP = 'DELETE' THEN
+        changed := to_jsonb(OLD);
+    ELSE
+        changed := to_jsonb(NEW);
+    END IF;
+    PERFORM pg_notify(
+        'charbot_invalidate',
+        jsonb_build_object('table', TG_TABLE_NAME, 'op', TG_OP, 'key', changed -> TG_ARGV[0])::TEXT
+    );
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE TRIGGER no_xp_invalidate
+    AFTER INSERT OR UPDATE OR DELETE ON no_xp
+    FOR EACH ROW EXECUTE FUNCTION notify_invalidation('guild');
+CREATE OR REPLACE TRIGGER no_xp_invalidate_all
+    AFTER TRUNCATE ON no_xp
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_invalidation('guild');
@@ -0,0 +1,145 @@
+"""Write behind ledger for game points."""
+
+import datetime
+
+import asyncpg
+
+from . import queries
+
+
+__all__ = ("DAILY_CAP", "PointsLedger", "cap_award")
+
+# The most participation points a user can gain from games each day
+DAILY_CAP = 10
+
+
+def cap_award(previous: int, points: int, bonus: int) -> tuple[int, int]:
+    """Cap an award to the participation points left for the day.
+
+    The bonus is scaled down with the points, rounding up. This matches the ``give_game_points`` database function.
+
+    Parameters
+    ----------
+    previous : int
+        The participation points already gained today.
+    points : int
+        The participation points to give.
+    bonus : int
+        The bonus points to give.
+
+    Returns
+    -------
+    tuple[int, int]
+        The participation and bonus points that can be given.
+    """
+    if previous + points <= DAILY_CAP:
+        return points, bonus
+    real_points = max(DAILY_CAP - previous, 0)
+    return real_points, -(-(real_points * bonus) // points)
+
+
+class PointsLedger:
+    """Game point awards that are calculated in memory, and written in batches.
+
+    The participation gained today by each user is cached, loaded from ``users`` the first time they are awarded
+    points each day, so the points gained can be returned without a database round trip. Awards are appended to the
+    ``points_ledger`` table and summed into ``users`` by :meth:`flush`.
+
+    Parameters
+    ----------
+    pool : asyncpg.Pool
+        The database pool.
+    """
+
+    __slots__ = ("_pending", "_reset", "_today", "pool")
+
+    def __init__(self, pool: asyncpg.Pool):
+        self.pool = pool
+        self._pending: list[tuple[int, int, int, datetime.datetime, datetime.datetime]] = []
+        # user id -> (last participation reset, participation gained since it)
+        self._today: dict[int, tuple[datetime.datetime, int]] = {}
+        self._reset = datetime.datetime.min.replace(tzinfo=datetime.UTC)
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    async def award(self, user: int, points: int, bonus: int, reset_at: datetime.datetime) -> int:
+        """Give a user points for a game.
+
+        Parameters
+        ----------
+        user : int
+            The id of the user.
+        points : int
+            The participation points to give.
+        bonus : int
+            The bonus points to give.
+        reset_at : datetime.datetime
+            The time of the last daily reset.
+
+        Returns
+        -------
+        int
+            The points gained.
+        """
+        if reset_at > self._reset:
+            # Everyone starts the day at 0, so nothing cached from yesterday is needed
+            self._today.clear()
+            self._reset = reset_at
+        if user not in self._today:
+            row = await queries.participation(self.pool, user)
+            # Another award may have loaded the user while waiting
+            if user not in self._today:
+                self._today[user] = (reset_at, 0) if row is None else row
+        particip_dt, previous = self._today[user]
+        if particip_dt > reset_at:
+            return 0
+        if particip_dt < reset_at:
+            previous = 0
+        points, bonus = cap_award(previous, points, bonus)
+        self._today[user] = (reset_at, previous + points)
+        if points or bonus:
+            self._pending.append((user, points, bonus, reset_at, datetime.datetime.now(datetime.UTC)))
+        return points + bonus
+
+    async def flush(self) -> int:
+        """Write the pending awards to the ledger, and add them to ``users``.
+
+        If the write fails, the awards are kept to be written with the next flush.
+
+        Returns
+        -------
+        int
+            The number of awards that were written.
+        """
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, []
+        # user id -> [points, participation, bonus, reset]
+        totals: dict[int, list] = {}
+        for user, points, bonus, reset_at, _ in pending:
+            total = totals.setdefault(user, [0, 0, 0, reset_at])
+            if reset_at > total[3]:
+                total[1:] = [0, 0, reset_at]
+            total[0] += points + bonus
+            total[1] += points
+            total[2] += bonus
+        try:
+            async with self.pool.acquire() as conn, conn.transaction():
+                await conn.copy_records_to_table(
+                    "points_ledger",
+                    records=pending,
+                    columns=("user_id", "points", "bonus", "reset_at", "awarded_at"),
+                )
+                await queries.apply_awards(
+                    conn,
+                    list(totals),
+                    [total[0] for total in totals.values()],
+                    [total[1] for total in totals.values()],
+                    [total[2] for total in totals.values()],
+                    [total[3] for total in totals.values()],
+                )
+        except BaseException:
+            self._pending[:0] = pending
+            raise
+        return len(pending)
@@ -0,0 +1,377 @@
+"""Every statement the bot runs often, declared once and prepared on each connection of the pool.
+
+The functions take the pool, a :class:`~charbot.db.Budget` or a connection to run on, so they can be used inside a
+transaction too. Statements that only exist inside one transaction, like the ones on temporary tables, and the rarely
+used ones of the XCOM workflow, are kept next to their code.
+"""
+
+import datetime
+from typing import TYPE_CHECKING, NamedTuple, TypedDict, cast
+
+import asyncpg
+from asyncpg.pool import PoolConnectionProxy
+
+from .db import Budget
+
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .betas._types import BannerStatus, BannerStatusPoints
+
+
+__all__ = (
+    "STATEMENTS",
+    "Decay",
+    "Executor",
+    "GiveawayRow",
+    "NoXpRow",
+    "Participation",
+    "Statement",
+    "UserRow",
+    "XpRow",
+    "all_no_xp",
+    "all_xp",
+    "apply_awards",
+    "approve_banner",
+    "award_xp",
+    "banner",
+    "banner_cooldown",
+    "block_xp",
+    "complete_giveaway",
+    "decay_xp",
+    "delete_banner",
+    "due_giveaways",
+    "give_game_points",
+    "leaderboard",
+    "lock_xp",
+    "no_xp",
+    "participation",
+    "pending_banner",
+    "request_banner",
+    "spend_points",
+    "statements",
+    "user",
+    "user_points",
+    "xp",
+)
+
+# Anything queries can be run on
+Executor = asyncpg.Pool | Budget | PoolConnectionProxy | asyncpg.Connection
+
+# Every declared statement, by name
+STATEMENTS: dict[str, "Statement"] = {}
+
+
+class Statement:
+    """A statement that is prepared on every connection of the pool.
+
+    Parameters
+    ----------
+    name : str
+        The unique name of the statement.
+    sql : str
+        The text of the statement.
+    """
+
+    __slots__ = ("name", "sql")
+
+    def __init__(self, name: str, sql: str):
+        if name in STATEMENTS:
+            raise ValueError(f"Statement {name!r} is already declared.")
+        self.name = name
+        self.sql = sql
+        STATEMENTS[name] = self
+
+    def __repr__(self) -> str:
+        return f"<Statement {self.name!r}>"
+
+
+class XpRow(NamedTuple):
+    """The XP of a user."""
+
+    id: int
+    xp: int
+
+
+class Participation(NamedTuple):
+    """The game participation points a user gained since a reset."""
+
+    last_particip_dt: datetime.datetime
+    particip: int
+
+
+class Decay(NamedTuple):
+    """The users whose XP decayed, and the ones of them that dropped a level."""
+
+    decayed: list[int]
+    ids: list[int]
+    levels: list[int]
+
+
+class UserRow(TypedDict):
+    """A ``users`` row."""
+
+    id: int
+    points: int
+    last_claim: datetime.datetime
+    last_particip_dt: datetime.datetime
+    particip: int
+    won: int
+    wins: int | None
+
+
+class NoXpRow(TypedDict):
+    """A ``no_xp`` row, the channels and roles of a guild that are blocked from gaining XP."""
+
+    guild: int
+    channels: list[int]
+    roles: list[int]
+
+
+class GiveawayRow(TypedDict):
+    """A ``giveaway`` row."""
+
+    channel: int
+    end_dt: datetime.datetime
+    winners: int
+    game: str
+    distributor: int
+    complete: bool
+    min_level: int
+    random_num: bool
+
+
+# users
+USER = Statement("user", "SELECT * FROM users WHERE id = $1")
+USER_POINTS = Statement("user_points", "SELECT points FROM users WHERE id = $1")
+SPEND_POINTS = Statement("spend_points", "UPDATE users SET points = points - $2 WHERE id = $1 RETURNING points")
+PARTICIPATION = Statement("participation", "SELECT last_particip_dt, particip FROM users WHERE id = $1")
+GIVE_GAME_POINTS = Statement("give_game_points", "SELECT give_game_points($1, $2, $3, $4)")
+APPLY_AWARDS = Statement(
+    "apply_awards",
+    "INSERT INTO users AS u (id, points, last_claim, last_particip_dt, particip, won) "
+    "SELECT id, points, reset_at - INTERVAL '1 day', reset_at, particip, won "
+    "FROM unnest($1::BIGINT[], $2::INT[], $3::INT[], $4::INT[], $5::TIMESTAMPTZ[]) "
+    "AS t(id, points, particip, won, reset_at) "
+    "ON CONFLICT (id) DO UPDATE SET points = u.points + EXCLUDED.points, "
+    "particip = CASE WHEN u.last_particip_dt = EXCLUDED.last_particip_dt "
+    "THEN u.particip + EXCLUDED.particip ELSE EXCLUDED.particip END, "
+    "won = CASE WHEN u.last_particip_dt = EXCLUDED.last_particip_dt "
+    "THEN u.won + EXCLUDED.won ELSE EXCLUDED.won END, "
+    "last_particip_dt = GREATEST(u.last_particip_dt, EXCLUDED.last_particip_dt)",
+)
+
+# levels
+ALL_XP = Statement("all_xp", "SELECT id, xp FROM levels")
+XP = Statement("xp", "SELECT xp FROM levels WHERE id = $1")
+LOCK_XP = Statement("lock_xp", "SELECT id, xp FROM levels WHERE id = ANY($1::BIGINT[]) ORDER BY id FOR UPDATE")
+AWARD_XP = Statement(
+    "award_xp",
+    "INSERT INTO levels (id, xp, last_message) "
+    "SELECT id, LEAST($3, xp), $4 FROM unnest($1::BIGINT[], $2::BIGINT[]) AS t (id, xp) "
+    "ON CONFLICT (id) DO UPDATE SET "
+    "xp = LEAST($3, levels.xp + EXCLUDED.xp), last_message = EXCLUDED.last_message "
+    "RETURNING id, xp",
+)
+DECAY_XP = Statement(
+    "decay_xp",
+    "WITH decayed AS ("
+    "UPDATE levels SET xp = xp - 1 "
+    "WHERE xp > $1 AND last_message < (CURRENT_TIMESTAMP - '3 days'::interval) "
+    "RETURNING id, xp"
+    ") "
+    "SELECT coalesce(array_agg(id), '{}') AS decayed, "
+    "coalesce(array_agg(id) FILTER (WHERE xp % $2 = $2 - 1), '{}') AS ids, "
+    "coalesce(array_agg(xp / $2) FILTER (WHERE xp % $2 = $2 - 1), '{}') AS levels "
+    "FROM decayed",
+)
+LEADERBOARD = Statement("leaderboard", "SELECT xp, id FROM levels WHERE xp > 0 ORDER BY xp DESC, id LIMIT $1")
+LEADERBOARD_AFTER = Statement(
+    "leaderboard_after",
+    "SELECT xp, id FROM levels WHERE xp > 0 AND (xp < $1 OR (xp = $1 AND id > $2)) ORDER BY xp DESC, id LIMIT $3",
+)
+
+# no_xp
+ALL_NO_XP = Statement("all_no_xp", "SELECT * FROM no_xp")
+NO_XP = Statement("no_xp", "SELECT * FROM no_xp WHERE guild = $1")
+BLOCK_ROLE = Statement("block_role", "UPDATE no_xp SET roles = array_append(roles, $2) WHERE guild = $1 RETURNING *")
+UNBLOCK_ROLE = Statement(
+    "unblock_role", "UPDATE no_xp SET roles = array_remove(roles, $2) WHERE guild = $1 RETURNING *"
+)
+BLOCK_CHANNEL = Statement(
+    "block_channel", "UPDATE no_xp SET channels = array_append(channels, $2) WHERE guild = $1 RETURNING *"
+)
+UNBLOCK_CHANNEL = Statement(
+    "unblock_channel", "UPDATE no_xp SET channels = array_remove(channels, $2) WHERE guild = $1 RETURNING *"
+)
+
+# banners
+BANNER = Statement(
+    "banner",
+    "SELECT banners.user_id as user_id, quote, banners.color as color, cooldown, approved, u.points as points "
+    "FROM banners JOIN users u on banners.user_id = u.id WHERE banners.user_id = $1",
+)
+PENDING_BANNER = Statement(
+    "pending_banner",
+    "SELECT banners.user_id as user_id, quote, banners.color as color, cooldown, approved, u.points as points "
+    "FROM banners JOIN users u on banners.user_id = u.id WHERE banners.approved = FALSE ORDER BY cooldown LIMIT 1",
+)
+REQUEST_BANNER = Statement(
+    "request_banner",
+    "INSERT INTO banners (user_id, quote, color) VALUES ($1, $2, $3) ON CONFLICT (user_id) DO UPDATE SET "
+    "quote = EXCLUDED.quote, color = EXCLUDED.color, approved = FALSE",
+)
+BANNER_COOLDOWN = Statement("banner_cooldown", "UPDATE banners SET cooldown = $2 WHERE user_id = $1")
+APPROVE_BANNER = Statement("approve_banner", "UPDATE banners SET approved = TRUE, cooldown = now() WHERE user_id = $1")
+DELETE_BANNER = Statement("delete_banner", "DELETE FROM banners WHERE user_id = $1")
+
+# giveaways
+DUE_GIVEAWAYS = Statement("due_giveaways", "SELECT * FROM giveaway WHERE end_dt <= $1 AND complete = FALSE")
+COMPLETE_GIVEAWAY = Statement("complete_giveaway", "UPDATE giveaway SET complete = TRUE WHERE channel = $1")
+
+
+def statements() -> list[str]:
+    """Get the text of every declared statement, to prepare them on new connections.
+
+    Returns
+    -------
+    list[str]
+        The text of each statement.
+    """
+    return [statement.sql for statement in STATEMENTS.values()]
+
+
+async def user(db: Executor, user_id: int) -> UserRow | None:
+    """Get the ``users`` row of a user."""
+    return cast("UserRow | None", await db.fetchrow(USER.sql, user_id))
+
+
+async def user_points(db: Executor, user_id: int) -> int | None:
+    """Get the points of a user, or None if they have none yet."""
+    return await db.fetchval(USER_POINTS.sql, user_id)
+
+
+async def spend_points(db: Executor, user_id: int, points: int) -> int:
+    """Take points from a user, and get the points they have left."""
+    return await db.fetchval(SPEND_POINTS.sql, user_id, points)
+
+
+async def participation(db: Executor, user_id: int) -> Participation | None:
+    """Get the game participation of a user, or None if they haven't played yet."""
+    row = await db.fetchrow(PARTICIPATION.sql, user_id)
+    return None if row is None else Participation(row["last_particip_dt"], row["particip"])
+
+
+async def give_game_points(db: Executor, user_id: int, points: int, bonus: int, reset_at: datetime.datetime) -> int:
+    """Give a user game points with the ``give_game_points`` database function, and get the points gained."""
+    return await db.fetchval(GIVE_GAME_POINTS.sql, user_id, points, bonus, reset_at)
+
+
+async def apply_awards(
+    db: Executor,
+    users: list[int],
+    points: list[int],
+    particip: list[int],
+    won: list[int],
+    reset_at: list[datetime.datetime],
+) -> None:
+    """Add summed game point awards to ``users``, one element of each list per user."""
+    await db.execute(APPLY_AWARDS.sql, users, points, particip, won, reset_at)
+
+
+async def all_xp(db: Executor) -> list[XpRow]:
+    """Get the XP of every user."""
+    return [XpRow(row["id"], row["xp"]) for row in await db.fetch(ALL_XP.sql)]
+
+
+async def xp(db: Executor, user_id: int) -> int | None:
+    """Get the XP of a user, or None if they have none yet."""
+    return await db.fetchval(XP.sql, user_id)
+
+
+async def lock_xp(db: Executor, user_ids: list[int]) -> list[XpRow]:
+    """Lock the ``levels`` rows of users in id order, and get their XP. Users without a row are left out."""
+    return [XpRow(row["id"], row["xp"]) for row in await db.fetch(LOCK_XP.sql, user_ids)]
+
+
+async def award_xp(
+    db: Executor, user_ids: list[int], xp_to_add: list[int], cap: int, at: datetime.datetime
+) -> list[XpRow]:
+    """Add XP to users, capped, and get their new XP."""
+    return [XpRow(row["id"], row["xp"]) for row in await db.fetch(AWARD_XP.sql, user_ids, xp_to_add, cap, at)]
+
+
+async def decay_xp(db: Executor, above: int, xp_per_level: int) -> Decay:
+    """Take one XP from every inactive user with more than ``above`` XP."""
+    row = await db.fetchrow(DECAY_XP.sql, above, xp_per_level)
+    assert row is not None  # skipcq: BAN-B101
+    return Decay(row["decayed"], row["ids"], row["levels"])
+
+
+async def leaderboard(db: Executor, after: tuple[int, int] | None, limit: int) -> list[tuple[int, int]]:
+    """Get the XP and id of up to ``limit`` users in rank order, starting after the XP and id in ``after``."""
+    if after is None:
+        rows = await db.fetch(LEADERBOARD.sql, limit)
+    else:
+        rows = await db.fetch(LEADERBOARD_AFTER.sql, *after, limit)
+    return [(row["xp"], row["id"]) for row in rows]
+
+
+async def all_no_xp(db: Executor) -> list[NoXpRow]:
+    """Get the no XP configuration of every guild."""
+    return cast("list[NoXpRow]", await db.fetch(ALL_NO_XP.sql))
+
+
+async def no_xp(db: Executor, guild: int | None) -> NoXpRow | None:
+    """Get the no XP configuration of a guild."""
+    return cast("NoXpRow | None", await db.fetchrow(NO_XP.sql, guild))
+
+
+async def block_xp(
+    db: Executor, guild: int | None, *, role: int | None = None, channel: int | None = None, blocked: bool
+) -> NoXpRow | None:
+    """Add a role or channel to, or remove it from, the no XP configuration of a guild, and get the new one."""
+    if role is not None:
+        row = await db.fetchrow((BLOCK_ROLE if blocked else UNBLOCK_ROLE).sql, guild, role)
+    else:
+        row = await db.fetchrow((BLOCK_CHANNEL if blocked else UNBLOCK_CHANNEL).sql, guild, channel)
+    return cast("NoXpRow | None", row)
+
+
+async def banner(db: Executor, user_id: int) -> "BannerStatusPoints | None":
+    """Get the banner of a user, with their points."""
+    return cast("BannerStatusPoints | None", await db.fetchrow(BANNER.sql, user_id))
+
+
+async def pending_banner(db: Executor) -> "BannerStatus | None":
+    """Get the banner that has waited the longest for approval."""
+    return cast("BannerStatus | None", await db.fetchrow(PENDING_BANNER.sql))
+
+
+async def request_banner(db: Executor, user_id: int, quote: str, color: str | None) -> None:
+    """Request a new banner, or a change to an existing one, which has to be approved again."""
+    await db.execute(REQUEST_BANNER.sql, user_id, quote, color)
+
+
+async def banner_cooldown(db: Executor, user_id: int, until: datetime.datetime) -> None:
+    """Set when the banner of a user can be shown again."""
+    await db.execute(BANNER_COOLDOWN.sql, user_id, until)
+
+
+async def approve_banner(db: Executor, user_id: int) -> None:
+    """Approve the banner of a user."""
+    await db.execute(APPROVE_BANNER.sql, user_id)
+
+
+async def delete_banner(db: Executor, user_id: int) -> None:
+    """Delete the banner of a user."""
+    await db.execute(DELETE_BANNER.sql, user_id)
+
+
+async def due_giveaways(db: Executor, now: datetime.datetime) -> list[GiveawayRow]:
+    """Get the giveaways that have ended but aren't complete yet."""
+    return cast("list[GiveawayRow]", await db.fetch(DUE_GIVEAWAYS.sql, now))
+
+
+async def complete_giveaway(db: Executor, channel: int) -> None:
+    """Mark the giveaway of a channel as complete."""
+    await db.execute(COMPLETE_GIVEAWAY.sql, channel)
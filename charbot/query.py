@@ -9,13 +9,12 @@ from typing import TYPE_CHECKING, Final, cast
 from zoneinfo import ZoneInfo
 
 import discord
-import pytesseract
 from discord import Interaction, app_commands
 from discord.ext import commands, tasks
 from discord.ext.commands import Cog, Context
-from PIL import Image, ImageOps
 
-from . import constants
+from . import constants, queries
+from .state import StateKey
 
 
 if TYPE_CHECKING:  # pragma: no cover
@@ -45,6 +44,8 @@ __rules__: Final[dict[int, str]] = {
     "Find a way to say it another way, if the bot kills your message.",
 }
 __source__ = "<https://github.com/Bluesy1/CharB0T/tree/main/charbot>"
+# The messages that were already read, so the same image isn't read twice
+_OCR_DONE: StateKey[set[int]] = StateKey("query_ocr_done", set, dump=sorted, load=set)
 
 
 class Query(Cog):
@@ -67,12 +68,12 @@ class Query(Cog):
 
     async def cog_load(self) -> None:  # pragma: no cover
         """Load the cog."""
-        self.ocr_done = self.bot.holder.get("ocr_done", self.ocr_done)
+        self.ocr_done = self.bot.holder.take(_OCR_DONE)
         self.clear_ocr_done.start()
 
     async def cog_unload(self) -> None:  # pragma: no cover
         """Unload the cog."""
-        self.bot.holder["ocr_done"] = self.ocr_done
+        self.bot.holder.put(_OCR_DONE, self.ocr_done)
         self.clear_ocr_done.cancel()
 
     def cog_check(self, ctx: Context) -> bool:
@@ -152,6 +153,9 @@ class Query(Cog):
     @staticmethod
     def get_text(image: BytesIO) -> str:  # pragma: no cover
         """Get the text from an image using pytesseract"""
+        import pytesseract
+        from PIL import Image, ImageOps
+
         img = Image.open(image)
         if getattr(img, "is_animated", False):
             img.seek(0)
@@ -173,6 +177,9 @@ class Query(Cog):
         image : discord.Attachment | None
             The image to pull text from.
         """
+        # Imported on first use, OCR is rare and pytesseract isn't needed to start the bot
+        import pytesseract
+
         try:
             langs = pytesseract.get_languages()
         except pytesseract.TesseractNotFoundError:
@@ -363,7 +370,7 @@ class Query(Cog):
         end = perf_counter()
         typing = end - start
         start = perf_counter()
-        await self.bot.pool.fetchrow("SELECT * FROM users WHERE id = $1", ctx.author.id)
+        await queries.user(self.bot.pool, ctx.author.id)
         end = perf_counter()
         database = end - start
         start = perf_counter()
@@ -0,0 +1,66 @@
+"""Typed state that cogs hand over through reloads and restarts."""
+
+import os
+import pathlib
+from collections.abc import Callable
+from typing import Any
+
+
+__all__ = ("STATE_FILE", "STATE_KEYS", "STATE_VERSION", "StateKey")
+
+# Bumped when a change to a key's dump format can't be read by the old load
+STATE_VERSION = 1
+
+if path := os.getenv("CHARBOT_STATE_FILE"):  # pragma: no cover
+    STATE_FILE = pathlib.Path(path)
+else:
+    STATE_FILE = pathlib.Path(__file__).parent.parent / "state.json"
+
+# Every declared key by name, so state read from disk can be decoded once the cog that owns it declares its keys
+STATE_KEYS: dict[str, "StateKey[Any]"] = {}
+
+
+class StateKey[T]:
+    """A typed entry of :class:`~charbot.bot.Holder`.
+
+    Keys with ``dump`` and ``load`` are written to disk on shutdown and read back on startup, the others only survive
+    a reload of their cog.
+
+    Parameters
+    ----------
+    name : str
+        The unique name of the entry, prefixed with the cog that owns it.
+    default : Callable[[], T]
+        Creates the value when there is no saved one.
+    dump : Callable[[T], Any] | None
+        Converts the value to something JSON serializable.
+    load : Callable[[Any], T] | None
+        Converts the output of ``dump`` back to the value.
+    """
+
+    __slots__ = ("default", "dump", "load", "name")
+
+    def __init__(
+        self,
+        name: str,
+        default: Callable[[], T],
+        *,
+        dump: Callable[[T], Any] | None = None,
+        load: Callable[[Any], T] | None = None,
+    ):
+        if (dump is None) != (load is None):
+            raise ValueError(f"State key {name!r} needs both dump and load to be persisted, or neither.")
+        self.name = name
+        self.default = default
+        self.dump = dump
+        self.load = load
+        # Reloading a cog declares its keys again, the new ones replace the old ones
+        STATE_KEYS[name] = self
+
+    def __repr__(self) -> str:
+        return f"<StateKey {self.name!r} persisted={self.persisted}>"
+
+    @property
+    def persisted(self) -> bool:
+        """Whether the value is written to disk on shutdown."""
+        return self.dump is not None
@@ -859,15 +859,17 @@ Here is the details of the requested appearance to use to modify the attached bi
         after: discord.Message | None
             If provided, only messages after this message will be included in the rollup.
         """
+        # The rollup reads every submission, so it queues behind the hot path for its connections
+        budget = self.bot.background("xcom")
         submissions: dict[int, tuple[int, str]] = {
             message: (submitter, preferred_class)
-            for submitter, message, preferred_class in await self.bot.pool.fetch(
+            for submitter, message, preferred_class in await budget.fetch(
                 "SELECT submitter, message_id, preferred_class FROM xcom_character_submission;"
             )
         }
         submissions |= {
             message_id: (0, preferred_class)
-            for message_id, preferred_class in await self.bot.pool.fetch(
+            for message_id, preferred_class in await budget.fetch(
                 "SELECT message_id, preferred_class FROM xcom_character_submission_extra;"
             )
         }
@@ -955,7 +957,7 @@ Here is the details of the requested appearance to use to modify the attached bi
             names_per_tier += f"Extra Submissions ({len(extra_bins)}):\n"
             names_per_tier += "\n".join(xcom_helpers.get_names_from_pool(rolled_up_extra)) + "\n\n\n"
 
-        enhanced_metadata = await self.bot.pool.fetch(
+        enhanced_metadata = await budget.fetch(
             "SELECT requestor, first_name, last_name, nickname, country, "
             "gender, race, details, biography, fulfiller, fulfill_thread "
             "FROM xcom_character_request WHERE requestor = ANY($1);",
@@ -1004,7 +1006,7 @@ Here is the details of the requested appearance to use to modify the attached bi
                 if len(issues_message) > 1900:
                     issues_message = issues_message[:1900] + "\n... (truncated)"
                 await ctx.send(f"Issues encountered during rollup:\n{issues_message}")
-            await self.bot.pool.execute(
+            await budget.execute(
                 "UPDATE xcom_character_submission SET locked = TRUE WHERE submitter = ANY($1);", valid_submitters
             )
             assert ctx.guild is not None
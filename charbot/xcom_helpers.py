@@ -1,5 +1,6 @@
 """Helpers for xcom.py"""
 
+import functools
 import io
 import pathlib
 import struct
@@ -20,8 +21,6 @@ __all__ = (
 )
 
 _MEDIA_BASE = pathlib.Path(__file__).parent / "media/xcom"
-_MALE_TEMPLATE = pathlib.Path(_MEDIA_BASE, "MALE.bin").read_bytes()
-_FEMALE_TEMPLATE = pathlib.Path(_MEDIA_BASE, "FEMALE.bin").read_bytes()
 _MALE_FILENAME_BYTESTRING = b"\x26\x00\x00\x00\x00\x00\x00\x00\x22\x00\x00\x00CharacterPool\\Importable\\MALE.bin\x00"
 _FEMALE_FILENAME_BYTESTRING = (
     b"\x28\x00\x00\x00\x00\x00\x00\x00\x24\x00\x00\x00CharacterPool\\Importable\\FEMALE.bin\x00"
@@ -125,6 +124,11 @@ def _write_name_prop(prop: str | bytes) -> bytes:
     return struct.pack("<i", prop_len + 8) + _PADDING + struct.pack("<i", prop_len) + prop + _PADDING
 
 
+@functools.cache
+def _template(name: str) -> bytes:
+    return pathlib.Path(_MEDIA_BASE, f"{name}.bin").read_bytes()
+
+
 def create_base_bin_file(
     first_name: str,
     last_name: str,
@@ -135,10 +139,10 @@ def create_base_bin_file(
     backstory: str,
 ) -> bytes:
     if gender == "male":
-        result = _MALE_TEMPLATE
+        result = _template("MALE")
         FILENAME_BYTESTRING = _MALE_FILENAME_BYTESTRING
     else:
-        result = _FEMALE_TEMPLATE
+        result = _template("FEMALE")
         FILENAME_BYTESTRING = _FEMALE_FILENAME_BYTESTRING
     result = result.replace(FILENAME_BYTESTRING, _write_str_prop(b"CharacterPool\\Importable\\TEMPLATE.bin"))
 
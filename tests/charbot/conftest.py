@@ -1,11 +1,12 @@
 import os
-import pathlib
 
 import asyncpg
 import asyncpg.cluster
 import pytest
 import pytest_asyncio
 
+from charbot import migrate
+
 
 if os.name != "nt":
     import uvloop
@@ -31,7 +32,8 @@ def cluster() -> asyncpg.cluster.TempCluster:  # pyright: ignore[reportInvalidTy
 async def database(cluster) -> asyncpg.Pool:  # pyright: ignore[reportInvalidTypeForm]
     """Create a database pool for a test."""
     pool: asyncpg.Pool[asyncpg.Record] = await asyncpg.create_pool(**cluster.get_connection_spec(), database="postgres")
-    await pool.execute((pathlib.Path(__file__).parent.parent.parent / "schema.sql").read_text())
+    async with pool.acquire() as conn:
+        await migrate.migrate(conn)
     await pool.execute("INSERT INTO users (id, points) VALUES (1, 50)")
     await pool.execute(
         "INSERT INTO banners (user_id, quote, color, cooldown, approved) VALUES (1, $1, $2, now(), FALSE)"
@@ -0,0 +1,84 @@
+import datetime
+
+from charbot.activity import ActivityWindow, ExpiringLRU
+
+
+NOW = datetime.datetime(2024, 1, 1, tzinfo=datetime.UTC)
+
+
+def seconds(amount: int) -> datetime.datetime:
+    return NOW + datetime.timedelta(seconds=amount)
+
+
+def test_add_tracks_unique_and_newest():
+    """Test that the window counts unique authors and keeps their newest message, even out of order"""
+    window = ActivityWindow()
+    window.add(seconds(0), 1)
+    window.add(seconds(10), 1)
+    window.add(seconds(5), 2)
+    window.add(seconds(3), 2)
+    assert len(window) == 2
+    assert window.newest(1) == seconds(10)
+    assert window.newest(2) == seconds(5)
+    assert window.newest(3) is None
+    assert sorted(window.active_since(seconds(6))) == [1]
+
+
+def test_expire():
+    """Test that expiring drops old messages, and authors without any messages left"""
+    window = ActivityWindow()
+    window.add(seconds(0), 1)
+    window.add(seconds(1), 2)
+    window.add(seconds(2), 1)
+    window.expire(seconds(2))
+    assert len(window) == 1
+    assert 2 not in window
+    assert window.newest(1) == seconds(2)
+
+
+def test_remove():
+    """Test that removed messages are gone, and are skipped when they expire"""
+    window = ActivityWindow()
+    window.add(seconds(0), 1)
+    window.add(seconds(1), 1)
+    window.add(seconds(1), 1)
+    window.add(seconds(2), 2)
+    assert window.remove(seconds(1), 1)
+    assert not window.remove(seconds(1), 2)
+    assert not window.remove(seconds(5), 1)
+    assert window.newest(1) == seconds(1)
+    assert window.remove(seconds(2), 2)
+    assert 2 not in window
+    window.expire(seconds(3))
+    # One of the duplicates was removed, and the other one expired with it
+    assert len(window) == 0
+    assert not window._deleted
+    window.add(seconds(3), 2)
+    assert window.newest(2) == seconds(3)
+
+
+def test_expiring_lru_expires():
+    """Test that entries expire once they haven't been set for the ttl"""
+    store: ExpiringLRU[int, str] = ExpiringLRU(10, 5)
+    store.set(1, "a", 0)
+    store.set(2, "b", 3)
+    assert store.get(1, 5) == "a"
+    assert store.get(1, 6) is None
+    assert store.expirations == 1
+    store.set(3, "c", 9)
+    assert 2 not in store
+    assert store.peek(3) == "c"
+    assert store.expirations == 2
+
+
+def test_expiring_lru_evicts_least_recently_set():
+    """Test that the least recently set entries are evicted when the store is full"""
+    store: ExpiringLRU[int, str] = ExpiringLRU(2, 60)
+    store.set(1, "a", 0)
+    store.set(2, "b", 0)
+    store.set(1, "a", 1)
+    store.set(3, "c", 2)
+    assert 2 not in store
+    assert len(store) == 2
+    assert store.evictions == 1
+    assert store.memory_usage() > 0
@@ -0,0 +1,47 @@
+import pathlib
+
+import asyncpg
+import orjson
+import pytest
+from pytest_mock import MockerFixture
+
+from charbot import backup
+
+
+@pytest.mark.asyncio
+async def test_restore_checks_the_backup(tmp_path: pathlib.Path, mocker: MockerFixture):
+    """Test that unknown tables, and tables missing from the backup or with other columns, are refused"""
+    conn = mocker.MagicMock()
+    manifest = {"tables": {"levels": {"columns": ["id", "xp"], "rows": 0}}}
+    (tmp_path / "manifest.json").write_bytes(orjson.dumps(manifest))
+    with pytest.raises(ValueError, match="only users, levels, banners"):
+        await backup.restore(conn, tmp_path, ["points_ledger"])
+    with pytest.raises(ValueError, match="has no users table"):
+        await backup.restore(conn, tmp_path, ["users"])
+    with pytest.raises(ValueError, match="columns of levels"):
+        await backup.restore(conn, tmp_path)
+    conn.transaction.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_round_trip(database: asyncpg.Pool, tmp_path: pathlib.Path):
+    """Test that a backup restores the rows it was made from, merged with the rows added since"""
+    await database.execute("INSERT INTO levels (id, xp) SELECT id, id * 10 FROM generate_series(1, 500) AS id")
+    progress: list[tuple[str, int, int | None]] = []
+    async with database.acquire() as conn:
+        rows = await backup.export(conn, tmp_path, progress=lambda *args: progress.append(args))
+    assert rows == {"users": 1, "levels": 500, "banners": 1}
+    assert {table for table, _, _ in progress} == {"users", "levels", "banners"}
+    assert orjson.loads((tmp_path / "manifest.json").read_bytes())["tables"]["levels"]["rows"] == 500
+
+    await database.execute("UPDATE levels SET xp = 0")
+    await database.execute("INSERT INTO levels (id, xp) VALUES (1000, 1)")
+    await database.execute("UPDATE banners SET approved = TRUE")
+    progress.clear()
+    async with database.acquire() as conn:
+        rows = await backup.restore(conn, tmp_path, ["levels", "banners"], lambda *args: progress.append(args))
+    assert rows == {"levels": 500, "banners": 1}
+    assert progress[-1][1] == progress[-1][2] == (tmp_path / "banners.copy").stat().st_size
+    assert await database.fetchval("SELECT sum(xp) FROM levels") == sum(range(10, 5001, 10)) + 1
+    assert await database.fetchval("SELECT approved FROM banners WHERE user_id = 1") is False
+    await database.execute("DELETE FROM levels")
@@ -1,3 +1,4 @@
+import asyncio
 import datetime
 import zoneinfo
 
@@ -9,21 +10,47 @@ from pytest_mock import MockerFixture
 
 from charbot import Config, _Config
 from charbot.bot import CBot, Holder, Tree
+from charbot.clock import ResetClock
+from charbot.state import StateKey
 
 
-@pytest.fixture
-def _patch_datetime_now(monkeypatch: pytest.MonkeyPatch) -> None:
-    """Patch the datetime.now() method to return a fixed time"""
-
-    class MyDateTime(datetime.datetime):
-        """A datetime class that returns a fixed time"""
+def test_holder_state(tmp_path):
+    """Test that typed state is saved, restored and decoded when it is taken"""
+    path = tmp_path / "state.json"
+    saved: StateKey[set[int]] = StateKey("test_saved", set, dump=sorted, load=set)
+    broken: StateKey[int] = StateKey("test_broken", lambda: 0, dump=str, load=lambda value: int(value) // 0)
+    memory: StateKey[list[int]] = StateKey("test_memory", list)
+    holder = Holder()
+    assert holder.take(saved) == set()
+    holder.put(saved, {2, 1})
+    holder.put(broken, 5)
+    holder.put(memory, [1])
+    assert holder.save(path) == 2
+    restored = Holder()
+    assert restored.restore(path) == 2
+    assert restored.take(saved) == {1, 2}
+    assert restored.take(saved) == set()
+    assert restored.take(broken) == 0
+    # Memory only state doesn't survive a restart
+    assert restored.take(memory) == []
+    # State that wasn't taken is saved again
+    later = Holder()
+    later.restore(path)
+    assert later.save(path) == 2
+    path.write_bytes(b'{"version": 0, "state": {}}')
+    assert Holder().restore(path) == 0
+    path.write_bytes(b"not json")
+    assert Holder().restore(path) == 0
+    assert Holder().restore(tmp_path / "missing.json") == 0
+    with pytest.raises(ValueError, match="both dump and load"):
+        StateKey("test_half", list, dump=list)
 
-        @classmethod
-        def now(cls, tz: datetime.tzinfo | None = None):
-            """Return a fixed time"""
-            return datetime.datetime(1, 1, 2, 1, 0, 0, 0, tzinfo=tz)
 
-    monkeypatch.setattr(datetime, "datetime", MyDateTime)
+@pytest.fixture
+def clock():
+    """Freeze the bot's reset clock, and let it run again after the test"""
+    yield CBot.CLOCK
+    CBot.CLOCK.unfreeze()
 
 
 def test_config():
@@ -51,59 +78,13 @@ def test_holder():
     assert holder.get("value") is MISSING
 
 
-@pytest.mark.usefixtures("_patch_datetime_now")
-def test_time():
+def test_time(clock: ResetClock):
     """Test the time class method"""
-    assert CBot.TIME() == datetime.datetime(1, 1, 1, 9, 0, 0, 0, tzinfo=zoneinfo.ZoneInfo(key="America/Detroit"))
-
-
-@pytest.mark.asyncio
-async def test_first_time_gain(database: asyncpg.Pool):
-    """Test that the first time gain is done properly"""
-    bot = CBot(command_prefix=[], tree_cls=Tree, intents=discord.Intents.default())
-    bot.pool = database
-    await bot.first_time_game_gain(10, 1, 1)
-    results = await database.fetchrow("SELECT points, last_particip_dt, particip, won FROM users WHERE id = 10")
-    assert results is not None
-    assert results["points"] == 2
-    assert results["last_particip_dt"] == bot.TIME()
-    assert results["particip"] == 1
-    assert results["won"] == 1
-
-
-@pytest.mark.asyncio
-async def test_first_gain_of_day(database: asyncpg.Pool):
-    """Test that the first gain of the day is done properly"""
-    bot = CBot(command_prefix=[], tree_cls=Tree, intents=discord.Intents.default())
-    bot.pool = database
-    await database.execute(
-        "INSERT INTO users (id, points, last_claim, last_particip_dt, particip, won) VALUES (10, 0, $1, $1, 10, 10)",
-        bot.TIME() - datetime.timedelta(days=1),
-    )
-    await bot.first_of_day_game_gain(10, 1, 1)
-    results = await database.fetchrow("SELECT points, last_particip_dt, particip, won FROM users WHERE id = 10")
-    assert results is not None
-    assert results["points"] == 2
-    assert results["last_particip_dt"] == bot.TIME()
-    assert results["particip"] == 1
-    assert results["won"] == 1
-
-
-@pytest.mark.asyncio
-async def test_fallback_gain(database: asyncpg.Pool):
-    """Test that the fallback gain is done properly"""
-    bot = CBot(command_prefix=[], tree_cls=Tree, intents=discord.Intents.default())
-    bot.pool = database
-    await database.execute(
-        "INSERT INTO users (id, points, last_claim, last_particip_dt, particip, won) VALUES (10, 0, $1, $1, 9, 9)",
-        bot.TIME(),
-    )
-    await bot.fallback_game_gain(10, 9, 2, 2)
-    results = await database.fetchrow("SELECT points, particip, won FROM users WHERE id = 10")
-    assert results is not None
-    assert results["points"] == 2
-    assert results["particip"] == 10
-    assert results["won"] == 10
+    zone = zoneinfo.ZoneInfo(key="America/Detroit")
+    clock.freeze(datetime.datetime(2024, 1, 2, 1, tzinfo=zone))
+    assert CBot.TIME() == datetime.datetime(2024, 1, 1, 9, tzinfo=zone)
+    clock.advance(datetime.timedelta(hours=8))
+    assert CBot.TIME() == datetime.datetime(2024, 1, 2, 9, tzinfo=zone)
 
 
 @pytest.mark.asyncio
@@ -170,3 +151,24 @@ async def test_give_game_points_final_branch_called(mocker: MockerFixture, datab
     assert results["points"] == 0
     assert results["particip"] == 7
     assert results["won"] == 7
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("existing", [True, False])
+async def test_give_game_points_concurrent(mocker: MockerFixture, database: asyncpg.Pool, existing: bool):
+    """Test that concurrent awards can't go past the daily cap, for new and existing users"""
+    bot = CBot(command_prefix=[], tree_cls=Tree, intents=discord.Intents.default())
+    bot.pool = database
+    if existing:
+        await database.execute(
+            "INSERT INTO users (id, points, last_claim, last_particip_dt, particip, won) VALUES (10, 5, $1, $1, 9, 9)",
+            bot.TIME() - datetime.timedelta(days=1),
+        )
+    member = mocker.AsyncMock(discord.Member, id=10)
+    gained = await asyncio.gather(*(bot.give_game_points(member, 3, 1) for _ in range(20)))
+    results = await database.fetchrow("SELECT points, particip, won FROM users WHERE id = 10")
+    assert results is not None
+    assert results["particip"] == 10
+    assert results["won"] == 4
+    assert results["points"] == sum(gained) + (5 if existing else 0)
+    assert sum(gained) == 14
@@ -0,0 +1,85 @@
+import asyncio
+import functools
+import logging
+
+import asyncpg
+import pytest
+from pytest_mock import MockerFixture
+
+from charbot import bus
+
+
+@pytest.mark.asyncio
+async def test_subscribers_get_changes_in_order(mocker: MockerFixture, caplog: pytest.LogCaptureFixture):
+    """Test that subscribers are called one change at a time, and a failing one doesn't stop the others"""
+    conn = mocker.MagicMock()
+    conn.add_listener = mocker.AsyncMock()
+    conn.close = mocker.AsyncMock()
+    invalidation_bus = bus.InvalidationBus(mocker.AsyncMock(return_value=conn))
+    received: list[bus.Invalidation] = []
+
+    async def subscriber(invalidation: bus.Invalidation):
+        await asyncio.sleep(0)
+        received.append(invalidation)
+
+    failing = mocker.AsyncMock(side_effect=RuntimeError)
+    invalidation_bus.subscribe("no_xp", failing)
+    invalidation_bus.subscribe("no_xp", subscriber)
+    await invalidation_bus.start()
+    conn.add_listener.assert_awaited_once_with(bus.CHANNEL, invalidation_bus._on_notification)
+    with caplog.at_level(logging.ERROR, logger="charbot.bus"):
+        invalidation_bus._on_notification(conn, 1, bus.CHANNEL, '{"table": "no_xp", "op": "UPDATE", "key": 1}')
+        invalidation_bus._on_notification(conn, 1, bus.CHANNEL, '{"table": "banners", "op": "DELETE", "key": 2}')
+        invalidation_bus._on_notification(conn, 1, bus.CHANNEL, '{"table": "no_xp", "op": "TRUNCATE", "key": null}')
+        invalidation_bus._on_notification(conn, 1, bus.CHANNEL, "not json")
+        for _ in range(5):
+            await asyncio.sleep(0)
+    assert received == [bus.Invalidation("no_xp", "UPDATE", 1), bus.Invalidation("no_xp", "TRUNCATE", None)]
+    assert failing.await_count == 2
+    assert "Ignoring malformed invalidation" in caplog.text
+    invalidation_bus.unsubscribe("no_xp", subscriber)
+    invalidation_bus.unsubscribe("no_xp", subscriber)
+    await invalidation_bus.close()
+    conn.close.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_resync_after_reconnect(mocker: MockerFixture):
+    """Test that subscribers are told to read everything again once a lost connection is back"""
+    conn = mocker.MagicMock()
+    conn.add_listener = mocker.AsyncMock()
+    conn.close = mocker.AsyncMock()
+    connect = mocker.AsyncMock(side_effect=[conn, OSError, conn])
+    invalidation_bus = bus.InvalidationBus(connect, retry=0)
+    subscriber = mocker.AsyncMock()
+    invalidation_bus.subscribe("no_xp", subscriber)
+    await invalidation_bus.start()
+    invalidation_bus._on_termination(conn)
+    assert not invalidation_bus.connected
+    for _ in range(10):
+        await asyncio.sleep(0)
+    assert connect.await_count == 3
+    subscriber.assert_awaited_once_with(bus.Invalidation("no_xp", bus.RESYNC, None))
+    await invalidation_bus.close()
+
+
+@pytest.mark.asyncio
+async def test_triggers_publish_changes(cluster, database: asyncpg.Pool):
+    """Test that changes committed to a cached table reach the bus, whoever makes them"""
+    invalidation_bus = bus.InvalidationBus(
+        functools.partial(asyncpg.connect, **cluster.get_connection_spec(), database="postgres")
+    )
+    received: asyncio.Queue[bus.Invalidation] = asyncio.Queue()
+    invalidation_bus.subscribe("no_xp", received.put)
+    await invalidation_bus.start()
+    try:
+        await database.execute("INSERT INTO no_xp (guild) VALUES (1)")
+        await database.execute("UPDATE no_xp SET roles = '{2}' WHERE guild = 1")
+        await database.execute("DELETE FROM no_xp WHERE guild = 1")
+        async with asyncio.timeout(5):
+            assert [(await received.get()).op for _ in range(3)] == ["INSERT", "UPDATE", "DELETE"]
+        await database.execute("TRUNCATE no_xp")
+        async with asyncio.timeout(5):
+            assert await received.get() == bus.Invalidation("no_xp", "TRUNCATE", None)
+    finally:
+        await invalidation_bus.close()
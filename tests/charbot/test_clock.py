@@ -0,0 +1,43 @@
+import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from charbot.clock import ResetClock
+
+
+ZONE = ZoneInfo("America/Detroit")
+
+
+def test_reset_is_cached_until_the_next_reset():
+    """Test that every call in a reset period gets the same reset, and it moves at the reset hour"""
+    clock = ResetClock(ZONE)
+    clock.freeze(datetime.datetime(2024, 5, 1, 8, 59, tzinfo=ZONE))
+    first = clock()
+    assert first == datetime.datetime(2024, 4, 30, 9, tzinfo=ZONE)
+    clock.advance(datetime.timedelta(seconds=59))
+    assert clock() is first
+    clock.advance(datetime.timedelta(seconds=1))
+    assert clock() == datetime.datetime(2024, 5, 1, 9, tzinfo=ZONE)
+    # Freezing earlier moves the reset back too
+    clock.freeze(datetime.datetime(2024, 4, 1, 12, tzinfo=ZONE))
+    assert clock() == datetime.datetime(2024, 4, 1, 9, tzinfo=ZONE)
+    assert clock.now() == datetime.datetime(2024, 4, 1, 12, tzinfo=ZONE)
+
+
+def test_reset_across_dst():
+    """Test that the reset stays at the same local hour when the UTC offset changes"""
+    clock = ResetClock(ZONE)
+    clock.freeze(datetime.datetime(2024, 3, 10, 8, tzinfo=ZONE))
+    assert clock().utcoffset() == datetime.timedelta(hours=-5)
+    clock.advance(datetime.timedelta(hours=1))
+    reset = clock()
+    assert (reset.hour, reset.utcoffset()) == (9, datetime.timedelta(hours=-4))
+
+
+def test_unfrozen_clock():
+    """Test that an unfrozen clock follows the real time, and can't be advanced"""
+    clock = ResetClock(ZONE)
+    assert clock() <= datetime.datetime.now(ZONE) < clock() + datetime.timedelta(days=1)
+    with pytest.raises(RuntimeError):
+        clock.advance(datetime.timedelta(days=1))
@@ -0,0 +1,138 @@
+import asyncio
+import datetime
+import logging
+
+import asyncpg
+import pytest
+from asyncpg.connection import LoggedQuery
+from pytest_mock import MockerFixture
+
+from charbot import db, queries
+
+
+def logged(query: str, elapsed: float, exception: BaseException | None = None) -> LoggedQuery:
+    return LoggedQuery(query, (), None, elapsed, exception, ("localhost", 5432), None)  # pyright: ignore[reportArgumentType]
+
+
+def test_statement_stats():
+    """Test that runs are counted in the right histogram buckets, and percentiles are estimated from them"""
+    stats = db.StatementStats()
+    for elapsed in (0.0005, 0.003, 0.003, 0.004, 3.0):
+        stats.record(elapsed)
+    stats.record(0.02, failed=True)
+    assert stats.count == 6
+    assert stats.errors == 1
+    assert stats.max == 3.0
+    assert stats.mean == pytest.approx(3.0305 / 6)
+    assert stats.buckets[0] == 1
+    assert stats.buckets[db.BUCKETS.index(5)] == 3
+    assert stats.buckets[-1] == 1
+    assert stats.percentile(50) == 0.005
+    assert stats.percentile(100) == 3.0
+    assert db.StatementStats().percentile(95) == 0.0
+
+
+def test_query_stats(caplog: pytest.LogCaptureFixture):
+    """Test that statements are grouped by their normalized text, and slow ones are logged"""
+    stats = db.QueryStats(slow_threshold=0.1)
+    stats.record_query(logged("SELECT *\n    FROM users WHERE id = $1", 0.01))
+    stats.record_query(logged("SELECT * FROM users  WHERE id = $1", 0.03))
+    with caplog.at_level(logging.WARNING, logger="charbot.db.slow"):
+        stats.record_query(logged("UPDATE users SET points = $1", 0.2, asyncpg.PostgresError()))
+    assert list(stats.statements) == ["SELECT * FROM users WHERE id = $1", "UPDATE users SET points = $1"]
+    assert stats.top(1, "count")[0][0] == "SELECT * FROM users WHERE id = $1"
+    assert [statement for statement, _ in stats.top(1)] == ["UPDATE users SET points = $1"]
+    assert len(caplog.records) == 1
+    assert "200.0ms and raised PostgresError: UPDATE users SET points = $1" in caplog.text
+    report = stats.report()
+    assert "<acquire connection>" in report
+    assert "SELECT * FROM users WHERE id = $1" in report
+    stats.reset()
+    assert not stats.statements
+
+
+@pytest.mark.asyncio
+async def test_acquire_is_timed(mocker: MockerFixture):
+    """Test that waits for a connection are recorded, whether the acquire is awaited or entered"""
+    stats = db.QueryStats()
+    pool = mocker.MagicMock()
+    pool._acquire = mocker.AsyncMock(side_effect=["conn", "conn", TimeoutError])
+    pool.release = mocker.AsyncMock()
+    pool.get_size.return_value = 3
+    pool.get_idle_size.return_value = 1
+    assert await db._TimedAcquire(pool, None, stats) == "conn"
+    async with db._TimedAcquire(pool, 1, stats) as conn:
+        assert conn == "conn"
+    with pytest.raises(TimeoutError):
+        await db._TimedAcquire(pool, 1, stats)
+    assert stats.acquire.count == 3
+    assert stats.acquire.errors == 1
+    assert stats.waiting == 0
+    assert stats.peak_waiting == 1
+    assert stats.peak_in_use == 2
+
+
+@pytest.mark.asyncio
+async def test_instrumented_pool(cluster):
+    """Test that queries run through the pool are recorded, and that it can be warmed up"""
+    stats = db.QueryStats()
+    async with db.create_pool(
+        stats, **cluster.get_connection_spec(), database="postgres", min_size=1, max_size=4
+    ) as pool:
+        assert await pool.fetchval("SELECT $1::INT", 1) == 1
+        async with pool.acquire() as conn:
+            await conn.fetchval("SELECT $1::INT", 2)
+            assert pool.metrics() == db.PoolMetrics(1, 0, 1, 0, 1, 4)
+        assert await pool.warmup(3) == 3
+        assert await pool.warmup(10) == 4
+        assert "Pool: 4 open of 1-4, 0 in use (peak 1), 0 waiting (peak 1)" in stats.report(pool=pool)
+    assert stats.statements["SELECT $1::INT"].count == 2
+    assert stats.acquire.count == 2
+
+
+@pytest.mark.asyncio
+async def test_budgets_queue_background_jobs(mocker: MockerFixture):
+    """Test that jobs are held to their own cap and to the capacity left after the reserved connections"""
+    pool = mocker.MagicMock()
+    pool.get_max_size.return_value = 4
+    pool.acquire.return_value.__aenter__.return_value = conn = mocker.MagicMock()
+    conn.fetchval = mocker.AsyncMock(return_value=1)
+    budgets = db.ConnectionBudgets(pool, reserved=2, caps={"xcom": 5})
+    assert budgets.capacity == 2
+    assert budgets["xcom"].cap == 2
+    assert budgets["leveling"].cap == 1
+    assert budgets["leveling"] is budgets["leveling"]
+
+    release = asyncio.Event()
+
+    async def hold(job: str):
+        async with budgets[job].acquire():
+            await release.wait()
+
+    async with asyncio.TaskGroup() as group:
+        for job in ("leveling", "leveling", "xcom", "xcom"):
+            group.create_task(hold(job))
+        await asyncio.sleep(0)
+        assert (budgets["leveling"].active, budgets["leveling"].waiting) == (1, 1)
+        assert (budgets["xcom"].active, budgets["xcom"].waiting) == (1, 1)
+        assert "Background capacity: 2/2" in budgets.report()
+        release.set()
+    assert budgets["xcom"].active == 0
+    assert await budgets["giveaways"].fetchval("SELECT 1") == 1
+    assert db.ConnectionBudgets(pool, reserved=10).capacity == 1
+
+
+@pytest.mark.asyncio
+async def test_prepared_statements(cluster, database: asyncpg.Pool):
+    """Test that declared statements run prepared, and are still recorded"""
+    stats = db.QueryStats()
+    async with db.create_pool(
+        stats, statements=queries.statements(), **cluster.get_connection_spec(), database="postgres", max_size=1
+    ) as pool:
+        async with pool.acquire() as conn:
+            assert set(conn.prepared) == set(queries.statements())  # pyright: ignore[reportAttributeAccessIssue]
+        await queries.give_game_points(pool, 1, 5, 0, datetime.datetime.now(datetime.UTC))
+        assert await queries.user_points(pool, 1) == 55
+        assert await pool.fetchval("SELECT 1") == 1
+    assert stats.statements[db.normalize(queries.USER_POINTS.sql)].count == 1
+    assert stats.statements["SELECT 1"].count == 1
@@ -1,4 +1,5 @@
 import logging
+import os
 from io import BytesIO
 from pathlib import Path
 
@@ -48,7 +49,7 @@ def test_config(monkeypatch, caplog):
     obj = Test()
     caplog.clear()
     with pytest.raises(TypeError):
-        Config.get("calendar", obj)
+        Config.get("calendar", obj)  # pyright: ignore[reportArgumentType]
     log = caplog.record_tuples[0]
     assert log[0] == "charbot.config"
     assert log[1] == logging.ERROR
@@ -57,3 +58,40 @@ def test_config(monkeypatch, caplog):
         f"{type(obj)} was passed."
     )
     Config.clear_cache()  # Ensure the cache is cleared after running the tests
+
+
+def test_config_reload(monkeypatch, tmp_path, caplog: pytest.LogCaptureFixture):
+    """Test that the config is read only, and reloaded when the file changes"""
+    file = tmp_path / "config.toml"
+    file.write_text("[postgres]\nhost='a'\n[logging]\nversion=1\nhandlers={console={class='logging.StreamHandler'}}\n")
+    monkeypatch.setattr(Config, "_file", file)
+    monkeypatch.setattr(Config, "POLL_INTERVAL", 0)
+    Config.clear_cache()
+    assert Config.postgres["host"] == "a"
+    assert Config.leveling.get("max_tracked_awards", 5) == 5
+    with pytest.raises(TypeError):
+        Config["postgres"]["host"] = "b"
+    logging_config = Config.logging
+    assert isinstance(logging_config["handlers"]["console"], dict)
+    logging_config["handlers"]["console"].pop("class")
+    assert Config.logging["handlers"]["console"] == {"class": "logging.StreamHandler"}
+    snapshot = Config.snapshot()
+    assert Config.snapshot() is snapshot
+    file.write_text("[postgres]\nhost='b'\n[leveling]\nmax_tracked_awards=10\n")
+    os.utime(file, ns=(0, 0))
+    assert Config.postgres["host"] == "b"
+    assert Config.leveling == {"max_tracked_awards": 10}
+    # A broken file keeps the previous config, and is only read and logged again once it changes
+    file.write_text("[postgres\n")
+    os.utime(file, ns=(1, 1))
+    with caplog.at_level(logging.WARNING, logger="charbot.config"):
+        assert Config.postgres["host"] == "b"
+        assert Config.postgres["host"] == "b"
+        file.unlink()
+        assert Config.postgres["host"] == "b"
+    assert [record.getMessage() for record in caplog.records if record.levelno == logging.WARNING] == [
+        "Failed to reload the config file, keeping the previous config."
+    ] * 2
+    file.write_text("[postgres]\nhost='c'\n")
+    assert Config.postgres["host"] == "c"
+    Config.clear_cache()
@@ -1,4 +1,6 @@
 # import datetime
+import asyncio
+import sys
 from typing import Literal
 
 import discord
@@ -111,3 +113,11 @@ async def test_minesweeper_command(
     assert kwargs["embed"].image.url == "attachment://minesweeper.png", "Expected an attachment reference to be sent."
     assert "view" in kwargs, "Expected a view to be sent."
     assert "file" in kwargs, "Expected a file to be sent."
+
+
+async def test_games_imported_lazily():
+    """Test that loading the games cog doesn't import the games that are only needed by their commands"""
+    code = "import sys, charbot.games.cog; print(sorted({'niquests', 'charbot.games.sudoku'} & sys.modules.keys()))"
+    process = await asyncio.create_subprocess_exec(sys.executable, "-c", code, stdout=asyncio.subprocess.PIPE)
+    stdout, _ = await process.communicate()
+    assert stdout.decode().strip() == "[]"
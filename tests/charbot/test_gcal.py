@@ -111,8 +111,8 @@ async def test_cog_init_load_unload(mocker: MockerFixture, mock_config):
     assert start_spy.call_count == 1
     await cog.cog_unload()
     assert cancel_spy.call_count == 1
-    assert bot.holder.get("message") is discord.utils.MISSING
-    assert bot.holder.get("webhook") is fake_webhook
+    assert bot.holder.get("calendar_message") is discord.utils.MISSING
+    assert bot.holder.get("calendar_webhook") is fake_webhook
 
 
 @pytest.mark.asyncio
@@ -186,7 +186,7 @@ async def test_calendar_task(mocker: MockerFixture, mock_config, monkeypatch):
     }
     bot = mocker.AsyncMock(spec=CBot, loop=asyncio.get_running_loop())
     bot.holder = Holder()
-    bot.holder["webhook"] = mocker.AsyncMock(spec=discord.Webhook)
+    bot.holder["calendar_webhook"] = mocker.AsyncMock(spec=discord.Webhook)
     bot.user = mocker.AsyncMock(spec=discord.ClientUser)
     fake_message = mocker.AsyncMock(spec=discord.WebhookMessage)
     fake_webhook = mocker.AsyncMock(spec=discord.Webhook, fetch_message=mocker.AsyncMock(return_value=fake_message))
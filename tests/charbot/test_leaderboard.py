@@ -0,0 +1,39 @@
+import pytest
+from pytest_mock import MockerFixture
+
+from charbot.leaderboard import PAGE_SIZE, LeaderboardView, RankCache
+
+
+def test_rank_cache():
+    """Test that ranks are competition ranks, and follow XP updates"""
+    ranks = RankCache()
+    ranks.load([(1, 30), (2, 50), (3, 30), (4, 10)])
+    assert [ranks.rank(ranks.get(user) or 0) for user in (1, 2, 3, 4)] == [2, 1, 2, 4]
+    assert ranks.rank(0) == 5
+    ranks.update(4, 51)
+    ranks.update(5, 30)
+    assert ranks.get(4) == 51
+    assert [ranks.rank(xp) for xp in (51, 50, 30, 10)] == [1, 2, 3, 6]
+    assert len(ranks) == 5
+
+
+@pytest.mark.asyncio
+async def test_leaderboard_pages(mocker: MockerFixture):
+    """Test that pages continue after the last member of the previous page"""
+    rows = [{"xp": 50 - index, "id": index} for index in range(PAGE_SIZE + 5)]
+    pool = mocker.MagicMock()
+    pool.fetch = mocker.AsyncMock(side_effect=[rows[: PAGE_SIZE + 1], rows[PAGE_SIZE:], rows[: PAGE_SIZE + 1]])
+    ranks = RankCache()
+    ranks.load((row["id"], row["xp"]) for row in rows)
+    view = LeaderboardView(pool, ranks, 1, 10)
+    await view.load()
+    assert view.previous_button.disabled
+    assert view.next_cursor == (50 - PAGE_SIZE + 1, PAGE_SIZE - 1)
+    interaction = mocker.AsyncMock()
+    await view.next_page(interaction)
+    assert pool.fetch.await_args_list[1].args[1:] == (50 - PAGE_SIZE + 1, PAGE_SIZE - 1, PAGE_SIZE + 1)
+    assert view.next_button.disabled
+    assert not view.previous_button.disabled
+    await view.previous_page(interaction)
+    assert pool.fetch.await_args_list[2].args[1:] == (PAGE_SIZE + 1,)
+    assert view.cursors == [None]
@@ -0,0 +1,369 @@
+import asyncio
+import datetime
+
+import asyncpg
+import discord
+import pytest
+from pytest_mock import MockerFixture
+
+from charbot import CBot, constants, levels
+from charbot.bot import Holder
+from charbot.bus import RESYNC, Invalidation
+
+
+@pytest.fixture
+def cog(mocker: MockerFixture):
+    """Create a leveling cog with a mocked bot"""
+    bot = mocker.AsyncMock(spec=CBot)
+    bot.holder = Holder()
+    bot.pool = mocker.MagicMock()
+    # Background jobs query the pool directly, whichever pool the test sets
+    bot.background = mocker.Mock(side_effect=lambda job: bot.pool)
+    return levels.Leveling(bot)
+
+
+def test_no_xp_from_record():
+    """Test that a no_xp row is converted to frozensets"""
+    no_xp = levels.NoXP.from_record({"guild": 1, "channels": [1, 2, 2], "roles": [3]})
+    assert no_xp.channels == frozenset({1, 2})
+    assert no_xp.roles == frozenset({3})
+
+
+def test_set_no_xp(cog: levels.Leveling):
+    """Test that the cached no_xp configuration is replaced, and ignored if there is no row"""
+    cog.set_no_xp({"guild": 1, "channels": [1], "roles": []})
+    assert cog.no_xp[1] == levels.NoXP(frozenset({1}), frozenset())
+    cog.set_no_xp(None)
+    assert cog.no_xp[1] == levels.NoXP(frozenset({1}), frozenset())
+
+
+@pytest.mark.asyncio
+async def test_reload_ranks(cog: levels.Leveling, mocker: MockerFixture):
+    """Test that the rank cache is replaced with the XP in the database"""
+    cog.ranks.load([(1, 10)])
+    cog.bot.pool.fetch = mocker.AsyncMock(return_value=[{"id": 2, "xp": 30}, {"id": 3, "xp": 20}])
+    await cog.reload_ranks()
+    assert cog.ranks.get(1) is None
+    assert cog.ranks.get(2) == 30
+    assert cog.ranks.rank(20) == 2
+
+
+@pytest.mark.asyncio
+async def test_invalidate_no_xp(cog: levels.Leveling, mocker: MockerFixture):
+    """Test that the cached no_xp configuration follows changes made outside the cog"""
+    cog.bot.pool.fetchrow = mocker.AsyncMock(side_effect=[{"guild": 1, "channels": [2], "roles": []}, None])
+    cog.bot.pool.fetch = mocker.AsyncMock(return_value=[{"guild": 3, "channels": [], "roles": [4]}])
+    await cog.invalidate_no_xp(Invalidation("no_xp", "UPDATE", 1))
+    assert cog.no_xp[1] == levels.NoXP(frozenset({2}), frozenset())
+    await cog.invalidate_no_xp(Invalidation("no_xp", "DELETE", 1))
+    assert 1 not in cog.no_xp
+    await cog.invalidate_no_xp(Invalidation("no_xp", RESYNC, None))
+    assert cog.no_xp == {3: levels.NoXP(frozenset(), frozenset({4}))}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("channel_id", [10, 20])
+async def test_proc_xp_no_xp_channel_skips_database(cog: levels.Leveling, mocker: MockerFixture, channel_id: int):
+    """Test that messages in no XP channels, or threads of them, never touch the database"""
+    cog.no_xp[1] = levels.NoXP(frozenset({10}), frozenset())
+    cog.bot.pool = pool = mocker.MagicMock()
+    message = mocker.AsyncMock(spec=discord.Message)
+    message.author.bot = False
+    message.is_system = mocker.Mock(return_value=False)
+    message.guild.id = 1
+    if channel_id == 10:
+        message.channel = mocker.AsyncMock(spec=discord.TextChannel, id=10)
+    else:
+        message.channel = mocker.AsyncMock(spec=discord.Thread, id=channel_id, parent_id=10)
+    await cog.proc_xp(message)
+    pool.acquire.assert_not_called()
+
+
+def test_track_message_finds_active_users(cog: levels.Leveling, mocker: MockerFixture):
+    """Test that only users that sent a message in the last half interval are active"""
+    now = datetime.datetime.now(datetime.UTC)
+    messages = [(now - datetime.timedelta(seconds=400), 1), (now - datetime.timedelta(seconds=100), 2), (now, 3)]
+    results = []
+    for created_at, author_id in messages:
+        message = mocker.Mock(spec=discord.Message, created_at=created_at)
+        message.channel.id = 10
+        message.author.id = author_id
+        results.append(cog._track_message(message))
+    assert results[0] == ([], 1)
+    active, num_unique = results[2]
+    assert sorted(active) == [2, 3]
+    assert num_unique == 3
+
+
+@pytest.mark.asyncio
+async def test_apply_level_ups_queues_roles(cog: levels.Leveling, mocker: MockerFixture):
+    """Test that level ups queue their roles, and send one congratulations message"""
+    first = mocker.Mock(spec=discord.Member, id=1, mention="<@1>")
+    second = mocker.Mock(spec=discord.Member, id=2, mention="<@2>")
+    channel = mocker.AsyncMock(spec=discord.TextChannel)
+    cog.level_ups.put_nowait((channel, [levels.LevelUp(first, 1), levels.LevelUp(second, 2)]))
+    await cog.apply_level_ups.coro(cog)
+    assert cog.role_sync.pending == {1: (first, 1, "Level 1 reached"), 2: (second, 2, "Level 2 reached")}
+    channel.send.assert_awaited_once_with(
+        "Congratulations <@1>, you have reached level **1**!\nCongratulations <@2>, you have reached level **2**!"
+    )
+
+
+def make_member(mocker: MockerFixture, *role_ids: int):
+    member = mocker.AsyncMock(spec=discord.Member, id=1)
+    member.roles = [mocker.Mock(spec=discord.Role, id=role_id) for role_id in role_ids]
+    member.guild.get_member = mocker.Mock(return_value=None)
+    return member
+
+
+@pytest.mark.asyncio
+async def test_role_sync_coalesces_updates(mocker: MockerFixture):
+    """Test that queued updates for a member are merged, and applied with a single edit"""
+    sync = levels.RoleSync()
+    member = make_member(mocker, 5, constants.LEVEL_1_ID)
+    sync.update(member, 2, "Level 2 reached")
+    sync.update(member, 3, "Level 3 reached")
+    assert len(sync) == 1
+    assert await sync.apply_next()
+    roles = member.edit.await_args.kwargs["roles"]
+    assert [role.id for role in roles] == [5, constants.LEVEL_3_ID]
+    member.edit.assert_awaited_once_with(roles=roles, reason="Level 3 reached")
+    assert not sync._ready.is_set()
+
+
+@pytest.mark.asyncio
+async def test_role_sync_skips_unchanged(mocker: MockerFixture):
+    """Test that members that already have the right level role aren't edited"""
+    member = make_member(mocker, constants.LEVEL_2_ID)
+    assert not await levels.RoleSync().apply(member, 2, "Level 2 reached")
+    member.edit.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_role_sync_retries(mocker: MockerFixture):
+    """Test that rate limits and server errors are retried, and other errors aren't"""
+    sync = levels.RoleSync(max_attempts=3, backoff=0)
+    member = make_member(mocker)
+    member.edit.side_effect = [
+        discord.HTTPException(mocker.Mock(status=429), "rate limited"),
+        discord.HTTPException(mocker.Mock(status=503), "unavailable"),
+        None,
+    ]
+    assert await sync.apply(member, 1, "Level 1 reached")
+    assert member.edit.await_count == 3
+    member.edit.reset_mock()
+    member.edit.side_effect = discord.Forbidden(mocker.Mock(status=403), "forbidden")
+    assert not await sync.apply(member, 1, "Level 1 reached")
+    assert member.edit.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_global_lock_waits_for_channel_locks(cog: levels.Leveling):
+    """Test that channels use separate locks, and the global lock waits for all of them"""
+    assert cog.channel_lock(1) is not cog.channel_lock(2)
+    assert cog.channel_lock(1) is cog.channel_lock(1 + levels.LOCK_STRIPES)
+    async with cog.channel_lock(1):
+        task = asyncio.create_task(cog.global_lock().__aenter__())
+        await asyncio.sleep(0)
+        assert not task.done()
+        assert not cog.channel_lock(2).locked()
+    await task
+    assert all(lock.locked() for lock in cog.locks)
+
+
+@pytest.mark.asyncio
+async def test_proc_xp_batches_queries(cog: levels.Leveling, mocker: MockerFixture):
+    """Test that a window is read and written with one query each, and level ups are queued"""
+    cog.no_xp[1] = levels.NoXP(frozenset(), frozenset())
+    conn = mocker.MagicMock()
+    conn.fetch = mocker.AsyncMock(
+        side_effect=[
+            [{"id": 1, "xp": 9}, {"id": 2, "xp": 0}],
+            [{"id": 1, "xp": 10}, {"id": 2, "xp": 1}],
+        ]
+    )
+    cog.bot.pool = pool = mocker.MagicMock()
+    pool.acquire.return_value.__aenter__.return_value = conn
+    members = {user: mocker.Mock(spec=discord.Member, id=user, roles=[]) for user in (1, 2)}
+    channel = mocker.AsyncMock(spec=discord.TextChannel, id=10)
+    now = datetime.datetime.now(datetime.UTC)
+    for author_id in (1, 2):
+        message = mocker.AsyncMock(spec=discord.Message, channel=channel, created_at=now)
+        message.author.bot = False
+        message.author.id = author_id
+        message.is_system = mocker.Mock(return_value=False)
+        message.guild.id = 1
+        message.guild.get_member = members.get
+        await cog.proc_xp(message)
+    assert conn.fetch.await_count == 2
+    users, xp_to_add, *_ = conn.fetch.await_args_list[-1].args[1:]
+    assert users == [1, 2]
+    assert xp_to_add == [1, 1]
+    assert cog.level_ups.get_nowait() == (channel, [levels.LevelUp(members[1], 1)])
+    assert cog.last_messages.pending == {1: now, 2: now}
+    assert cog.ranks.get(1) == 10
+    assert (10, 1) in cog.awards
+
+
+@pytest.mark.asyncio
+async def test_proc_xp_failed_write_keeps_caches(cog: levels.Leveling, mocker: MockerFixture):
+    """Test that a failed XP write neither starts cooldowns nor changes the rank cache"""
+    cog.no_xp[1] = levels.NoXP(frozenset(), frozenset())
+    cog.ranks.load([(1, 9), (2, 0)])
+    conn = mocker.MagicMock()
+    conn.fetch = mocker.AsyncMock(side_effect=[[{"id": 1, "xp": 9}, {"id": 2, "xp": 0}], ConnectionResetError])
+    cog.bot.pool = pool = mocker.MagicMock()
+    pool.acquire.return_value.__aenter__.return_value = conn
+    members = {user: mocker.Mock(spec=discord.Member, id=user, roles=[]) for user in (1, 2)}
+    channel = mocker.AsyncMock(spec=discord.TextChannel, id=10)
+    now = datetime.datetime.now(datetime.UTC)
+    cog.buckets.set(10, levels.ActivityWindow.from_messages([(now, 2)]), now.timestamp())
+    message = mocker.AsyncMock(spec=discord.Message, channel=channel, created_at=now)
+    message.author.bot = False
+    message.author.id = 1
+    message.is_system = mocker.Mock(return_value=False)
+    message.guild.id = 1
+    message.guild.get_member = members.get
+    with pytest.raises(ConnectionResetError):
+        await cog.proc_xp(message)
+    assert not cog.awards
+    assert cog.ranks.get(1) == 9
+
+
+def test_last_message_buffer_keeps_latest():
+    """Test that the buffer keeps the latest message time of each user"""
+    buffer = levels.LastMessageBuffer()
+    now = datetime.datetime.now(datetime.UTC)
+    buffer.add(1, now)
+    buffer.add(1, now - datetime.timedelta(seconds=5))
+    buffer.add(2, now - datetime.timedelta(seconds=5))
+    assert buffer.pending == {1: now, 2: now - datetime.timedelta(seconds=5)}
+
+
+@pytest.mark.asyncio
+async def test_last_message_buffer_flush(mocker: MockerFixture):
+    """Test that the buffer is copied in bulk, and kept if the write fails"""
+    buffer = levels.LastMessageBuffer()
+    now = datetime.datetime.now(datetime.UTC)
+    buffer.add(1, now)
+    pool = mocker.MagicMock()
+    pool.acquire.return_value.__aenter__.return_value = conn = mocker.MagicMock()
+    conn.execute = mocker.AsyncMock()
+    conn.copy_records_to_table = mocker.AsyncMock(side_effect=ConnectionResetError)
+    with pytest.raises(ConnectionResetError):
+        await buffer.flush(pool)
+    assert buffer.pending == {1: now}
+    conn.copy_records_to_table.side_effect = None
+    assert await buffer.flush(pool) == 1
+    assert list(conn.copy_records_to_table.await_args_list[-1].kwargs["records"]) == [(1, now)]
+    assert not buffer.pending
+    assert await buffer.flush(pool) == 0
+
+
+def test_award_xp_cooldown_and_bonus(cog: levels.Leveling, mocker: MockerFixture):
+    """Test that members gain XP once per cooldown per channel, with a bonus for gaining XP recently"""
+    member = mocker.Mock(spec=discord.Member, id=1)
+    start = datetime.datetime.now(datetime.UTC)
+
+    def award(seconds: int, channel_id: int = 10) -> list[tuple[discord.Member, int]]:
+        message = mocker.Mock(spec=discord.Message, created_at=start + datetime.timedelta(seconds=seconds))
+        message.channel.id = channel_id
+        awards = cog._award_xp(message, [member], {1: 0}, 3)
+        cog._start_cooldowns(message, [awarded.id for awarded, _ in awards])
+        return awards
+
+    assert award(0) == [(member, 1)]
+    assert award(600) == []
+    assert award(0, 20) == [(member, 1)]
+    assert award(601) == [(member, 3)]
+    assert award(1600) == [(member, 1)]
+    assert cog.awards.expirations == 2
+
+
+@pytest.mark.asyncio
+async def test_drain_updates_roles_after_decay(cog: levels.Leveling, mocker: MockerFixture):
+    """Test that members that dropped a level are queued, and members that left aren't fetched again"""
+    cog.bot.pool = pool = mocker.MagicMock()
+    pool.fetchrow = mocker.AsyncMock(return_value={"decayed": [1, 2, 3, 4, 5], "ids": [1, 2], "levels": [3, 2]})
+    member = mocker.Mock(spec=discord.Member, id=1)
+    guild = mocker.Mock(spec=discord.Guild)
+    guild.get_member = mocker.Mock(side_effect={1: member}.get)
+    guild.fetch_member = mocker.AsyncMock(side_effect=discord.NotFound(mocker.Mock(status=404), "unknown member"))
+    cog.bot.get_guild = mocker.Mock(return_value=guild)
+    await cog.drain.coro(cog)
+    assert cog.role_sync.pending == {1: (member, 3, "Dropped to Level 3")}
+    assert 2 in cog.departed
+    await cog.drain.coro(cog)
+    guild.fetch_member.assert_awaited_once_with(2)
+    assert not any(lock.locked() for lock in cog.locks)
+
+
+@pytest.mark.asyncio
+async def test_drain_sql(cog: levels.Leveling, database: asyncpg.Pool, mocker: MockerFixture):
+    """Test that the decay only returns the members that dropped a level"""
+    cog.bot.pool = database
+    guild = mocker.Mock(spec=discord.Guild)
+    guild.get_member = lambda user: mocker.Mock(spec=discord.Member, id=user)
+    cog.bot.get_guild = mocker.Mock(return_value=guild)
+    old = datetime.datetime.now(datetime.UTC) - datetime.timedelta(days=4)
+    await database.executemany(
+        "INSERT INTO levels (id, xp, last_message) VALUES ($1, $2, $3)",
+        [(1, 30, old), (2, 35, old), (3, 30, datetime.datetime.now(datetime.UTC)), (4, 20, old)],
+    )
+    try:
+        await cog.drain.coro(cog)
+        rows = await database.fetch("SELECT id, xp FROM levels")
+        assert {row["id"]: row["xp"] for row in rows} == {1: 29, 2: 34, 3: 30, 4: 20}
+        assert [(member.id, level) for member, level, _ in cog.role_sync.pending.values()] == [(1, 2)]
+    finally:
+        await database.execute("DELETE FROM levels")
+
+
+def test_role_drift(mocker: MockerFixture):
+    """Test that only members whose level roles don't match their XP are reported"""
+
+    def member(member_id: int, *role_ids: int):
+        roles = [mocker.Mock(spec=discord.Role, id=role_id) for role_id in role_ids]
+        return mocker.Mock(spec=discord.Member, id=member_id, roles=roles)
+
+    correct = member(1, 5, constants.LEVEL_2_ID)
+    missing = member(2, 5)
+    wrong = member(3, constants.LEVEL_1_ID)
+    extra = member(4, constants.LEVEL_3_ID, constants.LEVEL_4_ID)
+    no_xp = member(5, constants.LEVEL_1_ID)
+    drift = levels.RoleDrift.find([correct, missing, wrong, extra, no_xp], {1: 25, 2: 51, 3: 30, 4: 45, 6: 30})
+    assert drift.missing == 2
+    assert drift.extra == 3
+    assert drift.members == [
+        levels.LevelUp(missing, 5),
+        levels.LevelUp(wrong, 3),
+        levels.LevelUp(extra, 4),
+        levels.LevelUp(no_xp, 0),
+    ]
+
+
+def test_state_survives_restart(cog: levels.Leveling, tmp_path):
+    """Test that the activity windows, cooldowns and departed members are saved and restored"""
+    sent = datetime.datetime(2024, 1, 1, tzinfo=datetime.UTC)
+    window = levels.ActivityWindow()
+    window.add(sent, 1)
+    window.add(sent + datetime.timedelta(seconds=5), 2)
+    cog.buckets.set(10, window, sent.timestamp())
+    cog.awards.set((10, 1), sent.timestamp(), sent.timestamp())
+    cog.departed.set(3, True, sent.timestamp())
+    cog.last_messages.add(1, sent)
+    cog.bot.holder.put(levels._WINDOWS, cog.buckets)
+    cog.bot.holder.put(levels._AWARDS, cog.awards)
+    cog.bot.holder.put(levels._DEPARTED, cog.departed)
+    cog.bot.holder.put(levels._LAST_MESSAGES, cog.last_messages)
+    cog.bot.holder.put(levels._ROLE_SYNC, cog.role_sync)
+    assert cog.bot.holder.save(tmp_path / "state.json") == 4
+    cog.bot.holder = Holder()
+    assert cog.bot.holder.restore(tmp_path / "state.json") == 4
+    restored = levels.Leveling(cog.bot)
+    bucket = restored.buckets.peek(10)
+    assert bucket is not None
+    assert bucket.messages() == window.messages()
+    assert restored.awards.get((10, 1), sent.timestamp()) == sent.timestamp()
+    assert restored.departed.get(3, sent.timestamp())
+    assert restored.last_messages.pending == {1: sent}
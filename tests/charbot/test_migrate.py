@@ -0,0 +1,72 @@
+import datetime
+import pathlib
+
+import asyncpg
+import pytest
+
+from charbot import migrate, queries
+
+
+def test_discover(tmp_path: pathlib.Path):
+    """Test that migrations are ordered by their version, and misnamed or duplicate ones are rejected"""
+    assert [migration.version for migration in migrate.discover()][:2] == [1, 2]
+    (tmp_path / "0010_later.sql").write_text("SELECT 1;")
+    (tmp_path / "0002_earlier.sql").write_text("SELECT 1;")
+    assert [(migration.version, migration.name) for migration in migrate.discover(tmp_path)] == [
+        (2, "earlier"),
+        (10, "later"),
+    ]
+    (tmp_path / "2_again.sql").write_text("SELECT 1;")
+    with pytest.raises(ValueError, match="have the same version"):
+        migrate.discover(tmp_path)
+    (tmp_path / "2_again.sql").unlink()
+    (tmp_path / "indexes.sql").write_text("SELECT 1;")
+    with pytest.raises(ValueError, match="isn't named like"):
+        migrate.discover(tmp_path)
+
+
+@pytest.mark.asyncio
+async def test_migrate(database: asyncpg.Pool, tmp_path: pathlib.Path):
+    """Test that every migration is applied once, and a failing one is rolled back"""
+    async with database.acquire() as conn:
+        assert await migrate.migrate(conn) == []
+        assert set(await migrate.applied(conn)) >= {1, 2}
+        (tmp_path / "9001_broken.sql").write_text("CREATE TABLE broken (id INT); SELECT * FROM missing;")
+        with pytest.raises(asyncpg.UndefinedTableError):
+            await migrate.migrate(conn, tmp_path)
+        assert 9001 not in await migrate.applied(conn)
+        assert await conn.fetchval("SELECT to_regclass('broken')") is None
+
+
+async def plan(conn, query: str, *args) -> str:
+    """Get the plan of a query with sequential scans discouraged, so the tiny test tables still use the indexes"""
+    async with conn.transaction():
+        await conn.execute("SET LOCAL enable_seqscan = off")
+        return "\n".join(row[0] for row in await conn.fetch(f"EXPLAIN {query}", *args))
+
+
+@pytest.mark.asyncio
+async def test_drain_uses_index(database: asyncpg.Pool):
+    """Test that the drain finds inactive members through the last message index"""
+    async with database.acquire() as conn:
+        assert "levels_last_message_idx" in await plan(conn, queries.DECAY_XP.sql, 40, 20)
+
+
+@pytest.mark.asyncio
+async def test_due_giveaways_use_index(database: asyncpg.Pool):
+    """Test that due giveaways are found through the partial index of incomplete ones"""
+    async with database.acquire() as conn:
+        now = datetime.datetime.now(datetime.UTC)
+        assert "giveaway_due_idx" in await plan(conn, queries.DUE_GIVEAWAYS.sql, now)
+
+
+@pytest.mark.asyncio
+async def test_unassigned_requests_use_index(database: asyncpg.Pool):
+    """Test that unassigned character requests are found through their partial indexes"""
+    async with database.acquire() as conn:
+        assert "xcom_character_request_unassigned_idx" in await plan(
+            conn, "SELECT requestor FROM xcom_character_request WHERE fulfiller IS NULL ORDER BY req_dt"
+        )
+        assert "xcom_character_request_thread_idx" in await plan(
+            conn, "SELECT requestor FROM xcom_character_request WHERE fulfill_thread = $1", 1
+        )
@@ -0,0 +1,74 @@
+import datetime
+
+import asyncpg
+import pytest
+from pytest_mock import MockerFixture
+
+from charbot.points import PointsLedger, cap_award
+
+
+RESET = datetime.datetime(2024, 1, 1, 9, tzinfo=datetime.UTC)
+
+
+def test_cap_award():
+    """Test that awards are capped to the daily limit, scaling the bonus with them"""
+    assert cap_award(0, 5, 10) == (5, 10)
+    assert cap_award(9, 2, 2) == (1, 1)
+    assert cap_award(8, 3, 1) == (2, 1)
+    assert cap_award(10, 2, 2) == (0, 0)
+
+
+@pytest.mark.asyncio
+async def test_award_uses_cached_participation(mocker: MockerFixture):
+    """Test that participation is loaded once per user per day, and awards are capped from it"""
+    pool = mocker.MagicMock()
+    pool.fetchrow = mocker.AsyncMock(side_effect=[{"last_particip_dt": RESET, "particip": 6}, None, None])
+    ledger = PointsLedger(pool)
+    assert await ledger.award(1, 3, 1, RESET) == 4
+    assert await ledger.award(1, 3, 3, RESET) == 2
+    assert await ledger.award(1, 3, 3, RESET) == 0
+    assert await ledger.award(2, 5, 0, RESET) == 5
+    assert pool.fetchrow.await_count == 2
+    assert len(ledger) == 3
+    # The next day, everyone starts from 0 again
+    assert await ledger.award(1, 5, 5, RESET + datetime.timedelta(days=1)) == 10
+    assert pool.fetchrow.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_flush_failure_keeps_awards(mocker: MockerFixture):
+    """Test that awards are kept for the next flush if writing them fails"""
+    conn = mocker.MagicMock()
+    conn.copy_records_to_table = mocker.AsyncMock(side_effect=ConnectionResetError)
+    pool = mocker.MagicMock()
+    pool.acquire.return_value.__aenter__.return_value = conn
+    pool.fetchrow = mocker.AsyncMock(return_value=None)
+    ledger = PointsLedger(pool)
+    await ledger.award(1, 2, 0, RESET)
+    with pytest.raises(ConnectionResetError):
+        await ledger.flush()
+    assert len(ledger) == 1
+    assert await PointsLedger(pool).flush() == 0
+
+
+@pytest.mark.asyncio
+async def test_flush_sql(database: asyncpg.Pool):
+    """Test that flushed awards are in the ledger, and summed into users the same way give_game_points would"""
+    await database.execute(
+        "INSERT INTO users (id, points, last_claim, last_particip_dt, particip, won) VALUES (10, 5, $1, $1, 9, 9)",
+        RESET - datetime.timedelta(days=1),
+    )
+    ledger = PointsLedger(database)
+    assert await ledger.award(10, 3, 1, RESET) == 4
+    assert await ledger.award(11, 3, 1, RESET) == 4
+    assert await ledger.award(10, 3, 3, RESET) == 6
+    assert await ledger.flush() == 3
+    users = {row["id"]: row for row in await database.fetch("SELECT * FROM users WHERE id IN (10, 11)")}
+    assert (users[10]["points"], users[10]["particip"], users[10]["won"]) == (15, 6, 4)
+    assert (users[11]["points"], users[11]["particip"], users[11]["won"]) == (4, 3, 1)
+    assert users[11]["last_particip_dt"] == RESET
+    assert await database.fetchval("SELECT count(*) FROM points_ledger") == 3
+    await ledger.award(10, 5, 0, RESET)
+    await ledger.flush()
+    assert await database.fetchval("SELECT particip FROM users WHERE id = 10") == 10
+    await database.execute("DELETE FROM points_ledger")
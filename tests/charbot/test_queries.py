@@ -0,0 +1,34 @@
+import datetime
+
+import pytest
+from pytest_mock import MockerFixture
+
+from charbot import queries
+
+
+def test_statements_are_unique():
+    """Test that a statement name can only be declared once"""
+    assert len(queries.statements()) == len(set(queries.statements()))
+    with pytest.raises(ValueError, match="already declared"):
+        queries.Statement("xp", "SELECT 1")
+
+
+@pytest.mark.asyncio
+async def test_rows_are_typed(mocker: MockerFixture):
+    """Test that rows are converted to their named tuples"""
+    pool = mocker.MagicMock()
+    pool.fetch = mocker.AsyncMock(return_value=[{"id": 1, "xp": 20}, {"id": 2, "xp": 5}])
+    pool.fetchrow = mocker.AsyncMock(
+        side_effect=[
+            {"decayed": [1], "ids": [], "levels": []},
+            None,
+            {"last_particip_dt": datetime.datetime.min, "particip": 3},
+        ]
+    )
+    rows = await queries.lock_xp(pool, [1, 2])
+    assert rows == [queries.XpRow(1, 20), queries.XpRow(2, 5)]
+    assert rows[0].xp == 20
+    pool.fetch.assert_awaited_once_with(queries.LOCK_XP.sql, [1, 2])
+    assert await queries.decay_xp(pool, 40, 20) == queries.Decay([1], [], [])
+    assert await queries.participation(pool, 1) is None
+    assert (await queries.participation(pool, 1)) == queries.Participation(datetime.datetime.min, 3)
@@ -139,3 +139,11 @@ async def test_modal_duplicate_guess(mocker: MockerFixture):
     await modal.on_submit(mock_interaction)
     mock_interaction.followup.send.assert_called_once_with("You already guessed a.", ephemeral=True)
     mock_interaction.response.defer.assert_called_once_with(ephemeral=True)
+
+
+async def test_words_read_once():
+    """Test that the word list is read once, and doesn't keep the line endings"""
+    words = shrugman.get_words()
+    assert words is shrugman.get_words()
+    assert words
+    assert not any(word.endswith("\n") for word in words)